@@ -0,0 +1,343 @@
+"""
+Times the hot paths of Hvergelmir on a synthetic Valgrind log and compares the
+result against a stored baseline.
+
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+try:
+    import resource
+except ImportError:
+    resource = None # Peak memory is not reported.
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "source"))
+
+from SyntheticLog import SyntheticLog
+
+from disk.FileReader import FileReader
+from errors.CompressedStackError import CompressedStackError
+from errors.SharedStackError import SharedStackError
+from errors.Stack import Stack
+from errors.Stack import stackFrames
+from operations.ErrorParser import ErrorParser
+from operations.ParallelTreeBuilder import ParallelTreeBuilder
+from operations.Profiler import countNodes
+
+
+## Path of the stored baseline, next to this file.
+baselinePath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+
+def createFakeWx(): # Module
+    """Returns a stand-in for the wx module with just enough of wx.TreeCtrl for
+    TreePanel to populate its tree and expand its nodes. Used instead of wx,
+    even when wx is installed, so that the benchmark measures Hvergelmir's tree
+    walk and not the GUI toolkit, and runs without a display.
+    """
+
+    class Panel(object):
+        def __init__(self, parent=None):
+            pass
+
+        def SetSizer(self, sizer):
+            pass
+
+    class TreeEvent(object):
+        def __init__(self, item):
+            self.item = item
+
+        def GetItem(self):
+            return self.item
+
+        def Skip(self):
+            pass
+
+    class TreeCtrl(object):
+        def __init__(self, parent):
+            self.data = {} # Item -> item data.
+            self.numItems = 0
+            self.handlers = {} # Event -> handler.
+            self.expandableItems = [] # Item list. Items that were given children, in that order.
+            self.expandable = set() # Item set.
+
+        def AddRoot(self, text):
+            return self.AppendItem(None, text)
+
+        def AppendItem(self, parent, text, image=-1, selectedImage=-1, data=None):
+            self.numItems += 1
+            self.data[self.numItems] = data
+            return self.numItems
+
+        def SetItemText(self, item, text):
+            pass
+
+        def SetItemPyData(self, item, data):
+            self.data[item] = data
+
+        def GetItemPyData(self, item):
+            return self.data[item]
+
+        def DeleteChildren(self, item):
+            pass
+
+        def SetItemHasChildren(self, item, hasChildren):
+            if hasChildren and item not in self.expandable:
+                self.expandable.add(item)
+                self.expandableItems.append(item)
+
+        def Expand(self, item):
+            """Like wx, tell the handler that the item is expanding first."""
+            handler = self.handlers.get(wx.EVT_TREE_ITEM_EXPANDING)
+            if handler is not None:
+                handler(TreeEvent(item))
+
+        def Bind(self, event, handler):
+            self.handlers[event] = handler
+
+    class BoxSizer(object):
+        def __init__(self, orientation):
+            pass
+
+        def Add(self, *args, **kwargs):
+            pass
+
+    wx = types.ModuleType("wx")
+    wx.Panel = Panel
+    wx.TreeCtrl = TreeCtrl
+    wx.TreeItemData = lambda data: data
+    wx.BoxSizer = BoxSizer
+    wx.VERTICAL = 0
+    wx.EXPAND = 0
+    wx.EVT_TREE_ITEM_ACTIVATED = "activated"
+    wx.EVT_TREE_ITEM_EXPANDING = "expanding"
+    return wx
+
+
+
+def getPeakMemory(): # Float
+    """Returns the peak resident memory of the process so far, in MiB, or None
+    if it can't be measured on this platform.
+    """
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / (1024.0 * 1024.0) # Bytes on macOS.
+    return peak / 1024.0 # Kilobytes on Linux.
+
+
+
+class Benchmark(object):
+    """Runs each phase a number of times and keeps the fastest time, along with
+    the amount of work done so that throughput can be computed.
+    """
+
+    def __init__(self, repeat):
+        self.repeat = repeat # Integer
+        self.results = [] # (name, seconds, work, unit, peak MiB) list.
+
+
+    def run(self, name, function, work, unit): # Value
+        """Time 'function' and return what its last call returned.
+        @param name - String - The name of the phase.
+        @param function - Callable taking no arguments.
+        @param work - Integer or callable - The amount of work done by one call, or a function of the returned value giving it.
+        @param unit - String - What 'work' counts, e.g. 'lines'.
+        """
+
+        best = None
+        for iteration in range(self.repeat):
+            result = None # Don't keep the previous result alive while timing.
+            gc.collect()
+            start = time.time()
+            result = function()
+            seconds = time.time() - start
+            if best is None or seconds < best:
+                best = seconds
+
+        if callable(work):
+            work = work(result)
+        self.results.append((name, best, work, unit, getPeakMemory()))
+        return result
+
+
+    def getTimes(self): # Dictionary
+        return dict([(name, seconds) for name, seconds, work, unit, peak in self.results])
+
+
+    def report(self, baseline, tolerance): # Boolean
+        """Print the results, compared to the baseline times if given.
+        @return True if no phase was slower than the baseline by more than
+                'tolerance', and the baseline has a time for every phase.
+        """
+
+        passed = True
+        print("%-14s %10s %18s %10s %10s" % ("Phase", "Seconds", "Throughput", "Peak MiB", "Baseline"))
+        for name, seconds, work, unit, peak in self.results:
+            throughput = "%.0f %s/s" % (work / max(seconds, 1e-9), unit)
+            peakText = "%.1f" % peak if peak is not None else "-"
+            comparison = ""
+            if baseline is not None and name in baseline:
+                ratio = seconds / max(baseline[name], 1e-9)
+                comparison = "%.2fx" % ratio
+                if ratio > 1.0 + tolerance:
+                    comparison += " SLOWER"
+                    passed = False
+            elif baseline is not None:
+                ## A phase added since the baseline was saved would otherwise never be checked.
+                comparison = "MISSING"
+                passed = False
+            print("%-14s %10.3f %18s %10s %10s" % (name, seconds, throughput, peakText, comparison))
+        return passed
+
+
+
+def walkTrees(processTrees): # Integer
+    """Expand every node of a TreePanel, on top of the fake wx, as if the user
+    expanded them one by one. The GUI nodes below a node are added when it is
+    expanded, as in the GUI, until the whole of the given trees are shown.
+    @return The number of GUI tree items created.
+    """
+
+    from gui.TreePanel import TreePanel
+    panel = TreePanel(None, processTrees)
+    tree = panel.tree
+    position = 0
+    while position < len(tree.expandableItems):
+        tree.Expand(tree.expandableItems[position])
+        position += 1
+    return tree.numItems
+
+
+def startGui(errors): # Integer
+    """What the GUI does before it is shown: build the trees of every process
+    and create a TreePanel, which only creates what is visible at first.
+    @return The number of GUI tree items created.
+    """
+
+    from gui.TreePanel import TreePanel
+    processTrees = []
+    for processId, processErrors in ErrorParser.groupByProcess(errors):
+        processTrees.append((processId, CompressedStackError.build(processErrors, Stack.FROM_BOTTOM), CompressedStackError.build(processErrors, Stack.FROM_TOP)))
+    panel = TreePanel(None, processTrees)
+    return panel.tree.numItems
+
+
+def buildTrees(errors, direction): # SharedStackError list
+    """Build the whole trees. Children are created when first asked for, so every node is asked."""
+    trees = [SharedStackError(processErrors, 0, direction) for pid, processErrors in ErrorParser.groupByProcess(errors)]
+    for tree in trees:
+        countNodes(tree)
+    return trees
+
+
+def buildParallel(errors, numProcesses): # SharedStackError list
+    """Build the whole trees of both directions with a pool of worker processes."""
+    trees = []
+    for pid, processErrors in ErrorParser.groupByProcess(errors):
+        trees.extend([SharedStackError(processErrors, 0, Stack.FROM_BOTTOM), SharedStackError(processErrors, 0, Stack.FROM_TOP)])
+    ParallelTreeBuilder(numProcesses).createTrees(trees)
+    return trees
+
+
+def buildCompressedTrees(errors, direction): # CompressedStackError list
+    trees = [CompressedStackError.build(processErrors, direction) for pid, processErrors in ErrorParser.groupByProcess(errors)]
+    for tree in trees:
+        countNodes(tree)
+    return trees
+
+
+def parseLines(lines): # (ParsedError list, string list, process id)
+    stackFrames.clear() # Parse as if for the first time.
+    return ErrorParser().parse(lines)
+
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="Time reading, parsing and tree building on a synthetic Valgrind log.")
+    argParser.add_argument("-n", "--errors", type=int, default=4000, help="Number of errors, leaks included.")
+    argParser.add_argument("-d", "--depth", type=int, default=24, help="Maximum call stack depth.")
+    argParser.add_argument("-b", "--branching", type=int, default=3, help="Number of callees of each function.")
+    argParser.add_argument("-p", "--processes", type=int, default=4, help="Number of processes in the log.")
+    argParser.add_argument("-l", "--leaks", type=float, default=0.2, help="Share of the errors that are leaks.")
+    argParser.add_argument("-o", "--output-ratio", type=float, default=2.0, help="Average number of program output lines between errors.")
+    argParser.add_argument("-j", "--jobs", type=int, default=4, help="Number of worker processes of the parallel build.")
+    argParser.add_argument("-r", "--repeat", type=int, default=3, help="Times to run each phase. The fastest run counts.")
+    argParser.add_argument("-t", "--tolerance", type=float, default=0.25, help="Allowed slowdown compared to the baseline, as a fraction.")
+    argParser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline.")
+    args = argParser.parse_args()
+
+    sys.modules["wx"] = createFakeWx()
+
+    log = SyntheticLog(args.errors, args.depth, args.branching, args.processes, args.leaks, args.output_ratio)
+    directory = tempfile.mkdtemp()
+    try:
+        logPath = os.path.join(directory, "valgrind.log")
+        with open(logPath, "w") as logFile:
+            numErrors = log.write(logFile)
+        logSize = os.path.getsize(logPath)
+        print("Synthetic log: %d errors, %.1f MiB, %s" % (numErrors, logSize / (1024.0 * 1024.0), json.dumps(log.getParameters(), sort_keys=True)))
+
+        fileReader = FileReader()
+        benchmark = Benchmark(args.repeat)
+        lines = benchmark.run("read", lambda: fileReader.readFile(logPath), logSize // 1024, "KiB")
+        benchmark.run("map", lambda: list(fileReader.mapFile(logPath)), len, "lines")
+        errors, unknowns, pid = benchmark.run("parse", lambda: parseLines(lines), len(lines), "lines")
+        if len(errors) != numErrors:
+            sys.exit("Parsed " + str(len(errors)) + " errors, expected " + str(numErrors) + ".")
+        lines = None
+
+        benchmark.run("build bottom", lambda: buildTrees(errors, Stack.FROM_BOTTOM), numErrors, "errors")
+        benchmark.run("build top", lambda: buildTrees(errors, Stack.FROM_TOP), numErrors, "errors")
+        benchmark.run("parallel build", lambda: buildParallel(errors, args.jobs), numErrors, "errors")
+        benchmark.run("compress", lambda: buildCompressedTrees(errors, Stack.FROM_BOTTOM) + buildCompressedTrees(errors, Stack.FROM_TOP), numErrors, "errors")
+
+        ## Built in full, so that the walks only time the GUI.
+        processTrees = []
+        compressedTrees = []
+        for processId, processErrors in ErrorParser.groupByProcess(errors):
+            processTrees.append((processId, SharedStackError(processErrors, 0, Stack.FROM_BOTTOM), SharedStackError(processErrors, 0, Stack.FROM_TOP)))
+            compressedTrees.append((processId, CompressedStackError.build(processErrors, Stack.FROM_BOTTOM), CompressedStackError.build(processErrors, Stack.FROM_TOP)))
+        for processId, errorFromBottom, errorFromTop in processTrees + compressedTrees:
+            countNodes(errorFromBottom)
+            countNodes(errorFromTop)
+        benchmark.run("tree walk", lambda: walkTrees(processTrees), lambda numItems: numItems, "items")
+        benchmark.run("compress walk", lambda: walkTrees(compressedTrees), lambda numItems: numItems, "items")
+        benchmark.run("startup", lambda: startGui(errors), numErrors, "errors")
+    finally:
+        shutil.rmtree(directory)
+
+    baseline = None
+    if os.path.exists(baselinePath):
+        with open(baselinePath) as baselineFile:
+            stored = json.load(baselineFile)
+        if stored.get("parameters") == log.getParameters():
+            baseline = stored.get("seconds")
+        else:
+            print("The baseline was measured on a different log, not comparing.")
+
+    passed = benchmark.report(baseline, args.tolerance)
+    times = benchmark.getTimes()
+    print("Parallel build of both directions with %d processes: %.2fx as fast as building them one node at a time." %
+          (args.jobs, (times["build bottom"] + times["build top"]) / max(times["parallel build"], 1e-9)))
+
+    if args.save_baseline:
+        with open(baselinePath, "w") as baselineFile:
+            json.dump({"parameters": log.getParameters(), "seconds": benchmark.getTimes()}, baselineFile, indent=2, separators=(",", ": "), sort_keys=True)
+            baselineFile.write("\n")
+        print("Saved the baseline to '" + baselinePath + "'.")
+    elif not passed:
+        sys.exit(1)
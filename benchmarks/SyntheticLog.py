@@ -0,0 +1,249 @@
+"""
+Generator of synthetic Valgrind logs of any size, for benchmarking.
+
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+import argparse
+import random
+import sys
+import zlib
+
+
+## The error reports that are generated, as (diagnostic line, source line)
+## pairs. Source lines are followed by a second call stack. '{size}' and
+## '{address}' are replaced with random values.
+errorTemplates = [
+    ("Invalid read of size {size}", "Address {address} is {size} bytes inside a block of size 64 alloc'd"),
+    ("Invalid write of size {size}", "Address {address} is 0 bytes after a block of size 40 alloc'd"),
+    ("Invalid read of size {size}", "Address {address} is 8 bytes before a block of size 80 free'd"),
+    ("Conditional jump or move depends on uninitialised value(s)", "Uninitialised value was created by a heap allocation"),
+    ("Conditional jump or move depends on uninitialised value(s)", None),
+    ("Use of uninitialised value of size {size}", None),
+    ("Invalid free() / delete / delete[] / realloc()", "Address {address} is 0 bytes inside a block of size 16 free'd"),
+    ("Mismatched free() / delete / delete []", "Address {address} is 0 bytes inside a block of size 24 alloc'd"),
+]
+
+## Frames at the top of allocation stacks, and of some error stacks.
+allocatorFrames = [
+    "malloc (in /usr/lib/valgrind/vgpreload_memcheck-amd64-linux.so)",
+    "operator new[](unsigned long) (in /usr/lib/valgrind/vgpreload_memcheck-amd64-linux.so)",
+    "operator new(unsigned long) (in /usr/lib/valgrind/vgpreload_memcheck-amd64-linux.so)",
+]
+libraryFrames = [
+    "memcpy@@GLIBC_2.14 (in /usr/lib/valgrind/vgpreload_memcheck-amd64-linux.so)",
+    "__printf_fp (printf_fp.c:400)",
+    "??? (in /usr/lib/x86_64-linux-gnu/libstdc++.so.6.0.19)",
+    "std::ostream& std::ostream::_M_insert<double>(double) (in /usr/lib/x86_64-linux-gnu/libstdc++.so.6.0.19)",
+]
+
+programOutput = [
+    "Processing item {number}",
+    "Loaded {number} records from cache.",
+    "warning: retrying request {number}",
+    "result = {number}",
+]
+
+
+class SyntheticLog(object):
+    """Writes a Valgrind log with a configurable number of errors, call stack
+    depth and shape, number of processes, share of leaks and amount of program
+    output between the Valgrind lines. The same parameters and seed always give
+    the same log.
+
+    The call stacks are paths in a random call tree rooted at main. At each
+    level a stack continues into one of 'branching' callees, so errors share
+    the bottom of their stacks and differ towards the top, like in a real
+    program. Each process writes a header, its errors in whole blocks mixed
+    with the other processes' errors, and a leak summary at the end.
+    """
+
+    def __init__(self, numErrors=1000, stackDepth=12, branching=4, numProcesses=1,
+                 leakRatio=0.1, outputRatio=1.0, seed=4711):
+        """
+        @param numErrors - Integer - The number of errors, leaks included.
+        @param stackDepth - Integer - The maximum number of frames in a call stack.
+        @param branching - Integer - The number of callees of each function in the call tree.
+        @param numProcesses - Integer - The number of processes whose output is mixed in the log.
+        @param leakRatio - Float - The share of the errors that are leaks.
+        @param outputRatio - Float - The average number of program output lines between two errors.
+        @param seed - Integer - Seed for the random number generator.
+        """
+
+        self.numErrors = numErrors # Integer
+        self.stackDepth = max(1, stackDepth) # Integer
+        self.branching = max(1, branching) # Integer
+        self.numProcesses = max(1, numProcesses) # Integer
+        self.leakRatio = leakRatio # Float
+        self.outputRatio = outputRatio # Float
+        self.random = random.Random(seed) # Random
+
+        ## Every function of the call tree, identified by its path from main.
+        self.functionIds = {} # Tuple -> Integer dictionary.
+
+
+    def getParameters(self): # Dictionary
+        return {
+            "numErrors": self.numErrors,
+            "stackDepth": self.stackDepth,
+            "branching": self.branching,
+            "numProcesses": self.numProcesses,
+            "leakRatio": self.leakRatio,
+            "outputRatio": self.outputRatio,
+        }
+
+
+    def write(self, output): # Integer
+        """Write the log to a file object.
+        @return The number of errors written, leaks included.
+        """
+
+        pids = [str(1000 + 17 * index) for index in range(self.numProcesses)]
+        numLeaks = int(round(self.numErrors * self.leakRatio))
+        leaks = dict([(pid, []) for pid in pids]) # Process id -> leak stack list.
+        started = set()
+
+        for index in range(self.numErrors):
+            pid = self.random.choice(pids)
+            if pid not in started:
+                started.add(pid)
+                self.writeHeader(output, pid)
+
+            if index < numLeaks:
+                ## Leaks are reported when the process exits. Remember them.
+                leaks[pid].append(self.createStack(allocatorFrames))
+            else:
+                self.writeError(output, pid)
+            self.writeProgramOutput(output)
+
+        for pid in pids:
+            if pid not in started:
+                self.writeHeader(output, pid)
+            self.writeLeaks(output, pid, leaks[pid])
+
+        return self.numErrors
+
+
+    def writeHeader(self, output, pid): # None
+        prefix = "==" + pid + "=="
+        output.write(prefix + " Memcheck, a memory error detector\n")
+        output.write(prefix + " Copyright (C) 2002-2013, and GNU GPL'd, by Julian Seward et al.\n")
+        output.write(prefix + " Using Valgrind-3.10.0.SVN and LibVEX; rerun with -h for copyright info\n")
+        output.write(prefix + " Command: ./synthetic --process " + pid + "\n")
+        output.write(prefix + " \n")
+
+
+    def writeError(self, output, pid): # None
+        errorType, sourceType = self.random.choice(errorTemplates)
+        topFrames = libraryFrames if self.random.random() < 0.2 else None
+
+        lines = [self.fillTemplate(errorType)]
+        lines.extend(self.formatStack(self.createStack(topFrames)))
+        if sourceType is not None:
+            lines.append(" " + self.fillTemplate(sourceType))
+            lines.extend(self.formatStack(self.createStack(allocatorFrames)))
+        self.writeLines(output, pid, lines)
+
+
+    def writeLeaks(self, output, pid, leakStacks): # None
+        lines = ["HEAP SUMMARY:", "    in use at exit: 0 bytes in 0 blocks", ""]
+        totalBytes = 0
+        totalBlocks = 0
+        for index, stack in enumerate(leakStacks):
+            blocks = self.random.randint(1, 20)
+            numBytes = blocks * self.random.choice([8, 16, 24, 64, 1024])
+            totalBytes += numBytes
+            totalBlocks += blocks
+            if self.random.random() < 0.3:
+                direct = numBytes // 2
+                sizes = "{:,} ({:,} direct, {:,} indirect)".format(numBytes, direct, numBytes - direct)
+            else:
+                sizes = "{:,}".format(numBytes)
+            lines.append(sizes + " bytes in {:,} blocks are definitely lost in loss record {:,} of {:,}".format(
+                blocks, index + 1, len(leakStacks)))
+            lines.extend(self.formatStack(stack))
+            lines.append("")
+
+        lines.append("LEAK SUMMARY:")
+        lines.append("   definitely lost: {:,} bytes in {:,} blocks".format(totalBytes, totalBlocks))
+        lines.append("")
+        lines.append("ERROR SUMMARY: 0 errors from 0 contexts (suppressed: 0 from 0)")
+        self.writeLines(output, pid, lines)
+
+
+    def writeProgramOutput(self, output): # None
+        ## On average 'outputRatio' lines, including fractions of a line.
+        numLines = int(self.outputRatio)
+        if self.random.random() < self.outputRatio - numLines:
+            numLines += 1
+        for line in range(numLines):
+            output.write(self.random.choice(programOutput).format(number=self.random.randint(0, 100000)) + "\n")
+
+
+    @staticmethod
+    def writeLines(output, pid, lines): # None
+        prefix = "==" + pid + "== "
+        output.write("".join([prefix + line + "\n" for line in lines]))
+        output.write(prefix + "\n")
+
+
+    def createStack(self, topFrames=None): # String list
+        """Returns the frames of a random path through the call tree, from the
+        top of the stack down to main. Optionally the top frame is one of
+        'topFrames' instead of a function of the call tree.
+        """
+
+        depth = self.random.randint((self.stackDepth + 1) // 2, self.stackDepth)
+        path = ()
+        frames = ["main (main.cpp:20)"]
+        for level in range(1, depth):
+            path += (self.random.randrange(self.branching),)
+            frames.append(self.getFunction(path))
+        frames.reverse()
+        if topFrames is not None:
+            frames[0] = self.random.choice(topFrames)
+        return frames
+
+
+    def getFunction(self, path): # String
+        """The frame text of the function at the given path of the call tree."""
+
+        functionId = self.functionIds.get(path)
+        if functionId is None:
+            functionId = self.functionIds[path] = len(self.functionIds)
+        module = functionId % 53
+        return "module" + str(module) + "::function" + str(functionId) + "(int, char const*) (module" + str(module) + ".cpp:" + str(10 + functionId % 997) + ")"
+
+
+    def formatStack(self, frames): # String list
+        lines = []
+        for index, frame in enumerate(frames):
+            address = "0x" + format(0x400000 + 16 * (zlib.crc32(frame) & 0xFFFFF), "X")
+            lines.append(("   at " if index == 0 else "   by ") + address + ": " + frame)
+        return lines
+
+
+    def fillTemplate(self, template): # String
+        return template.format(size=self.random.choice([1, 2, 4, 8]), address="0x" + format(self.random.randint(0x5000000, 0x6000000), "x"))
+
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="Write a synthetic Valgrind log.")
+    argParser.add_argument("output", nargs="?", default="-", help="The log file to write. Standard out by default.")
+    argParser.add_argument("-n", "--errors", type=int, default=1000, help="Number of errors, leaks included.")
+    argParser.add_argument("-d", "--depth", type=int, default=12, help="Maximum call stack depth.")
+    argParser.add_argument("-b", "--branching", type=int, default=4, help="Number of callees of each function.")
+    argParser.add_argument("-p", "--processes", type=int, default=1, help="Number of processes in the log.")
+    argParser.add_argument("-l", "--leaks", type=float, default=0.1, help="Share of the errors that are leaks.")
+    argParser.add_argument("-o", "--output-ratio", type=float, default=1.0, help="Average number of program output lines between errors.")
+    argParser.add_argument("-s", "--seed", type=int, default=4711, help="Random seed.")
+    args = argParser.parse_args()
+
+    log = SyntheticLog(args.errors, args.depth, args.branching, args.processes, args.leaks, args.output_ratio, args.seed)
+    if args.output == "-":
+        log.write(sys.stdout)
+    else:
+        with open(args.output, "w") as output:
+            log.write(output)
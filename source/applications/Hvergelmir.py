@@ -7,29 +7,143 @@ import os
 import sys
 
 
-from gui.TreePanel import TreePanel
-from gui.ErrorPanel import ErrorPanel
-
+from disk.ErrorCache import ErrorCache
 from disk.FileReader import FileReader
+from disk.LogFollower import LogFollower
 
+from operations.ErrorCollapser import ErrorCollapser
 from operations.ErrorParser import ErrorParser
+from operations.ErrorReport import ErrorReport
+from operations.ParallelErrorParser import ParallelErrorParser
+from operations.ParallelTreeBuilder import ParallelTreeBuilder
+from operations.Profiler import Profiler
+from operations.Profiler import countNodes
+from operations.XmlErrorParser import XmlErrorParser
 
 
+from errors.CompressedStackError import CompressedStackError
 from errors.SharedStackError import SharedStackError
 from errors.Stack import Stack
+from errors.Stack import stackFrames
 
 import argparse
-import wx
 
 
 fileReader = FileReader()
 
 
+def countParsed(profiler, parser, errors, unknowns): # None
+    """Give the profiler the number of lines, errors and frames that were read.
+    Only the ErrorParser counts lines, and memory mapped logs only give it
+    their Valgrind lines. The frames are counted per stack, and once per
+    distinct frame line.
+    """
+    if not profiler.enabled:
+        return
+
+    if hasattr(parser, "numLines"):
+        profiler.count("lines scanned", parser.numLines)
+        profiler.count("valgrind lines", parser.numValgrindLines)
+    profiler.count("errors", len(errors))
+    numFrames = 0
+    for error in errors:
+        numFrames += error.errorStack.getNumFrames()
+        if error.sourceStack is not None:
+            numFrames += error.sourceStack.getNumFrames()
+    profiler.count("frames", numFrames)
+    profiler.count("distinct frames", len(stackFrames))
+    profiler.count("unknown lines", len(unknowns))
+
+
+def readErrors(log, parser, cache, collapser, profiler): # (ParsedError list, string list, process id)
+    """Parse the log, or load the errors from the cache if it was parsed before.
+    Repetitions of the same error are collapsed into one error with a count
+    before the trees are built, and before caching.
+    @return Same as ErrorParser.parse.
+    """
+    with profiler.phase("load cache"):
+        cached = cache.load() if cache is not None else None
+    if cached is not None:
+        return cached
+
+    with profiler.phase("parse"):
+        errors, unknowns, pid = parser.parse(log)
+    if errors is not None:
+        countParsed(profiler, parser, errors, unknowns)
+        with profiler.phase("collapse"):
+            errors = collapser.collapse(errors)
+    if cache is not None and errors is not None:
+        with profiler.phase("store cache"):
+            cache.store(errors, unknowns, pid)
+    return (errors, unknowns, pid)
+
+
+def groupErrors(errors, pids, pid): # (String, ParsedError list) list
+    """Split the errors by process, keeping only the processes in 'pids'.
+    @param pids - string list - Process ids to keep. None or empty means all.
+    @param pid - String - Process id given an empty group if no process is left, or None.
+    """
+    processErrors = ErrorParser.groupByProcess(errors)
+    if pids:
+        processErrors = [group for group in processErrors if group[0] in pids]
+    if len(processErrors) == 0 and pid is not None:
+        processErrors = [(pid, [])]
+    return processErrors
+
+
 class Hvergelmir(object):
     """"""
 
-    def __init__(self, lines):
-        """"""
+    ## How often, in milliseconds, a followed log is checked for new errors.
+    FOLLOW_INTERVAL = 500
+
+    ## Bytes of a followed log parsed per check, so that the GUI stays
+    ## responsive while catching up with a fast growing log.
+    FOLLOW_POLL_BYTES = 4 * 1024 * 1024
+
+    def __init__(self, log, parser, pids=None, cache=None, follower=None, sortByLeaks=False, profiler=None):
+        """
+        @param log - The Valgrind log, in whatever form 'parser' accepts.
+        @param parser - ErrorParser, ParallelErrorParser or XmlErrorParser.
+        @param pids - string list - Process ids whose errors should be shown. None or empty means all.
+        @param cache - ErrorCache - Cache of the parse result for the log, or None.
+        @param follower - LogFollower - Used instead of 'log' and 'parser' to keep
+               reading the log as it grows, or None to read it once.
+        @param sortByLeaks - boolean - Order the tree by leaked bytes instead of by number of errors.
+        @param profiler - Profiler - Records the time of each phase and what was read, or None.
+        """
+        ## Keep the log around if it can give us the raw text of the errors.
+        self.log = log if hasattr(log, "readSpan") else None
+        self.follower = follower
+        self.pids = pids
+        self.numPrintedUnknowns = 0
+        self.collapser = ErrorCollapser()
+        self.profiler = profiler if profiler is not None else Profiler(False)
+
+        ## Parse Valgrind log file, unless it was parsed before. Done before wx is
+        ## initialized since the parser may fork worker processes.
+        if follower is not None:
+            ## Errors that are still being written are added when the log grows.
+            self.log = follower
+            with self.profiler.phase("parse"):
+                errors = follower.poll()
+            countParsed(self.profiler, follower.parser, errors, follower.parser.unknownErrors)
+            with self.profiler.phase("collapse"):
+                errors = self.collapser.collapse(errors)
+            unknowns = follower.parser.unknownErrors
+            pid = follower.parser.id
+        else:
+            errors, unknowns, pid = readErrors(log, parser, cache, self.collapser, self.profiler)
+        if errors is None:
+            print("Could not read any errors.")
+            sys.exit(1)
+
+        ## The GUI is only imported when it is shown, so that --report works
+        ## where wx isn't installed.
+        import wx
+        from gui.TreePanel import TreePanel
+        from gui.ErrorPanel import ErrorPanel
+
         ## Basic application setup.
         self.app = wx.PySimpleApp()
         self.app.frame = wx.Frame(None, title="Hvergelmir")
@@ -38,23 +152,30 @@ class Hvergelmir(object):
         self.frameSizer = wx.BoxSizer(wx.VERTICAL)
         self.frameContents = wx.SplitterWindow(self.app.frame)
 
-        ## Parse Valgrind log file.
-        parser = ErrorParser()
-        errors, unknowns, pid = parser.parse(lines)
-        if errors is None:
-            print("Could not read any errors.")
-            sys.exit(1)
-
-        self.errorTreeFromBottom = SharedStackError(errors, 0, Stack.FROM_BOTTOM)
-        self.errorTreeFromTop = SharedStackError(errors, 0, Stack.FROM_TOP)
+        ## One pair of error trees per process. Trees that never change are
+        ## path compressed, a followed log needs trees that errors can be added to.
+        processErrors = groupErrors(errors, pids, pid if follower is None else None)
+        self.processTrees = [] # (string, SharedStackError, SharedStackError) list, or CompressedStackErrors.
+        with self.profiler.phase("build trees"):
+            for processId, errors in processErrors:
+                if follower is None:
+                    errorTreeFromBottom = CompressedStackError.build(errors, Stack.FROM_BOTTOM)
+                    errorTreeFromTop = CompressedStackError.build(errors, Stack.FROM_TOP)
+                else:
+                    errorTreeFromBottom = SharedStackError(errors, 0, Stack.FROM_BOTTOM)
+                    errorTreeFromTop = SharedStackError(errors, 0, Stack.FROM_TOP)
+                self.processTrees.append((processId, errorTreeFromBottom, errorTreeFromTop))
+        self.profiler.count("distinct errors", len(self.collapser))
 
         if unknowns is not None:
             print("The parser didn't recognize the following error types:")
             for unknown in unknowns:
                 print("  " + unknown)
+            self.numPrintedUnknowns = len(unknowns)
 
         ## Create GUI.
-        self.treePanel = TreePanel(self.frameContents, self.errorTreeFromBottom, self.errorTreeFromTop)
+        with self.profiler.phase("populate tree"):
+            self.treePanel = TreePanel(self.frameContents, self.processTrees, sortByLeaks)
         self.errorPanel = ErrorPanel(self.frameContents)
         self.frameContents.SplitVertically(self.treePanel, self.errorPanel)
         self.frameSizer.Add(self.frameContents, 1, flag=wx.EXPAND)
@@ -67,8 +188,66 @@ class Hvergelmir(object):
 
         self.errorPanel.sourceCode.setSourceCode(["Select an error from the list."], None)
 
+        ## Check the followed log for new errors now and then. Timer events are
+        ## handled by the main loop, so the GUI stays responsive in between.
+        if follower is not None:
+            self.followTimer = wx.Timer(self.app.frame)
+            self.app.frame.Bind(wx.EVT_TIMER, self.followLog, self.followTimer)
+            self.followTimer.Start(Hvergelmir.FOLLOW_INTERVAL)
+
         self.app.MainLoop()
 
+        ## Source files are looked up, and tree nodes created, while the GUI
+        ## runs, so these are only known now.
+        if self.profiler.enabled:
+            for processId, errorTreeFromBottom, errorTreeFromTop in self.treePanel.processTrees:
+                self.profiler.count("tree nodes", countNodes(errorTreeFromBottom, True) + countNodes(errorTreeFromTop, True))
+        self.profiler.count("findFile cache hits", fileReader.numCacheHits)
+        self.profiler.count("findFile cache misses", fileReader.numCacheMisses)
+        self.profiler.count("directory walks", fileReader.numDirectoryWalks)
+
+
+
+    def followLog(self, event):
+        """Called by the follow timer. Parses what has been appended to the log
+        since the last call and adds the new errors to the trees, updating only
+        the branches of the GUI tree that the new errors pass through.
+        """
+        with self.profiler.phase("follow"):
+            self.addFollowedErrors()
+
+
+
+    def addFollowedErrors(self): # None
+        errors = self.follower.poll(Hvergelmir.FOLLOW_POLL_BYTES)
+        if self.profiler.enabled:
+            self.profiler.count("errors", len(errors))
+
+        unknowns = self.follower.parser.unknownErrors
+        for unknown in unknowns[self.numPrintedUnknowns:]:
+            print("  " + unknown)
+        self.numPrintedUnknowns = len(unknowns)
+
+        if self.pids:
+            errors = [error for error in errors if error.pid in self.pids]
+        if len(errors) == 0:
+            return
+
+        self.treePanel.tree.Freeze()
+        try:
+            for error in errors:
+                representative = self.collapser.add(error)
+                if representative is not error:
+                    self.treePanel.countError(representative, error.count)
+                    continue
+                if not self.treePanel.hasProcess(error.pid):
+                    self.treePanel.addProcess(error.pid,
+                                              SharedStackError([], 0, Stack.FROM_BOTTOM),
+                                              SharedStackError([], 0, Stack.FROM_TOP))
+                self.treePanel.insertError(error)
+        finally:
+            self.treePanel.tree.Thaw()
+
 
 
     def treeItemSelected(self, data):
@@ -84,7 +263,12 @@ class Hvergelmir(object):
         error = data.parsedError  # ParsedError instance, or None.
 
         if error is not None:
-            self.errorPanel.errorInfo.display(error)
+            logText = None
+            if self.log is not None and error.logSpan is not None:
+                logText = self.log.readSpan(error.logSpan)
+            self.errorPanel.errorInfo.display(error, logText)
+        elif data.errorTreeNode is not None:
+            self.errorPanel.errorInfo.displayNode(data.errorTreeNode)
 
         sourceFilePath = nearestSourceStackFrame.fileName
         if sourceFilePath is None:
@@ -93,7 +277,8 @@ class Hvergelmir(object):
             self.errorPanel.sourceCode.setSourceCode([errorMessage], None)
             return
 
-        lines = fileReader.readFile(sourceFilePath)
+        with self.profiler.phase("read source"):
+            lines = fileReader.readFile(sourceFilePath)
         if lines is None:
             errorMessage = "Could not read source code from '" + sourceFilePath + "'.";
             self.setStatusText(errorMessage)
@@ -103,7 +288,7 @@ class Hvergelmir(object):
                 None)
             return
 
-        self.errorPanel.sourceCode.setSourceCode(lines, int(nearestSourceStackFrame.lineNumber))
+        self.errorPanel.sourceCode.setSourceCode(lines, nearestSourceStackFrame.lineNumber)
 
         self.setStatusText(sourceFilePath)
 
@@ -120,18 +305,45 @@ if __name__ == "__main__":
     argParser = argparse.ArgumentParser()
     argParser.add_argument("log", help="The Valgrind log file. Pass '-' to read from standard in.")
     argParser.add_argument("-p", "--path", default=[], action="append", help="Directories to search for source code.")
+    argParser.add_argument("--pid", default=[], action="append", help="Only show the errors of the process with this id. May be given several times.")
+    argParser.add_argument("--sort", choices=["count", "leaks"], default="count", help="Order the call stack tree by number of errors or by leaked bytes.")
+    argParser.add_argument("--no-cache", action="store_true", help="Don't read or write the parse result cache stored next to the log file.")
+    argParser.add_argument("-f", "--follow", action="store_true", help="Keep reading the log while it grows and add new errors as they are written. Only for uncompressed text log files.")
+    argParser.add_argument("-j", "--jobs", type=int, default=1, help="Number of processes to parse the Valgrind log, and build the trees of --report, with. Parsing is not split when reading from standard in.")
+    argParser.add_argument("--profile", action="store_true", help="Print the time and peak memory of each phase and counts of what was read when the GUI is closed.")
+    argParser.add_argument("--profile-json", default=None, metavar="FILE", help="Write what --profile prints to FILE as JSON.")
+    argParser.add_argument("--report", choices=[ErrorReport.TEXT, ErrorReport.JSON], default=None, help="Print the error tree and a summary of the errors to standard out instead of showing the GUI.")
     args = argParser.parse_args()
 
+    ## With --report only the report is written to standard out, so that it can
+    ## be piped into other tools. Messages, and the profile, go to standard error.
+    reportOutput = sys.stdout
+    if args.report is not None:
+        sys.stdout = sys.stderr
+
+    ## Where Profiler.write writes the results, '-' to print them.
+    profilePaths = (["-"] if args.profile else []) + ([args.profile_json] if args.profile_json is not None else [])
+    profiler = Profiler(len(profilePaths) > 0)
+
     ## Read command line options.
     filePath = args.log
     for path in args.path:
         fileReader.addPrefix(path)
 
     ## Determine if we should read the Valgrind log from a file or standard in.
+    ## Standard in is streamed line by line into the parser, never read in full.
+    ## Files are memory mapped so that only the Valgrind lines are decoded.
+    ## Compressed logs are decompressed while they are parsed, and logs written
+    ## with --xml=yes are detected and read by the XML parser instead.
+    cache = None
     if filePath == "-":
-        fileLines = fileReader.readFile(sys.stdin)
+        with profiler.phase("open log"):
+            log, isXml = FileReader.openLogFile(sys.stdin)
     else:
-        fileLines = fileReader.readFile(filePath)
+        with profiler.phase("open log"):
+            log, isXml = fileReader.openLog(filePath)
+        if log is not None and not args.no_cache and not args.follow:
+            cache = ErrorCache(fileReader.findFile(filePath))
         ## If we are reading from a file and the user didn't specify the --path option,
         ## then guess that source file paths are relative to the folder where the log is.
         if len(args.path) == 0:
@@ -140,8 +352,57 @@ if __name__ == "__main__":
 
     ## Bail if we don't have any lines. The reader will have printed some error
     ## message already.
-    if fileLines is None:
+    if log is None:
         sys.exit(1)
 
-    ## Setup done. Launch log parsing and the GUI.
-    Hvergelmir(fileLines)
+    ## Only plain log files can be followed, since new lines are read from
+    ## where the previous read stopped.
+    follower = None
+    if args.follow:
+        if filePath == "-" or isXml or not hasattr(log, "readSpan"):
+            print("Only uncompressed text log files can be followed.")
+            sys.exit(1)
+        log.close()
+        log = None
+        follower = LogFollower(fileReader.findFile(filePath))
+
+    ## Large logs can be parsed in parallel, but only when memory mapped, which
+    ## compressed logs and standard in are not.
+    if isXml:
+        parser = XmlErrorParser()
+    elif args.jobs > 1:
+        parser = ParallelErrorParser(args.jobs)
+    else:
+        parser = ErrorParser()
+
+    ## The log is read while parsing, and the GUI reads the text of errors from
+    ## memory mapped logs, so it is closed when we are done, however that is.
+    try:
+        ## Without a GUI the log is parsed once, reported and then we are done.
+        ## Only the trees from the bottom of the call stacks are built, in full
+        ## since the whole trees are reported.
+        if args.report is not None:
+            if args.follow:
+                print("A followed log can't be reported.")
+                sys.exit(1)
+            errors, unknowns, pid = readErrors(log, parser, cache, ErrorCollapser(), profiler)
+            if errors is None:
+                print("Could not read any errors.")
+                sys.exit(1)
+            with profiler.phase("build trees"):
+                processTrees = [(processId, SharedStackError(processErrors, 0, Stack.FROM_BOTTOM))
+                                for processId, processErrors in groupErrors(errors, args.pid, pid)]
+                ParallelTreeBuilder(args.jobs).createTrees([tree for processId, tree in processTrees])
+            with profiler.phase("report"):
+                ErrorReport(processTrees, unknowns).write(args.report, reportOutput)
+            for profilePath in profilePaths:
+                profiler.write(profilePath, sys.stderr)
+            sys.exit(0)
+
+        ## Setup done. Launch log parsing and the GUI.
+        Hvergelmir(log, parser, args.pid, cache, follower, args.sort == "leaks", profiler)
+        for profilePath in profilePaths:
+            profiler.write(profilePath)
+    finally:
+        if hasattr(log, "close"):
+            log.close()
@@ -0,0 +1,173 @@
+"""
+Streaming decompression of compressed Valgrind logs.
+
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+import bz2
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None # xz compressed logs are not supported.
+
+
+GZIP = "gzip"
+BZIP2 = "bz2"
+XZ = "xz"
+
+## What the decompressors raise for data that isn't a valid compressed stream,
+## e.g. a damaged file or garbage after the last stream.
+DECOMPRESSION_ERRORS = (zlib.error, IOError) + ((lzma.LZMAError,) if lzma is not None else ())
+
+
+def isSupported(compression): # Boolean
+    """Returns True if logs compressed with the given format can be read."""
+    return compression != XZ or lzma is not None
+
+
+def createDecompressor(compression): # Decompressor
+    """Create a decompressor object for one compressed stream of the given
+    format. All have a decompress method and an unused_data attribute.
+    """
+
+    if compression == GZIP:
+        return zlib.decompressobj(16 + zlib.MAX_WBITS) # 16 means gzip header and trailer.
+    elif compression == BZIP2:
+        return bz2.BZ2Decompressor()
+    elif compression == XZ:
+        if lzma is None:
+            raise ValueError("xz compressed logs need the lzma module.")
+        return lzma.LZMADecompressor()
+    else:
+        raise ValueError("Unknown compression format '" + str(compression) + "'.")
+
+
+
+class DecompressingFile(object):
+    """Read-only file object that decompresses another file object while it is
+    being read. Only a chunk of the compressed file, and what it decompresses
+    to, is held in memory at a time, and the underlying file is never seeked,
+    so standard in works. Files made by concatenating several compressed
+    streams, e.g. by pigz or 'cat a.gz b.gz', are read in full. Reading stops,
+    with a warning, where the compressed data is damaged, so that what came
+    before can still be parsed.
+    """
+
+    def __init__(self, fileHandle, compression, chunkSize=64 * 1024):
+        """
+        @param fileHandle - File object - The compressed data.
+        @param compression - String - One of GZIP, BZIP2 or XZ.
+        @param chunkSize - Integer - Number of compressed bytes to read at a time.
+        @raise ValueError If the compression format isn't supported.
+        """
+
+        self.fileHandle = fileHandle # File
+        self.compression = compression # String
+        self.chunkSize = chunkSize # Integer
+        self.decompressor = createDecompressor(compression) # Decompressor
+        self.buffer = b"" # String. Decompressed data not yet read.
+        self.position = 0 # Integer. Offset of the first unread byte in 'buffer'.
+        self.finished = False # Boolean. True when the compressed file has been read to the end, or to damaged data.
+        self.damaged = False # Boolean. True if reading stopped at damaged data.
+
+
+    def fill(self): # Boolean
+        """Decompress another chunk into the buffer. Already read data is
+        dropped from the buffer.
+        @return False if there was no more data.
+        """
+
+        while not self.finished:
+            data = self.fileHandle.read(self.chunkSize)
+            if len(data) == 0:
+                self.finished = True
+                return False
+
+            decompressed = self.decompress(data)
+            if len(decompressed) > 0:
+                self.buffer = self.buffer[self.position:] + decompressed
+                self.position = 0
+                return True
+
+        return False
+
+
+    def decompress(self, data): # String
+        """Decompress 'data', starting a new decompressor whenever a compressed
+        stream ends and more data follows.
+        """
+
+        output = []
+        while len(data) > 0:
+            try:
+                output.append(self.decompressor.decompress(data))
+            except EOFError:
+                ## The previous stream ended exactly at the end of the previous chunk.
+                self.decompressor = createDecompressor(self.compression)
+                continue
+            except DECOMPRESSION_ERRORS as error:
+                print("Warning: The " + self.compression + " compressed log is damaged, it was only read up to the damage: " + str(error))
+                self.damaged = True
+                self.finished = True
+                break
+
+            data = self.decompressor.unused_data
+            if len(data) > 0:
+                self.decompressor = createDecompressor(self.compression)
+
+        return b"".join(output)
+
+
+    def read(self, size=-1): # String
+        if size < 0:
+            while self.fill():
+                pass
+            size = len(self.buffer) - self.position
+
+        while len(self.buffer) - self.position < size and self.fill():
+            pass
+
+        data = self.buffer[self.position:self.position + size]
+        self.position += len(data)
+        return data
+
+
+    def readline(self): # String
+        lineEnd = self.buffer.find(b"\n", self.position)
+        while lineEnd == -1:
+            searchStart = len(self.buffer) - self.position
+            if not self.fill():
+                lineEnd = len(self.buffer) - 1 # The last line has no newline.
+                break
+            lineEnd = self.buffer.find(b"\n", searchStart)
+
+        line = self.buffer[self.position:lineEnd + 1]
+        self.position += len(line)
+        return line
+
+
+    def __iter__(self): # String iterator
+        line = self.readline()
+        while len(line) > 0:
+            yield line
+            line = self.readline()
+
+
+    def close(self): # None
+        """Close the compressed file."""
+        self.fileHandle.close()
+
+
+    def __enter__(self): # DecompressingFile
+        return self
+
+
+    def __exit__(self, excType, excValue, traceback): # Boolean
+        self.close()
+        return False
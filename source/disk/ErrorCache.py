@@ -0,0 +1,173 @@
+"""
+On-disk cache of parsed Valgrind logs.
+
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+
+from errors.LeakInfo import LeakInfo
+from errors.ParsedError import ParsedError
+from errors.Stack import Stack
+from errors.Stack import restoreFrame
+
+
+class ErrorCache(object):
+    """Stores the result of parsing a Valgrind log in a sidecar file next to the
+    log, e.g. 'valgrind.log.hvc' for 'valgrind.log', so that opening the log
+    again doesn't require parsing it again.
+
+    The cache is written with marshal, which is fast and compact and, unlike
+    pickle, never runs code found in the file. Each distinct stack frame is
+    stored once and errors refer to frames by index. The cache is only used if
+    the size, modification time and a hash of samples of the log's contents
+    are the same as when the cache was written, and if it was written by the
+    same cache format version and Python version.
+    """
+
+    ## Increase when the cache contents change.
+    FORMAT_VERSION = 3
+
+    ## Extension added to the log path to get the cache path.
+    EXTENSION = ".hvc"
+
+    ## The content hash covers this many evenly spaced blocks of the log.
+    NUM_SAMPLES = 16
+    SAMPLE_SIZE = 64 * 1024
+
+
+    def __init__(self, logPath):
+        """
+        @param logPath - string - Path to the Valgrind log.
+        """
+        self.logPath = logPath # string
+        self.cachePath = logPath + ErrorCache.EXTENSION # string
+
+
+
+    def getKey(self): # Tuple
+        """Identify the current contents of the log. Returns None if the log
+        can't be read.
+        """
+
+        try:
+            with open(self.logPath, "rb") as logFile:
+                status = os.fstat(logFile.fileno())
+                size = status.st_size
+                digest = hashlib.sha1()
+                for sample in range(ErrorCache.NUM_SAMPLES):
+                    logFile.seek(size * sample // ErrorCache.NUM_SAMPLES)
+                    digest.update(logFile.read(ErrorCache.SAMPLE_SIZE))
+        except EnvironmentError:
+            return None
+
+        return (ErrorCache.FORMAT_VERSION, tuple(sys.version_info[:2]), size, status.st_mtime, digest.hexdigest())
+
+
+
+    def load(self): # (ParsedError list, string list, process id)
+        """Read the parse result from the cache.
+        @return Same as ErrorParser.parse, or None if there is no valid cache.
+        """
+
+        key = self.getKey()
+        if key is None:
+            return None
+
+        try:
+            with open(self.cachePath, "rb") as cacheFile:
+                cachedKey = marshal.load(cacheFile)
+                if cachedKey != key:
+                    return None
+                frameList, errorList, unknowns, id = marshal.load(cacheFile)
+            frames = [restoreFrame(frameKey, fields) for frameKey, fields in frameList]
+            errors = [ErrorCache.restoreError(entry, frames) for entry in errorList]
+        except (EnvironmentError, EOFError, ValueError, TypeError, IndexError):
+            return None # Missing, unreadable or corrupt cache.
+
+        return (errors, unknowns, id)
+
+
+
+    def store(self, errors, unknowns, id): # Boolean
+        """Write a parse result to the cache. The cache is written to a
+        temporary file that replaces the old cache when complete, so that an
+        interrupted write never leaves a corrupt cache behind. Each write gets
+        its own temporary file, so runs storing the same log at once don't
+        write into each other's file.
+        @return True if the cache was written.
+        """
+
+        key = self.getKey()
+        if key is None or errors is None:
+            return False
+
+        frameIndices = {} # StackFrame id() -> Integer.
+        frameList = []
+        errorList = [ErrorCache.describeError(error, frameIndices, frameList) for error in errors]
+
+        temporaryPath = None
+        try:
+            handle, temporaryPath = tempfile.mkstemp(ErrorCache.EXTENSION + ".tmp", os.path.basename(self.cachePath) + ".",
+                                                     os.path.dirname(os.path.abspath(self.cachePath)))
+            with os.fdopen(handle, "wb") as cacheFile:
+                marshal.dump(key, cacheFile)
+                marshal.dump((frameList, errorList, unknowns, id), cacheFile)
+            if os.name == "nt" and os.path.exists(self.cachePath):
+                os.remove(self.cachePath) # Windows can't rename over an existing file.
+            os.rename(temporaryPath, self.cachePath)
+        except EnvironmentError:
+            if temporaryPath is not None and os.path.exists(temporaryPath):
+                os.remove(temporaryPath)
+            return False
+
+        return True
+
+
+
+    @staticmethod
+    def describeError(error, frameIndices, frameList): # Tuple
+        """Convert a ParsedError to marshalable values. Frames are added to
+        'frameList' the first time they are seen and referred to by index.
+        """
+
+        def getIndices(stack):
+            if stack is None:
+                return None
+            indices = []
+            for frame in stack.frames:
+                index = frameIndices.get(id(frame))
+                if index is None:
+                    index = frameIndices[id(frame)] = len(frameList)
+                    frameList.append((frame.key, frame.getFields()))
+                indices.append(index)
+            return indices
+
+        return (error.errorType, error.errorKind, error.pid,
+                getIndices(error.errorStack), error.sourceType, getIndices(error.sourceStack),
+                error.logSpan, error.count,
+                error.leak.getFields() if error.leak is not None else None)
+
+
+
+    @staticmethod
+    def restoreError(entry, frames): # ParsedError
+        errorType, errorKind, pid, errorIndices, sourceType, sourceIndices, logSpan, count, leak = entry
+
+        error = ParsedError(errorType, errorKind, pid)
+        error.errorStack.frames = [frames[index] for index in errorIndices]
+        if sourceType is not None:
+            error.setSourceType(sourceType)
+        if sourceIndices is not None:
+            error.sourceStack = Stack()
+            error.sourceStack.frames = [frames[index] for index in sourceIndices]
+        error.logSpan = logSpan
+        error.count = count
+        if leak is not None:
+            error.leak = LeakInfo(*leak)
+        return error
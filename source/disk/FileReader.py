@@ -6,6 +6,10 @@ See LICENSE for licensing information.
 import os
 import os.path
 
+from disk import DecompressingFile
+from disk.MappedLog import MappedLog
+from disk.PeekedFile import PeekedFile
+
 class FileReader(object):
     """Find and read text files. Maintains a list of directories to search in.
     The directory list initially contains '.'.
@@ -21,6 +25,11 @@ class FileReader(object):
         # stored in the <path>.
         self.pathCache = {}
 
+        # Statistics over the findFile calls, for profiling.
+        self.numCacheHits = 0 # Paths found in the pathCache, found or not found.
+        self.numCacheMisses = 0 # Paths that had to be searched for on disk.
+        self.numDirectoryWalks = 0 # Prefixes searched recursively for a missed path.
+
 
     def addPrefix(self, prefix): # None
         """Add another folder to search for files in. The current directory (.) is implicitly added.
@@ -78,6 +87,191 @@ class FileReader(object):
 
 
 
+    def iterateFile(self, fileOrPath):
+        """Dispatch method. Calls either iterateFilePath or iterateFileFile
+        depending on if 'fileOrPath' is a string or not. If not a string, then
+        it is assumed to be iterable over lines, like a file object.
+
+        Unlike readFile, the returned iterator reads the file one line at a
+        time, so the file contents are never held in memory all at once.
+        """
+
+        if isinstance(fileOrPath, str):
+            return self.iterateFilePath(fileOrPath)
+        else:
+            return FileReader.iterateFileFile(fileOrPath)
+
+
+
+    def iterateFilePath(self, path): # string iterator
+        """Open the file at 'path', prefixed with one of the prefixes, and return
+        an iterator over its lines. The file is closed when the iterator is
+        exhausted.
+        @param path - string - Path to file to read.
+        @return string iterator over the file contents, or None if no matching readable file is found.
+        """
+
+        foundPath = self.findFile(path)
+        if foundPath is None:
+            return None
+
+        try:
+            fileHandle = open(foundPath, "r")
+        except IOError:
+            print "Could not read file '" + foundPath + "'."
+            return None
+
+        return FileReader.iterateAndClose(fileHandle)
+
+
+
+    def mapFile(self, path): # MappedLog
+        """Memory map the Valgrind log at 'path', prefixed with one of the
+        prefixes. Iterating over the returned MappedLog yields the Valgrind
+        lines of the log.
+        @param path - string - Path to the log file to map.
+        @return MappedLog, or None if no matching readable file is found.
+        """
+
+        foundPath = self.findFile(path)
+        if foundPath is None:
+            return None
+
+        try:
+            return MappedLog(foundPath)
+        except EnvironmentError:
+            print "Could not map file '" + foundPath + "'."
+            return None
+
+
+
+    def openLog(self, path): # (log, boolean)
+        """Open a Valgrind log for parsing. Plain log files are memory mapped.
+        Compressed log files are decompressed while being read, see openLogFile.
+        @param path - string - Path to the log, prefixed with one of the prefixes.
+        @return (log, isXml). 'log' is a MappedLog or line iterator for text logs
+                and a path or file object for XML logs, or None if no matching
+                readable file is found. Unless it is a path, 'log' has a close
+                method that closes the file.
+        """
+
+        foundPath = self.findFile(path)
+        if foundPath is None:
+            return (None, False)
+
+        try:
+            with open(foundPath, "rb") as fileHandle:
+                magic = fileHandle.read(6)
+        except IOError:
+            print "Could not read file '" + foundPath + "'."
+            return (None, False)
+
+        if FileReader.detectCompression(magic) is not None:
+            try:
+                fileHandle = open(foundPath, "rb")
+            except IOError:
+                print "Could not read file '" + foundPath + "'."
+                return (None, False)
+            try:
+                log, isXml = FileReader.openLogFile(fileHandle)
+            except:
+                fileHandle.close()
+                raise
+            if log is None:
+                fileHandle.close()
+            return (log, isXml)
+
+        log = self.mapFile(foundPath)
+        if log is not None and FileReader.isXmlLog(log.readSpan((0, min(len(log), 256)))):
+            log.close()
+            return (foundPath, True)
+        return (log, False)
+
+
+
+    @staticmethod
+    def openLogFile(fileHandle): # (log, boolean)
+        """Prepare a Valgrind log that can only be read from start to end, such
+        as standard in, for parsing. Logs compressed with gzip, bzip2 or xz are
+        detected from their first bytes and decompressed on the fly, without
+        ever holding the whole log in memory.
+        @param fileHandle - File object - The log. Closed by closing 'log'.
+        @return (log, isXml). 'log' is a line iterator for text logs, which
+                closes the file once all lines have been read, and a file
+                object for XML logs, or None if the compression isn't supported.
+                Both have a close method.
+        """
+
+        peekedFile = PeekedFile(fileHandle)
+        compression = FileReader.detectCompression(peekedFile.head)
+        if compression is not None:
+            if not DecompressingFile.isSupported(compression):
+                print "Can not read " + compression + " compressed logs without the lzma module."
+                return (None, False)
+            peekedFile = PeekedFile(DecompressingFile.DecompressingFile(peekedFile, compression))
+
+        if FileReader.isXmlLog(peekedFile.head):
+            return (peekedFile, True)
+        return (FileReader.iterateAndClose(peekedFile), False)
+
+
+
+    @staticmethod
+    def detectCompression(head): # string
+        """Returns the compression format of a file given its first bytes, or
+        None if the file doesn't start with a magic number known to us.
+        """
+
+        if head.startswith(b"\x1f\x8b"):
+            return DecompressingFile.GZIP
+        elif head.startswith(b"BZh"):
+            return DecompressingFile.BZIP2
+        elif head.startswith(b"\xfd7zXZ\x00"):
+            return DecompressingFile.XZ
+        return None
+
+
+
+    @staticmethod
+    def isXmlLog(head): # boolean
+        """Returns True if 'head', the first bytes of a Valgrind log, show that
+        the log was written with --xml=yes.
+        """
+
+        head = head.lstrip()
+        if head.startswith(b"\xef\xbb\xbf"):
+            head = head[3:] # UTF-8 byte order mark.
+        return head.startswith(b"<?xml") or head.startswith(b"<valgrindoutput")
+
+
+
+    @staticmethod
+    def iterateFileFile(fileHandle):
+        """Generator yielding the lines of the given file object one at a time.
+        Newlines are stripped. The file object is not closed.
+        :param fileHandle: File object to read from.
+        :type fileHandle: FilIO[str]
+        :return: Iterator over the lines of the file.
+        :rtype str iterator.
+        """
+
+        for line in fileHandle:
+            yield line.rstrip("\r\n")
+
+
+
+    @staticmethod
+    def iterateAndClose(fileHandle):
+        """Same as iterateFileFile, but closes the file object once all lines have
+        been read.
+        """
+
+        with fileHandle:
+            for line in FileReader.iterateFileFile(fileHandle):
+                yield line
+
+
+
     def findFile(self, path): # string
         """Search the prefixes for a readable file. The 'path' may contain prefixes.
         For example, when give "textures/grass.png" 'findFile' may return
@@ -87,14 +281,18 @@ class FileReader(object):
         """
 
         cached = self.pathCache.get(path)
+        if cached is not None:
+            self.numCacheHits += 1
         if cached is not None and cached != "":
             return cached  # Have the path already. Just return it.
         if cached is not None and cached == "":
             return None  # We searched for this path previously but found nothing.
 
         # Not in cache, do disk search.
+        self.numCacheMisses += 1
 
         for prefix in self.prefixes:
+            self.numDirectoryWalks += 1
             foundPath = self.findFileInDirectory(prefix, path)
             if foundPath is not None:
                 # Found the file. Add its path to the path cache.
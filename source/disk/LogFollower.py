@@ -0,0 +1,124 @@
+"""
+Incremental reading of a Valgrind log that is still being written.
+
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+from disk.MappedLog import decodeLine
+from operations.ErrorParser import ErrorParser
+
+
+class LogFollower(object):
+    """Follows a Valgrind log while Valgrind is writing to it, like 'tail -f'.
+    Each call to poll parses only the bytes appended since the previous call
+    and returns the errors that were completed by them. The parser state is
+    kept between polls, so an error whose call stack has only partly been
+    written stays pending until the rest of it arrives. A line without a
+    newline is not parsed until the newline has been written.
+
+    The log is assumed to only grow. Logs that are truncated or replaced while
+    being followed are not detected.
+    """
+
+    ## Number of bytes read from the log at a time.
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, path, parser=None):
+        """
+        @param path - string - Path to the log file.
+        @param parser - ErrorParser - The parser to push the lines into. A new ErrorParser by default.
+        @raise EnvironmentError If the file cannot be opened.
+        """
+
+        self.path = path # String
+        self.fileHandle = open(path, "rb") # File
+        self.parser = parser if parser is not None else ErrorParser() # ErrorParser
+        self.parser.resetState()
+
+        ## Offset of the first byte that hasn't been parsed. Always the start of a line.
+        self.offset = 0 # Integer
+
+
+    def poll(self, maxBytes=None): # ParsedError list
+        """Parse the lines appended to the log since the last poll.
+        @param maxBytes - Integer - Stop after about this many bytes, at the end of a
+               line, and leave the rest for the next poll. None means read to the end.
+        @return The errors that were completed by the new lines, in the order
+                they were completed. Errors still being written are not included.
+        """
+
+        errors = []
+        pending = b"" # Start of a line that hasn't been completely read.
+        startOffset = self.offset
+        readBytes = 0
+        chunkSize = LogFollower.CHUNK_SIZE if maxBytes is None else min(LogFollower.CHUNK_SIZE, maxBytes)
+
+        self.fileHandle.seek(self.offset)
+        while maxBytes is None or readBytes < maxBytes or self.offset == startOffset:
+            data = self.fileHandle.read(chunkSize)
+            if len(data) == 0:
+                break
+            readBytes += len(data)
+
+            data = pending + data
+            numComplete = data.rfind(b"\n") + 1 # Bytes of data that are complete lines.
+            self.parseLines(data, numComplete, errors)
+            self.offset += numComplete
+            pending = data[numComplete:]
+
+        return errors
+
+
+    def parseLines(self, data, end, errors): # None
+        """Push the Valgrind lines in data[:end] to the parser. 'data' starts at
+        'offset' in the log. Other lines are skipped without being decoded.
+        Completed errors are appended to 'errors'.
+        """
+
+        if end > 0 and data.startswith(b"=="):
+            lineStart = 0
+        else:
+            lineStart = LogFollower.findMarker(data, 0, end)
+
+        while lineStart != -1:
+            lineEnd = data.find(b"\n", lineStart, end)
+            span = (self.offset + lineStart, self.offset + lineEnd)
+            error = self.parser.feedLine(decodeLine(data[lineStart:lineEnd]), span)
+            if error is not None:
+                errors.append(error)
+            lineStart = LogFollower.findMarker(data, lineEnd, end)
+
+
+    @staticmethod
+    def findMarker(data, position, end): # Integer
+        """Returns the offset of the first line in data[position:end] that
+        starts with '==', or -1 if there is none. 'position' is not the start
+        of a line.
+        """
+
+        markerStart = data.find(b"\n==", position, end)
+        if markerStart == -1:
+            return -1
+        return markerStart + 1
+
+
+    def finish(self): # ParsedError list
+        """Returns the errors that are still pending, as if the log had ended.
+        Only for when the log is known to be complete, the errors aren't
+        completed again by later polls.
+        """
+
+        return self.parser.finish()
+
+
+    def readSpan(self, span): # String
+        """Returns the raw text, all lines included, within the given byte span."""
+
+        start, end = span
+        self.fileHandle.seek(start)
+        return decodeLine(self.fileHandle.read(end - start))
+
+
+    def close(self): # None
+        self.fileHandle.close()
@@ -0,0 +1,129 @@
+"""
+Memory mapped, read-only access to a Valgrind log on disk.
+
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+import mmap
+import os
+
+
+def decodeLine(raw): # String
+    """Convert raw bytes read from a log to a string. In Python 2 the raw bytes
+    already are a string and are returned as is.
+    """
+
+    if isinstance(raw, str):
+        return raw
+    return raw.decode("utf-8", "replace")
+
+
+
+class MappedLog(object):
+    """A Valgrind log file mapped into memory. Iterating over a MappedLog yields
+    the lines of the log that start with the ==<number>== marker, i.e., the
+    Valgrind lines. Line boundaries and markers are found in the raw bytes, so
+    all other lines, usually the output of the program being run, are skipped
+    without ever being copied into Python strings.
+
+    The byte span of the most recently yielded line is available from
+    getLineSpan. ErrorParser uses this to record where in the log each error
+    is, so that the raw text of an error can be read back later with readSpan.
+    """
+
+    def __init__(self, path, start=0, end=None):
+        """Map the file at 'path'. Only lines within the byte range [start, end)
+        are iterated over. 'start' must be the first byte of a line.
+        @param path - string - Path to the log file.
+        @param start - integer - Offset of the first byte to iterate over.
+        @param end - integer - Offset one past the last byte to iterate over. None means the end of the file.
+        @raise EnvironmentError If the file cannot be opened or mapped.
+        """
+
+        self.path = path # String
+
+        self.fileHandle = open(path, "rb") # File
+        size = os.fstat(self.fileHandle.fileno()).st_size
+        if size > 0:
+            self.data = mmap.mmap(self.fileHandle.fileno(), 0, access=mmap.ACCESS_READ) # mmap
+        else:
+            ## Empty files cannot be mapped.
+            self.data = b""
+
+        self.start = start # Integer
+        self.end = size if end is None else min(end, size) # Integer
+
+        ## Byte span of the line most recently yielded by the iterator.
+        self.lineStart = None # Integer
+        self.lineEnd = None # Integer
+
+
+    def __len__(self): # Integer
+        """The size of the mapped file in bytes."""
+        return len(self.data)
+
+
+    def __iter__(self): # String iterator
+        """Yield the Valgrind lines within the byte range, in order. The newline
+        is not included. Only the lines that are yielded are decoded.
+        """
+
+        return self.iterateRange(self.start, self.end)
+
+
+    def iterateRange(self, start, end): # String iterator
+        """Yield the Valgrind lines within the byte range [start, end), which
+        need not be the range given to the constructor. 'start' must be the
+        first byte of a line.
+        """
+
+        data = self.data
+
+        lineStart = start
+        if data[lineStart:min(lineStart + 2, end)] != b"==":
+            lineStart = self.findMarker(lineStart, end)
+
+        while lineStart != -1:
+            lineEnd = data.find(b"\n", lineStart, end)
+            if lineEnd == -1:
+                lineEnd = end
+            self.lineStart = lineStart
+            self.lineEnd = lineEnd
+            yield decodeLine(data[lineStart:lineEnd])
+            lineStart = self.findMarker(lineEnd, end)
+
+
+    def findMarker(self, position, end=None): # Integer
+        """Returns the offset of the first line starting with '==' after the
+        given position, or -1 if there is no such line before 'end'. 'end'
+        defaults to the end of the byte range.
+        """
+
+        if end is None:
+            end = self.end
+        markerStart = self.data.find(b"\n==", position, end)
+        if markerStart == -1:
+            return -1
+        return markerStart + 1
+
+
+    def getLineSpan(self): # (Integer, Integer)
+        """Returns the byte span of the line most recently yielded by the
+        iterator. The span does not include the newline.
+        """
+
+        return (self.lineStart, self.lineEnd)
+
+
+    def readSpan(self, span): # String
+        """Returns the raw text, all lines included, within the given byte span."""
+
+        start, end = span
+        return decodeLine(self.data[start:end])
+
+
+    def close(self): # None
+        if not isinstance(self.data, bytes):
+            self.data.close()
+        self.fileHandle.close()
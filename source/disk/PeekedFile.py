@@ -0,0 +1,67 @@
+"""
+A file object whose first line has been read ahead.
+
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+
+class PeekedFile(object):
+    """Wraps a file object, such as sys.stdin, that cannot seek. The first line
+    is read when the PeekedFile is created and is available in 'head', so that
+    the format of the contents can be detected. Reading from the PeekedFile
+    returns the first line again, followed by the rest of the file.
+    """
+
+    def __init__(self, fileHandle):
+        self.fileHandle = fileHandle # File
+        self.head = fileHandle.readline() # String. The first line, including the newline.
+        self.pending = self.head # String. What is left of 'head' to be read.
+
+
+    def read(self, size=-1): # String
+        if len(self.pending) == 0:
+            return self.fileHandle.read(size)
+
+        if size < 0:
+            data = self.pending + self.fileHandle.read()
+            self.pending = ""
+            return data
+
+        ## Returning less than asked for is fine, the caller will read again.
+        data = self.pending[:size]
+        self.pending = self.pending[size:]
+        return data
+
+
+    def readline(self): # String
+        if len(self.pending) == 0:
+            return self.fileHandle.readline()
+
+        line = self.pending
+        self.pending = ""
+        return line
+
+
+    def __iter__(self): # String iterator
+        if len(self.pending) > 0:
+            line = self.pending
+            self.pending = ""
+            yield line
+
+        for line in self.fileHandle:
+            yield line
+
+
+    def close(self): # None
+        """Close the wrapped file."""
+        self.fileHandle.close()
+
+
+    def __enter__(self): # PeekedFile
+        return self
+
+
+    def __exit__(self, excType, excValue, traceback): # Boolean
+        self.close()
+        return False
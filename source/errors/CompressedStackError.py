@@ -0,0 +1,259 @@
+"""
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+import sys
+
+from SharedStackError import getNumOccurrences
+from Stack import Stack
+from Stack import StackFrame
+
+
+class CompressedStackError(object):
+    """A node of a path compressed call stack tree. Holds the same information
+    as the SharedStackError tree, with less memory and fewer nodes.
+
+    Call stacks are mostly long runs of frames that all errors below a point
+    share, e.g. from main down to where the program starts doing different
+    things. SharedStackError creates a node, with its own list of errors, for
+    every frame of such a run. Here a run of frames that would each have had a
+    single child and no ending errors is one node, covering the frames from
+    'firstFrame' up to, but not including, 'stackFramesShared'.
+
+    The errors of all nodes are kept in one array shared by the whole tree. It
+    is ordered so that the errors of every node are a contiguous range of it,
+    with the errors whose call stacks end at the node first. A node only holds
+    the bounds of its range.
+
+    The tree is created with 'build'. Like SharedStackError, a node's children
+    are created the first time they are asked for, and its counts, ending
+    errors and nearest source frame are known before that. Use
+    SharedStackError for trees that errors are added to.
+    """
+
+    ## There may be many nodes, keep them small.
+    __slots__ = ("errorArray", "start", "end", "numEnding", "firstFrame", "stackFramesShared", "direction",
+                 "childNodes", "numOccurrences", "leakedBytes", "leakedBlocks", "kindCounts", "sourceFrame")
+
+    def __init__(self, errorArray, start, end, firstFrame, stackFramesShared, direction):
+        """
+        @param errorArray - ParsedError list - The errors of the whole tree.
+        @param start - Integer - Index in 'errorArray' of the first error of the node.
+        @param end - Integer - Index in 'errorArray' after the last error of the node.
+        @param firstFrame - Integer - The index of the first stack frame of the run.
+        @param stackFramesShared - Integer - The number of stack frames that are equal among the node's errors.
+        @param direction - Either Stack.FROM_TOP or Stack.FROM_BOTTOM.
+        """
+
+        self.errorArray = errorArray  # ParsedError list. Shared by all nodes of the tree.
+        self.start = start  # Integer
+        self.end = end  # Integer
+
+        ## The number of errors, at the start of the range, whose call stacks
+        ## end at this node.
+        self.numEnding = 0  # Integer
+
+        ## The run of stack frames covered by the node. The root covers none.
+        self.firstFrame = firstFrame  # Integer
+        self.stackFramesShared = stackFramesShared  # Integer
+
+        self.direction = direction  # Integer. Either Stack.FROM_BOTTOM or Stack.FROM_TOP.
+
+        ## Ordered by number of reports. None until they are asked for, see 'children'.
+        self.childNodes = None  # CompressedStackError list.
+
+        ## Totals of the errors in the range, see setErrors.
+        self.numOccurrences = 0  # Integer
+        self.leakedBytes = 0  # Integer
+        self.leakedBlocks = 0  # Integer
+        self.kindCounts = {}  # ErrorKind -> Integer dictionary. The number of reports of each kind.
+
+        ## The nearest stack frame with a file name, at or above the location, or None.
+        self.sourceFrame = None  # StackFrame
+
+    @staticmethod
+    def build(errors, direction):  # CompressedStackError
+        """Create the root of the tree of the errors.
+        @param errors - ParsedError list - Not changed. The tree keeps a copy that is reordered as children are created.
+        @param direction - The side of the stack that is shared. Either Stack.FROM_TOP or Stack.FROM_BOTTOM.
+        """
+
+        errorArray = errors[:]
+        root = CompressedStackError(errorArray, 0, len(errorArray), 0, 0, direction)
+        root.setErrors(errorArray)
+        return root
+
+    def setErrors(self, errors):
+        """Write the errors of the node into its range, those whose call stacks
+        end at the node first, and set the totals of the node. Repetitions of a
+        leak that were collapsed into one error are the same memory, so each
+        error's leak is counted once.
+        """
+
+        ending = []
+        continuing = []
+        kindCounts = self.kindCounts
+        for error in errors:
+            self.numOccurrences += error.count
+            kindCounts[error.errorKind] = kindCounts.get(error.errorKind, 0) + error.count
+            if error.leak is not None:
+                self.leakedBytes += error.leak.bytes
+                self.leakedBlocks += error.leak.blocks
+            if error.errorStack.getNumFrames() == self.stackFramesShared:
+                ending.append(error)
+            else:
+                continuing.append(error)
+
+        self.numEnding = len(ending)
+        self.errorArray[self.start:self.start + len(ending)] = ending
+        self.errorArray[self.start + len(ending):self.end] = continuing
+
+    def findSourceFrame(self, parentSourceFrame):  # StackFrame
+        """Returns the nearest stack frame with a file name among the frames of
+        the run, from the location and back, or else 'parentSourceFrame'.
+        """
+
+        error = self.errorArray[self.start]
+        for index in range(self.stackFramesShared - 1, self.firstFrame - 1, -1):
+            frame = error.getStackFrame(index, self.direction)
+            if frame.fileName is not None:
+                return frame
+        return parentSourceFrame
+
+    @property
+    def children(self):  # CompressedStackError list
+        """The children of this node, created the first time they are asked for."""
+        if self.childNodes is None:
+            self.createChildren()
+        return self.childNodes
+
+    def hasChildNodes(self):  # Boolean
+        """True if the children have been created."""
+        return self.childNodes is not None
+
+    def createChildren(self):
+        """Reorder the node's range after the ending errors so that the errors of
+        each child come in order of first appearance, and create the children.
+        Each child's run is extended for as long as all its errors continue with
+        the same frame. Only the node's own range is reordered, so the ranges of
+        other nodes stay valid.
+        """
+
+        index = self.stackFramesShared
+        direction = self.direction
+        groups = {}  # StackFrame -> ParsedError list dictionary.
+        order = []  # StackFrame list. The frames in order of first appearance.
+        for error in self.errorArray[self.start + self.numEnding:self.end]:
+            frame = error.getStackFrame(index, direction)
+            group = groups.get(frame)
+            if group is None:
+                group = groups[frame] = []
+                order.append(frame)
+            group.append(error)
+
+        children = []
+        start = self.start + self.numEnding
+        for frame in order:
+            group = groups[frame]
+            end = start + len(group)
+            child = CompressedStackError(self.errorArray, start, end, index, CompressedStackError.extendRun(group, index + 1, direction), direction)
+            child.setErrors(group)
+            child.sourceFrame = child.findSourceFrame(self.sourceFrame)
+            children.append(child)
+            start = end
+
+        ## Stable, so children with as many reports keep their order of appearance.
+        children.sort(key=getNumOccurrences, reverse=True)
+        self.childNodes = children
+
+    @staticmethod
+    def extendRun(errors, index, direction):  # Integer
+        """Returns the index of the first stack frame, from 'index' and on, that
+        is not the same for all errors, or missing for some.
+        """
+
+        first = errors[0]
+        while True:
+            frame = first.getStackFrame(index, direction)
+            if frame is None:
+                return index
+            for error in errors:
+                other = error.getStackFrame(index, direction)
+                if other is not frame and other != frame:
+                    return index
+            index += 1
+
+    @property
+    def errors(self):  # ParsedError list
+        """The errors whose call stacks pass through this node, as a new list."""
+        return self.errorArray[self.start:self.end]
+
+    def getNumErrors(self):  # Integer
+        return self.end - self.start
+
+    def getEndingErrors(self):  # ParsedError list
+        """The errors whose call stacks end at this node."""
+        return self.errorArray[self.start:self.start + self.numEnding]
+
+    def getNumRunFrames(self):  # Integer
+        """The number of stack frames covered by this node."""
+        return self.stackFramesShared - self.firstFrame
+
+    def getRunFrames(self):  # StackFrame list
+        """The stack frames covered by this node, from the parent and on. The last one is the location."""
+        error = self.errorArray[self.start]
+        return [error.getStackFrame(index, self.direction) for index in range(self.firstFrame, self.stackFramesShared)]
+
+    def getLocation(self):  # StackFrame
+        """"""
+        if self.stackFramesShared > 0:
+            return self.errorArray[self.start].getStackFrame(self.stackFramesShared - 1, self.direction)
+        else:
+            leafLocation = StackFrame("")
+            if self.direction == Stack.FROM_BOTTOM:
+                leafLocation.method = "<Below main>"
+            else:
+                leafLocation.method = "<Stack top>"
+            return leafLocation
+
+    def getNearestSourceLocation(self, index=None):  # StackFrame
+        """The nearest stack frame with a file name, at or before the given index,
+        or the frame at the index if there is none.
+        @param index - Integer - Index of a stack frame of the run, or None for the location.
+        """
+        if index is None:
+            if self.sourceFrame is not None:
+                return self.sourceFrame
+            return self.getLocation()
+        if index >= 0:
+            error = self.errorArray[self.start]
+            location = error.getStackFrame(index, self.direction)
+            frame = location
+            while frame is not None and frame.fileName is None and index > 0:
+                index -= 1
+                frame = error.getStackFrame(index, self.direction)
+
+            if frame is not None and frame.fileName is not None:
+                return frame
+            else:
+                return location
+        else:
+            return self.getLocation()
+
+    def printTree(self, output=None):
+        """Print the tree like SharedStackError.printTree, one line per stack frame."""
+        if output is None:
+            output = sys.stdout
+        pending = [self]
+        while len(pending) > 0:
+            node = pending.pop()
+            if node.stackFramesShared == 0:
+                output.write(str(node.getLocation()) + "\n")
+            for depth, frame in enumerate(node.getRunFrames(), node.firstFrame + 1):
+                output.write(" " * depth + str(frame) + "\n")
+
+            for error in node.getEndingErrors():
+                output.write(" " * (node.stackFramesShared + 1) + str(error) + "\n")
+
+            pending.extend(reversed(node.children))
@@ -0,0 +1,55 @@
+"""
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+
+class LeakInfo(object):
+  """The sizes reported for a memory leak, i.e., for a ParsedError of kind
+  ErrorKind.MEMORY_LOSS. Read from a diagnostic line such as
+  "48 (16 direct, 32 indirect) bytes in 1 blocks are definitely lost in loss record 5 of 9".
+  """
+
+  __slots__ = ("bytes", "directBytes", "indirectBytes", "blocks", "category")
+
+  ## The loss categories of Memcheck.
+  DEFINITELY_LOST = "definitely lost"
+  INDIRECTLY_LOST = "indirectly lost"
+  POSSIBLY_LOST = "possibly lost"
+  STILL_REACHABLE = "still reachable"
+
+
+  def __init__(self, bytes, blocks, category, directBytes=None, indirectBytes=None):
+    """
+    \param bytes - Integer - The total number of bytes leaked.
+    \param blocks - Integer - The number of blocks the bytes were allocated in.
+    \param category - String - One of the loss category constants.
+    \param directBytes - Integer - Bytes pointed to by nothing. All bytes if not given.
+    \param indirectBytes - Integer - Bytes only pointed to from other leaked blocks. None if not given.
+    """
+
+    self.bytes = bytes # Integer
+    self.blocks = blocks # Integer
+    self.category = category # String
+    self.directBytes = directBytes if directBytes is not None else bytes # Integer
+    self.indirectBytes = indirectBytes if indirectBytes is not None else 0 # Integer
+
+
+  def getFields(self): # Tuple
+    return (self.bytes, self.blocks, self.category, self.directBytes, self.indirectBytes)
+
+
+  def __eq__(self, other): # Boolean
+    return isinstance(other, LeakInfo) and self.getFields() == other.getFields()
+
+
+  def __ne__(self, other): # Boolean
+    return not self == other
+
+
+  def __hash__(self): # Integer
+    return hash(self.getFields())
+
+
+  def __str__(self): # String
+    return str(self.bytes) + " bytes in " + str(self.blocks) + " blocks " + self.category
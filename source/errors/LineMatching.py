@@ -9,6 +9,215 @@ See LICENSE for licensing information.
 
 import re
 
+from LeakInfo import LeakInfo
+
+
+class ErrorKind(object):
+    """The kinds of Valgrind errors that Patterns can recognize. A kind is a
+    short name, the same for all errors of that kind regardless of sizes and
+    addresses in the Valgrind diagnostic line.
+    """
+
+    CONDITIONAL_JUMP_OR_MOVE = "ConditionalJumpOrMove"
+    INVALID_READ = "InvalidRead"
+    INVALID_WRITE = "InvalidWrite"
+    MISMATCHED_FREE = "MismatchedFree"
+    INVALID_FREE = "InvalidFree"
+    MEMORY_LOSS = "MemoryLoss"
+    USE_OF_UNINITIALISED_VALUE = "UseOfUninitialisedValue"
+    SYSCALL_PARAM = "SyscallParam"
+    NOT_STACKED_MALLOCED = "NotStackedMalloced"
+    OVERLAPPING_MEMCPY = "OverlappingMemcpy"
+
+    ## All kinds, in the order Patterns.classifyError tests them.
+    ALL = (
+        CONDITIONAL_JUMP_OR_MOVE,
+        INVALID_READ,
+        INVALID_WRITE,
+        MISMATCHED_FREE,
+        INVALID_FREE,
+        MEMORY_LOSS,
+        USE_OF_UNINITIALISED_VALUE,
+        SYSCALL_PARAM,
+        NOT_STACKED_MALLOCED,
+        OVERLAPPING_MEMCPY,
+    )
+
+
+def readNumber(text): # Integer
+    """Convert a number printed by Valgrind, which may contain thousands
+    separators such as in '1,048,576', to an integer.
+    """
+    return int(text.replace(",", "").replace(".", ""))
+
+
+## Characters allowed in the parts of a stack frame line. Shared by the stack
+## frame patterns and FrameTokenizer so that the two agree.
+methodCharacters = "[\w:=+*~&? \[\]<>.,]"
+argumentCharacters = "[\w ,:*<>()&]"
+fileCharacters = "[\w /.+-]"
+libraryCharacters = "[\w/.+-_]"
+
+
+class FrameTokenizer(object):
+    """Splits a stack frame line such as
+      at 0x400A10: Foo::set(int) const (errorProducingApplication.cpp:37)
+    into its parts by looking for the fixed markers between them; the 'at '
+    or 'by ' and the address, the ': ' after the address, the parentheses
+    around the arguments and the parentheses around the file and line number
+    or library. Every part is read with a single run of allowed characters.
+
+    The result is the same as that of Patterns.isAnyStackFrame, whose nested
+    optional groups backtrack for a long time on long C++ signatures. Where
+    the pattern would try several ways to split a line, the tokenizer follows
+    the pattern's order of preference but only looks at the few split points
+    that can succeed. Lines with unknown methods, '(?)', and lines with more
+    argument lists to try than MAX_ARGUMENT_LISTS are not handled, and the
+    pattern must be used for them.
+    """
+
+    ## The fields of a line that isn't a stack frame.
+    NO_FRAME = (None, None, None, None, None, None, None)
+
+    ## The number of possible argument lists tried before giving up on a line.
+    MAX_ARGUMENT_LISTS = 4
+
+    def __init__(self):
+        ## The address and method following a marker. Neither part can be
+        ## matched in more than one way, so this pattern never backtracks.
+        self.frameStart = re.compile("(0x[a-fA-F0-9]+): (?:(\(\?\))|((?:\(anonymous namespace\))?" + methodCharacters + "+))")
+
+        ## The first argument list the pattern would try, with the modifier and
+        ## the opening parenthesis of the location, and the usual 'file:line)'
+        ## location. Unlike the full pattern these only back off over a single
+        ## run of characters.
+        self.argumentList = re.compile("\(" + argumentCharacters + "*\) (\w*) ?\(")
+        self.fileAndLine = re.compile("(" + fileCharacters + "*\w):(\d+)\)")
+
+        self.wordRun = re.compile("\w*")
+        self.digitRun = re.compile("\d*")
+        self.argumentRun = re.compile(argumentCharacters + "*")
+        self.fileRun = re.compile(fileCharacters + "*")
+        self.libraryRun = re.compile(libraryCharacters + "*")
+
+
+    def isFrame(self, line, markers): # Boolean
+        """Test if the line contains one of the markers, 'at 0x' or 'by 0x',
+        followed by an address and a method. Gives the same result as matching
+        the corresponding stack frame pattern.
+        """
+
+        for marker in markers:
+            start = line.find(marker)
+            while start != -1:
+                if self.frameStart.match(line, start + 3) is not None:
+                    return True
+                start = line.find(marker, start + 1)
+
+        return False
+
+
+    def tokenize(self, line): # Tuple
+        """Split a stack frame line into its parts.
+        @return (address, method, arguments, modifier, fileName, lineNumber,
+                library), as the groups of Patterns.isAnyStackFrame, NO_FRAME if
+                the line isn't a stack frame, or None if the tokenizer can't
+                tell.
+        """
+
+        ## The pattern starts at the last marker followed by an address and a
+        ## method, since everything after the method is optional.
+        start = max(line.rfind("at 0x"), line.rfind("by 0x"))
+        while start != -1:
+            match = self.frameStart.match(line, start + 3)
+            if match is not None:
+                break
+            start = max(line.rfind("at 0x", 0, start + 4), line.rfind("by 0x", 0, start + 4))
+        if start == -1:
+            return FrameTokenizer.NO_FRAME
+        address, unknownMethod, method = match.groups()
+        if unknownMethod is not None:
+            return None
+        methodEnd = match.end()
+
+        ## The method includes trailing spaces, so what follows is either the
+        ## end of the line, the arguments, the location or something the
+        ## pattern ignores.
+        if not line.startswith("(", methodEnd):
+            return (address, method, None, None, None, None, None)
+
+        ## Arguments are followed by a space, an optional modifier and the
+        ## location. The pattern tries the longest argument list first, which
+        ## usually is the one to use.
+        match = self.argumentList.match(line, methodEnd)
+        if match is not None:
+            location = self.readLocation(line, match.end())
+            if location is not None:
+                return (address, method, line[methodEnd:match.start(1) - 1], match.group(1)) + location
+
+        argumentsEnd = self.argumentRun.match(line, methodEnd + 1).end()
+        close = line.rfind(")", methodEnd + 1, argumentsEnd)
+        numArgumentLists = 0
+        while close != -1:
+            if line.startswith(" ", close + 1):
+                numArgumentLists += 1
+                if numArgumentLists > FrameTokenizer.MAX_ARGUMENT_LISTS:
+                    return None
+                modifierEnd = self.wordRun.match(line, close + 2).end()
+                locationStart = modifierEnd + 1 if line.startswith(" ", modifierEnd) else modifierEnd
+                if line.startswith("(", locationStart):
+                    location = self.readLocation(line, locationStart + 1)
+                    if location is not None:
+                        return (address, method, line[methodEnd:close + 1], line[close + 2:modifierEnd]) + location
+            close = line.rfind(")", methodEnd + 1, close)
+
+        ## No arguments, only the location, if any.
+        location = self.readLocation(line, methodEnd + 1)
+        if location is None:
+            return (address, method, None, None, None, None, None)
+        return (address, method, None, None) + location
+
+
+    def readLocation(self, line, start): # (String, String, String)
+        """Read a location, 'file:line)' or 'in library)', at 'start'.
+        @return (fileName, lineNumber, library), or None if there is no location.
+        """
+
+        match = self.fileAndLine.match(line, start)
+        if match is not None and match.end(1) - start >= 3:
+            return (match.group(1), match.group(2), None)
+
+        ## A file name is a run of file name characters, any character and a
+        ## run of word characters, so the colon before the line number is
+        ## either where the file name characters end or right after the word
+        ## characters that follow.
+        fileNameEnd = self.fileRun.match(line, start).end()
+        if fileNameEnd > start and fileNameEnd < len(line):
+            colon = self.wordRun.match(line, fileNameEnd + 1).end()
+            if colon > fileNameEnd + 1 and line.startswith(":", colon):
+                location = self.readLineNumber(line, start, colon)
+                if location is not None:
+                    return location
+        if fileNameEnd - start >= 3 and line.startswith(":", fileNameEnd) and \
+           self.wordRun.match(line, fileNameEnd - 1).end() == fileNameEnd:
+            location = self.readLineNumber(line, start, fileNameEnd)
+            if location is not None:
+                return location
+
+        if not line.startswith("in ", start):
+            return None
+        libraryEnd = self.libraryRun.match(line, start + 3).end()
+        if libraryEnd == start + 3 or not line.startswith(")", libraryEnd):
+            return None
+        return (None, None, line[start + 3:libraryEnd])
+
+
+    def readLineNumber(self, line, start, colon): # (String, String, String)
+        lineNumberEnd = self.digitRun.match(line, colon + 1).end()
+        if lineNumberEnd == colon + 1 or not line.startswith(")", lineNumberEnd):
+            return None
+        return (line[start:colon], line[colon + 1:lineNumberEnd], None)
+
 
 class Patterns(object):
     """A collection of regular expressions that lines from the Valgrind log file can be matched against."""
@@ -46,22 +255,22 @@ class Patterns(object):
         anonNamespace = "\(anonymous namespace\)"
 
         unknownMethod = "\(\?\)+?"
-        properMethod = "(?P<method>(" + anonNamespace + ")?[\w:=+*~&? \[\]<>.,]+) ?"
+        properMethod = "(?P<method>(" + anonNamespace + ")?" + methodCharacters + "+) ?"
 
         # The name of the method containing the instruction.
         method = "(?:(?:" + unknownMethod + ")|(?:" + properMethod + "))"
 
         # Argument list for the method.
-        arguments = "(?P<arguments>(?:\([\w ,:*<>()&]*\))?) "
+        arguments = "(?P<arguments>(?:\(" + argumentCharacters + "*\))?) "
 
         # Any modifier, such as 'const', on the method.
         modifier = "(?P<modifier>[\w]*)? ?"
 
         # Source code location of the error.
-        fileAndLine = "(?P<fileName>[\w /.+-]+.\w+):(?P<lineNumber>\d+)"
+        fileAndLine = "(?P<fileName>" + fileCharacters + "+.\w+):(?P<lineNumber>\d+)"
 
         # Compiled unit (e.g. .so file) that contains the offending instruction.
-        library = "in (?P<library>[\w/.+-_]+)"
+        library = "in (?P<library>" + libraryCharacters + "+)"
 
         ## Valgrind seems to always print either the source file with line number
         ## or the file name of the compiled binary.
@@ -76,24 +285,38 @@ class Patterns(object):
         self.isStackFrameCaller = re.compile(".*by " + stackFrameShared)
         self.isAnyStackFrame = re.compile(".*(?:(?:at)|(?:by)) " + stackFrameShared)
 
+        ## The patterns above are only used for lines the tokenizer can't handle.
+        self.frameTokenizer = FrameTokenizer()
+
         ## Listing of Valgrind errors. This list may be incomplete. Errors not
         ## listed here will be ignored and hidden from the user.
-        conditionalJumpOrMove = ".*Conditional jump or move depends on uninitialised value\(s\)$"
-        self.isConditionalJumpOrMoveDependsOnUninitialisedValues = re.compile(conditionalJumpOrMove)
-        self.isInvalidRead = re.compile(".*Invalid read of size \d+$")
-        self.isInvalidWrite = re.compile(".*Invalid write of size \d+$")
-        self.isMissmatchedFreeDelete = re.compile(".*Mismatched free\(\) / delete / delete \[\]")
-        self.isInvalidFreeDelete = re.compile(".*Invalid free\(\) / delete / delete\[\] / realloc\(\)")
-        self.isNotStackedMalloced = re.compile(".*Address 0x[0-9A-F]+ is not stack'd, malloc'd or \(recently\) free'd")
-        self.isOverlappingMemcpy = re.compile(".*Source and destination overlap in memcpy")
-        print("Not stacked/malloced")
+        conditionalJumpOrMove = "Conditional jump or move depends on uninitialised value\(s\)$"
+        invalidRead = "Invalid read of size \d+$"
+        invalidWrite = "Invalid write of size \d+$"
+        missmatchedFreeDelete = "Mismatched free\(\) / delete / delete \[\]"
+        invalidFreeDelete = "Invalid free\(\) / delete / delete\[\] / realloc\(\)"
+        notStackedMalloced = "Address 0x[0-9A-F]+ is not stack'd, malloc'd or \(recently\) free'd"
+        overlappingMemcpy = "Source and destination overlap in memcpy"
+        self.isConditionalJumpOrMoveDependsOnUninitialisedValues = re.compile(".*" + conditionalJumpOrMove)
+        self.isInvalidRead = re.compile(".*" + invalidRead)
+        self.isInvalidWrite = re.compile(".*" + invalidWrite)
+        self.isMissmatchedFreeDelete = re.compile(".*" + missmatchedFreeDelete)
+        self.isInvalidFreeDelete = re.compile(".*" + invalidFreeDelete)
+        self.isNotStackedMalloced = re.compile(".*" + notStackedMalloced)
+        self.isOverlappingMemcpy = re.compile(".*" + overlappingMemcpy)
 
         directIndirec = "(?:\([\d,.]+ direct, [\d,.]+ indirect\))? ?"
         bytesBlocks = "bytes in [\d,.]+ blocks are "
         certainty = "(?:(?:possibly lost)|(?:definitely lost)|(?:still reachable)|(?:indirectly lost)) "
         record = "in loss record [\d,.]+ of [\d,.]+"
-        isMemoryLoss = ".*[\d,.]+ " + directIndirec + bytesBlocks + certainty + record
-        self.isMemoryLoss = re.compile(isMemoryLoss)
+        memoryLoss = "[\d,.]+ " + directIndirec + bytesBlocks + certainty + record
+        self.isMemoryLoss = re.compile(".*" + memoryLoss)
+
+        ## The same as isMemoryLoss, but with the numbers and the category captured.
+        self.readMemoryLoss = re.compile(
+          ".*?(?P<bytes>[\d,.]+) (?:\((?P<direct>[\d,.]+) direct, (?P<indirect>[\d,.]+) indirect\) )?" +
+          "bytes in (?P<blocks>[\d,.]+) blocks are (?P<category>possibly lost|definitely lost|still reachable|indirectly lost) " +
+          record)
 
         useUninit = "Use of uninitialised value of size [\d.,]+"
         self.isUseOfUninitialisedValue = re.compile(useUninit)
@@ -101,6 +324,25 @@ class Patterns(object):
         syscallParam = "Syscall param .* points to uninitialised byte\(s\)"
         self.isSyscallParam = re.compile(syscallParam)
 
+        ## Dispatch table for classifyError, in the order the patterns are
+        ## tested. Each entry holds a literal that every line matching the
+        ## pattern must contain, the ErrorKind and the pattern itself. Testing
+        ## for the literal with 'in' is much cheaper than running a regular
+        ## expression starting with '.*', so the full pattern is only run on the
+        ## few lines that contain the literal.
+        self.errorKinds = [
+          ("Conditional jump or move", ErrorKind.CONDITIONAL_JUMP_OR_MOVE, self.isConditionalJumpOrMoveDependsOnUninitialisedValues),
+          ("Invalid read of size", ErrorKind.INVALID_READ, self.isInvalidRead),
+          ("Invalid write of size", ErrorKind.INVALID_WRITE, self.isInvalidWrite),
+          ("Mismatched free()", ErrorKind.MISMATCHED_FREE, self.isMissmatchedFreeDelete),
+          ("Invalid free()", ErrorKind.INVALID_FREE, self.isInvalidFreeDelete),
+          ("bytes in ", ErrorKind.MEMORY_LOSS, self.isMemoryLoss),
+          ("Use of uninitialised value", ErrorKind.USE_OF_UNINITIALISED_VALUE, self.isUseOfUninitialisedValue),
+          ("Syscall param", ErrorKind.SYSCALL_PARAM, self.isSyscallParam),
+          ("is not stack'd", ErrorKind.NOT_STACKED_MALLOCED, self.isNotStackedMalloced),
+          ("overlap in memcpy", ErrorKind.OVERLAPPING_MEMCPY, self.isOverlappingMemcpy),
+        ]
+
         ## Listing of Valgrind sources. A source is a separate call stack to some
         ## memory operation (allocate or deallocate) that has some relation to the
         ## detected error. Each such call stack in the Valgrind log has a header
@@ -115,19 +357,84 @@ class Patterns(object):
         self.isHeapAllocation = re.compile(".*" + address + "[\d.,]+ bytes " + memoryLocation + block + memoryOperation)
         self.isArena = re.compile(".*" + address + "[\d.,]+ bytes " + memoryLocation + block + "in arena \"" + ".*" + "\"")
 
+    def splitValgrind(self, line):
+        """Split a Valgrind line into the process id in its ==<number>== marker
+        and the rest of the line with surrounding whitespace removed. Gives the
+        same result as isValgrind, readId and stripValgrind combined, but
+        scans the line only once and doesn't use regular expressions.
+        @return (string, string) tuple holding the process id and the payload, or None if 'line' isn't a Valgrind line.
+        """
+
+        if line[:2] != "==":
+            return None
+        markerEnd = line.find("== ", 2)
+        if markerEnd == -1:
+            return None
+        pid = line[2:markerEnd]
+        if not pid.isdigit():
+            return None
+        return (pid, line[markerEnd + 3:].strip())
+
     def isErrorStart(self, line):
         """Returns true if the given line matches a known Valgrind error."""
 
-        return  self.isConditionalJumpOrMoveDependsOnUninitialisedValues.match(line) is not None or \
-          self.isInvalidRead.match(line) is not None or \
-          self.isInvalidWrite.match(line) is not None or \
-          self.isMissmatchedFreeDelete.match(line) is not None or \
-          self.isInvalidFreeDelete.match(line) is not None or \
-          self.isMemoryLoss.match(line) is not None or \
-          self.isUseOfUninitialisedValue.match(line) is not None or \
-          self.isSyscallParam.match(line) is not None or \
-          self.isNotStackedMalloced.match(line) is not None or \
-          self.isOverlappingMemcpy.match(line) is not None
+        return self.classifyError(line) is not None
+
+    def classifyError(self, line):
+        """Returns the ErrorKind of the given line, or None if the line doesn't
+        match a known Valgrind error.
+        """
+
+        for literal, kind, pattern in self.errorKinds:
+            if literal in line and pattern.match(line) is not None:
+                return kind
+        return None
+
+    def readLeak(self, line): # LeakInfo
+        """Returns the sizes and loss category of a memory loss diagnostic line,
+        or None if the line isn't one.
+        """
+
+        match = self.readMemoryLoss.match(line)
+        if match is None:
+            return None
+
+        direct = match.group("direct")
+        indirect = match.group("indirect")
+        return LeakInfo(readNumber(match.group("bytes")),
+                        readNumber(match.group("blocks")),
+                        match.group("category"),
+                        readNumber(direct) if direct is not None else None,
+                        readNumber(indirect) if indirect is not None else None)
+
+    def isStackFrameTopLine(self, line): # Boolean
+        """Same as matching isStackFrameTop, without backtracking."""
+        return self.frameTokenizer.isFrame(line, ("at 0x",))
+
+    def isStackFrameCallerLine(self, line): # Boolean
+        """Same as matching isStackFrameCaller, without backtracking."""
+        return self.frameTokenizer.isFrame(line, ("by 0x",))
+
+    def isAnyStackFrameLine(self, line): # Boolean
+        """Same as matching isAnyStackFrame, without backtracking."""
+        return self.frameTokenizer.isFrame(line, ("at 0x", "by 0x"))
+
+    def readStackFrame(self, line): # Tuple
+        """Split a stack frame line into its parts. The tokenizer is used when
+        it can, the isAnyStackFrame pattern otherwise.
+        @return (address, method, arguments, modifier, fileName, lineNumber,
+                library) strings, each None if not part of the line. All None
+                if the line isn't a stack frame.
+        """
+
+        fields = self.frameTokenizer.tokenize(line)
+        if fields is not None:
+            return fields
+
+        match = self.isAnyStackFrame.match(line)
+        if match is None:
+            return FrameTokenizer.NO_FRAME
+        return match.group("address", "method", "arguments", "modifier", "fileName", "lineNumber", "library")
 
     def isSourceStart(self, line):
         """Returns true if the given line matches a known error source."""
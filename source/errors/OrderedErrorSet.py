@@ -0,0 +1,103 @@
+"""
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+
+class OrderedErrorSet(object):
+    """The errors of a SharedStackError node that errors are removed from. Reads
+    like the list of errors it was created from, in the same order, but an
+    error is removed without searching the list or moving the errors after it.
+
+    Removed errors leave a hole that iteration skips. The errors are moved
+    together again once there are as many holes as errors, so removing is
+    constant time on average. An error that was added more than once is
+    removed once, like from a list.
+    """
+
+    __slots__ = ("items", "positions", "size", "first")
+
+    def __init__(self, errors=[]):
+        """
+        @param errors - ParsedError list - The errors, in order. Copied.
+        """
+        self.items = []  # ParsedError list. None where an error was removed.
+        self.positions = {}  # ParsedError -> Integer list dictionary. Indices in 'items' of each error, in order.
+        self.size = 0  # Integer. The number of errors, not counting the holes.
+        self.first = 0  # Integer. No error in 'items' before this index.
+        for error in errors:
+            self.append(error)
+
+    def append(self, error):
+        positions = self.positions.get(error)
+        if positions is None:
+            self.positions[error] = [len(self.items)]
+        else:
+            positions.append(len(self.items))
+        self.items.append(error)
+        self.size += 1
+
+    def remove(self, error):
+        """Remove the first occurrence of the error.
+        @raise ValueError if the error is not in the set. The set is not changed.
+        """
+        positions = self.positions.get(error)
+        if positions is None:
+            raise ValueError("OrderedErrorSet.remove(x): x not in set")
+        self.items[positions.pop(0)] = None
+        if len(positions) == 0:
+            del self.positions[error]
+        self.size -= 1
+        if 2 * self.size <= len(self.items):
+            self.compact()
+
+    def compact(self):
+        """Close the holes left by removed errors."""
+        errors = [error for error in self.items if error is not None]
+        self.items = []
+        self.positions = {}
+        self.size = 0
+        self.first = 0
+        for error in errors:
+            self.append(error)
+
+    def __len__(self):  # Integer
+        return self.size
+
+    def __iter__(self):  # ParsedError iterator
+        for error in self.items:
+            if error is not None:
+                yield error
+
+    def __contains__(self, error):  # Boolean
+        return error in self.positions
+
+    def __getitem__(self, index):  # ParsedError, or ParsedError list for a slice
+        """The first error, asked for by every node for its location, is found
+        without closing the holes.
+        """
+        if isinstance(index, slice):
+            return list(self)[index]
+        if index == 0 and self.size > 0:
+            items = self.items
+            while items[self.first] is None:
+                self.first += 1
+            return items[self.first]
+        if self.size != len(self.items):
+            self.compact()
+        if not -self.size <= index < self.size:
+            raise IndexError("OrderedErrorSet index out of range")
+        return self.items[index]
+
+    def __eq__(self, other):  # Boolean
+        if not isinstance(other, (list, OrderedErrorSet)):
+            return False
+        return list(self) == list(other)
+
+    def __ne__(self, other):  # Boolean
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):  # String
+        return "OrderedErrorSet(" + repr(list(self)) + ")"
@@ -3,8 +3,26 @@ Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibb
 See LICENSE for licensing information.
 """
 
+import re
+
 from Stack import Stack
-from Stack import StackFrame
+from Stack import stackFrames
+
+
+## Hexadecimal addresses in diagnostic lines, e.g. "Address 0x5204068 is 0 bytes
+## after a block of size 40 alloc'd". They differ between runs and between
+## repeated reports of the same error.
+addressPattern = re.compile("0x[0-9A-Fa-f]+")
+
+
+def internString(string): # String
+  """Returns the interned copy of the given string. The same diagnostic lines
+  and process ids are repeated for many errors and only need to be stored once.
+  """
+
+  if type(string) is str:
+    return intern(string)
+  return string
 
 
 class ParsedError(object):
@@ -16,14 +34,26 @@ class ParsedError(object):
   Instances of this class are created and configured by the ErrorParser.
   """
 
+  ## There may be millions of errors, keep them small.
+  __slots__ = ("errorType", "errorKind", "pid", "errorStack", "sourceType", "sourceStack", "logSpan", "count", "leak")
 
-  def __init__(self, type):
+
+  def __init__(self, type, kind=None, pid=None):
     """ Create a new ParsedError with the given error type and empty call stacks.
     \param type - String - The Valgrind diagnostic line for this error.
+    \param kind - ErrorKind - The kind of error, as returned by Patterns.classifyError().
+    \param pid - String - The process id in the ==<number>== marker of the diagnostic line.
     """
     ## The Valgrind diagnostic line, i.e. , the first line printed for this error.
     ## Must match one of the patterns tested in Patterns.isErrorStart().
-    self.errorType = type # String
+    self.errorType = internString(type) # String
+
+    ## The ErrorKind that 'errorType' was classified as when the error was
+    ## parsed, so that the diagnostic line never has to be matched again.
+    self.errorKind = kind # ErrorKind
+
+    ## The process that reported the error.
+    self.pid = internString(pid) # String
 
     ## A Stack object pointing out the location where the error happened.
     self.errorStack = Stack() # Stack
@@ -34,8 +64,22 @@ class ParsedError(object):
     self.sourceType = None # String
 
     ## Call stack describing the location of the source event. Often the
-    ## location of a malloc/new or free/delete.
-    self.sourceStack = Stack() # Stack
+    ## location of a malloc/new or free/delete. Most errors don't have a source,
+    ## so the Stack is created when the source location is set. None until then.
+    self.sourceStack = None # Stack
+
+    ## Byte offsets of the first and one past the last character of this
+    ## error in the Valgrind log. Only known when the log was read through a
+    ## MappedLog or a LogFollower, None otherwise.
+    self.logSpan = None # (Integer, Integer)
+
+    ## The number of times this error was reported. Larger than one when
+    ## identical errors have been collapsed into this one, see ErrorCollapser.
+    self.count = 1 # Integer
+
+    ## The sizes of the leak, for errors of kind ErrorKind.MEMORY_LOSS. None
+    ## for all other errors.
+    self.leak = None # LeakInfo
 
 
 
@@ -65,6 +109,25 @@ class ParsedError(object):
 
 
 
+  def getDuplicateKey(self): # Tuple
+    """Returns a value that is equal for errors with the same diagnostic lines
+    and call stacks, ignoring addresses. Such errors are usually the same bug
+    being hit again and again.
+    """
+
+    if self.sourceType is not None:
+      sourceType = addressPattern.sub("0x", self.sourceType)
+    else:
+      sourceType = None
+    if self.sourceStack is not None:
+      sourceFrames = self.sourceStack.getFrameIds()
+    else:
+      sourceFrames = None
+
+    return (addressPattern.sub("0x", self.errorType), self.errorStack.getFrameIds(), sourceType, sourceFrames)
+
+
+
   def display(self): # None
     """Print a longer string representation of this error to standard output."""
     print(self.info())
@@ -83,7 +146,10 @@ class ParsedError(object):
   def info(self): # String
     """Return a longer string representation of this error."""
 
-    info  = "Type: " + self.errorType + "\n\n"
+    info  = "Type: " + self.errorType + "\n"
+    if self.count > 1:
+      info += "Reported " + str(self.count) + " times.\n"
+    info += "\n"
     info += "Location: " + "\n"
 
     for frame in self.errorStack.frames:
@@ -91,8 +157,9 @@ class ParsedError(object):
 
     if self.sourceType != None:
       info += "\nSource: " + self.sourceType + "\n"
-      for frame in self.sourceStack.frames:
-        info += "    " + str(frame) + "\n"
+      if self.sourceStack != None:
+        for frame in self.sourceStack.frames:
+          info += "    " + str(frame) + "\n"
 
     return info
 
@@ -114,6 +181,7 @@ class ParsedError(object):
       log += prefix + "    by " + caller.valgrindString() + "\n"
     if self.sourceType != None:
       log += prefix + "  " + self.sourceType + "\n"
+    if self.sourceStack != None:
       log += prefix + "    at " + self.sourceStack.getTop().valgrindString() + "\n"
       for caller in self.sourceStack.getCallers():
         log += prefix + "    by " + caller.valgrindString() + "\n"
@@ -129,7 +197,7 @@ class ParsedError(object):
     \param location - String - The first row of a Valgrind call stack print.
     """
 
-    self.errorStack.setLocation(StackFrame(location))
+    self.errorStack.setLocation(stackFrames.intern(location))
 
 
 
@@ -139,19 +207,30 @@ class ParsedError(object):
     \param location - String - A line from a Valgrind call stack print.
     """
 
-    self.errorStack.addCaller(StackFrame(location))
+    self.errorStack.addCaller(stackFrames.intern(location))
+
+
+
+  def setLogSpan(self, start, end): # None
+    """Record where in the Valgrind log this error was read from.
+    \param start - Integer - Byte offset of the start of the diagnostic line.
+    \param end - Integer - Byte offset of the end of the last line of the error.
+    """
+
+    self.logSpan = (start, end)
 
 
 
   def setSourceType(self, type): # None
-    self.sourceType = type;
+    self.sourceType = internString(type);
 
 
   def setSourceLocation(self, location): # None
-    self.sourceStack.setLocation(StackFrame(location))
+    self.sourceStack = Stack()
+    self.sourceStack.setLocation(stackFrames.intern(location))
 
 
   def addSourceCaller(self, location): # None
-    self.sourceStack.addCaller(StackFrame(location))
+    self.sourceStack.addCaller(stackFrames.intern(location))
 
 
@@ -3,41 +3,148 @@ Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibb
 See LICENSE for licensing information.
 """
 
+import sys
+
+from OrderedErrorSet import OrderedErrorSet
 from Stack import Stack
 from Stack import StackFrame
 
 
 def getNumErrors(sharedStackError):
-    """Returns the number of errors in a SharedStackError."""
-    return len(sharedStackError.errors)
+    """Returns the number of errors in a SharedStackError or CompressedStackError."""
+    return sharedStackError.getNumErrors()
+
+
+def getNumOccurrences(sharedStackError):
+    """Returns the number of times the errors in a SharedStackError were reported."""
+    return sharedStackError.numOccurrences
+
+
+def getLeakedBytes(sharedStackError):
+    """Returns the number of bytes leaked by the errors in a SharedStackError."""
+    return sharedStackError.leakedBytes
 
 
 class SharedStackError(object):
     """Represents a position in the call stack tree. Maintains a list of all errors
     whose call stack passes through that point.
+
+    Children are created the first time they are asked for, so only the parts of
+    the tree that are looked at are ever built. The counts of a node, the errors
+    that end at it and its nearest source frame are known as soon as it is
+    created.
     """
 
+    ## There may be many nodes, keep them small.
+    __slots__ = ("errors", "childNodes", "childrenByFrame", "stackFramesShared", "direction", "numOccurrences",
+                 "leakedBytes", "leakedBlocks", "kindCounts", "endingErrors", "sourceFrame")
+
     def __init__(self, errors, stackFramesShared, direction):
 
-        """Create a SharedStackError from the errors list. Will recursively create
-        its own children, so the entire tree is created with this SharedStackError
-        as the root.
-        @param errors - ParsedError list
+        """Create a SharedStackError from the errors list. It is the root of a
+        tree whose nodes are created when they are first asked for.
+        @param errors - ParsedError list - Copied, since insert adds to the list.
         @param stackFramesShared - Integer - The index of the stack frame that is known to be equal among all errors.
         @direction The side of the stack that is shared. Either Stack.FROM_TOP or Stack.FROM_BOTTOM.
         @precondition All stack frames with index < stackFramesShared are equal among all elements of 'errors'.
         """
 
+        self.initialize(errors[:], stackFramesShared, direction)
+
+    @staticmethod
+    def createNode(errors, stackFramesShared, direction, parent=None):  # SharedStackError
+        """Create a SharedStackError that keeps 'errors' as is, so it must be a
+        list made for the node.
+        @param parent - SharedStackError - The parent of the node, or None. Saves walking up the call stack for the nearest source frame.
+        """
+        node = SharedStackError.__new__(SharedStackError)
+        node.initialize(errors, stackFramesShared, direction, parent)
+        return node
+
+    @staticmethod
+    def createCountedNode(errors, stackFramesShared, direction, parent, numOccurrences, leakedBytes, leakedBlocks, kindCounts, endingErrors):  # SharedStackError
+        """Create a SharedStackError like createNode, but with the counts and the
+        ending errors already known, e.g. from a worker process of a
+        ParallelTreeBuilder, so that 'errors' isn't walked. The node gets an
+        empty list of children for the caller to add to.
+        """
+        node = SharedStackError.__new__(SharedStackError)
+        node.errors = errors
+        node.childNodes = []
+        node.childrenByFrame = None
+        node.stackFramesShared = stackFramesShared
+        node.direction = direction
+        node.numOccurrences = numOccurrences
+        node.leakedBytes = leakedBytes
+        node.leakedBlocks = leakedBlocks
+        node.kindCounts = kindCounts
+        node.endingErrors = endingErrors
+        node.sourceFrame = node.findSourceFrame(parent)
+        return node
+
+    @staticmethod
+    def createChain(error, parent):  # SharedStackError
+        """Create every node below 'parent' for an error that is the only one whose
+        call stack goes on there. That is one node per remaining stack frame, each
+        with only the error, so they are created without grouping or counting.
+        @return The first node of the chain. Not added to 'parent'.
+        """
+        direction = parent.direction
+        count = error.count
+        kind = error.errorKind
+        leak = error.leak
+        leakedBytes = leak.bytes if leak is not None else 0
+        leakedBlocks = leak.blocks if leak is not None else 0
+        frames = error.errorStack.frames
+        if direction == Stack.FROM_BOTTOM:
+            frames = frames[::-1]
+        sourceFrame = parent.sourceFrame
+
+        first = None
+        previous = None
+        for stackFramesShared in range(parent.stackFramesShared + 1, len(frames) + 1):
+            frame = frames[stackFramesShared - 1]
+            if frame.fileName is not None:
+                sourceFrame = frame
+            node = SharedStackError.__new__(SharedStackError)
+            node.errors = [error]
+            node.childNodes = []
+            node.childrenByFrame = None
+            node.stackFramesShared = stackFramesShared
+            node.direction = direction
+            node.numOccurrences = count
+            node.leakedBytes = leakedBytes
+            node.leakedBlocks = leakedBlocks
+            node.kindCounts = {kind: count}
+            node.endingErrors = []
+            node.sourceFrame = sourceFrame
+            if previous is None:
+                first = node
+            else:
+                previous.childNodes.append(node)
+            previous = node
+        previous.endingErrors.append(error)
+        return first
+
+    def initialize(self, errors, stackFramesShared, direction, parent=None):
+        """"""
+
         ## The Valgrind errors that has a call stack that passes through this
         ## point in the call stack tree. They all have the same call stack up to
         ## this point.
-        self.errors = errors[:]  # ParsedError list.
+        self.errors = errors  # ParsedError list, or OrderedErrorSet once an error has been removed.
 
         ## A list of SharedStackErrors representing the branches off of this stack
-        ## path. Each child's 'errors' list contains a subset of this
-        ## SharedStackError's 'errors' list, and each child's 'stackFramesShared'
-        ## is one greater that this SharedStackError's 'stackFramesShared'.
-        self.children = []  # SharedStackError list.
+        ## path, or None until they are asked for, see 'children'. Each child's
+        ## 'errors' list contains a subset of this SharedStackError's 'errors'
+        ## list, and each child's 'stackFramesShared' is one greater that this
+        ## SharedStackError's 'stackFramesShared'.
+        self.childNodes = None  # SharedStackError list.
+
+        ## The children keyed on the stack frame at index 'stackFramesShared' of
+        ## their errors, so that insert finds the child an error continues in
+        ## without comparing it to every sibling. None until first needed.
+        self.childrenByFrame = None  # StackFrame -> SharedStackError dictionary.
 
         ## The number of stack frames that are shared up to this point.
         self.stackFramesShared = stackFramesShared  # Integer
@@ -45,41 +152,283 @@ class SharedStackError(object):
         ## The side of the call stack that is shared.
         self.direction = direction  # Integer. Either Stack.FROM_BOTTOM or Stack.FROM_TOP.
 
-        self.createChildren()
-        self.children.sort(key=getNumErrors, reverse=True)
+        ## The number of times the errors were reported. Larger than the number
+        ## of errors if identical errors have been collapsed.
+        self.numOccurrences = 0  # Integer
 
-    def createChildren(self):
-        """"""
-        ## We will be picking a list apart, and don't want that list to be the instance variable.
-        consumableErrors = self.errors[:]
+        ## Totals of the leaks among 'errors'. Repetitions of a leak that were
+        ## collapsed into one error are the same memory, so each error's leak is
+        ## counted once.
+        self.leakedBytes = 0  # Integer
+        self.leakedBlocks = 0  # Integer
 
-        while len(consumableErrors) > 0:
-            pivot = consumableErrors[0]
-            errorsSharingStackWithPivot = [error for error in consumableErrors if
-                                            SharedStackError.shouldConsumeNow(error, pivot, self.stackFramesShared, self.direction)
-                                          ]
-            consumableErrors[:] = [error for error in consumableErrors if
-                                      SharedStackError.stillConsumable(error, pivot, self.stackFramesShared, self.direction)
-                                  ]
+        ## The number of times errors of each ErrorKind were reported.
+        self.kindCounts = {}  # ErrorKind -> Integer dictionary.
 
-            if len(errorsSharingStackWithPivot) > 0:
-                self.addChild(SharedStackError(errorsSharingStackWithPivot, self.stackFramesShared + 1, self.direction))
+        ## The errors whose call stacks end at this point, in the order of 'errors'.
+        self.endingErrors = []  # ParsedError list, or OrderedErrorSet once an error has been removed.
 
-    @staticmethod
-    def shouldConsumeNow(error, pivot, stackFramesShared, direction):
-        """"""
-        return error.hasSameStackFrameAs(pivot, stackFramesShared, direction)
+        ## There is a loop like this for every node created, so it uses locals.
+        numOccurrences = 0
+        kindCounts = self.kindCounts
+        endingErrors = self.endingErrors
+        for error in errors:
+            count = error.count
+            numOccurrences += count
+            kind = error.errorKind
+            kindCounts[kind] = kindCounts.get(kind, 0) + count
+            leak = error.leak
+            if leak is not None:
+                self.leakedBytes += leak.bytes
+                self.leakedBlocks += leak.blocks
+            if len(error.errorStack.frames) == stackFramesShared:
+                endingErrors.append(error)
+        self.numOccurrences = numOccurrences
 
-    @staticmethod
-    def stillConsumable(error, pivot, stackFramesShared, direction):
-        """"""
-        wasJustConsumed = SharedStackError.shouldConsumeNow(error, pivot, stackFramesShared, direction)
-        isOutOfStack = error.getStackFrame(stackFramesShared, direction) is None
-        return not wasJustConsumed and not isOutOfStack
+        ## The nearest stack frame with a file name, at or above this point, or None.
+        self.sourceFrame = self.findSourceFrame(parent)  # StackFrame
+
+    def findSourceFrame(self, parent):  # StackFrame
+        """Returns the nearest stack frame with a file name, from the location and
+        up towards the root, or None. Below 'parent' that is the location or the
+        parent's source frame.
+        """
+        if self.stackFramesShared == 0 or len(self.errors) == 0:
+            return None
+        stack = self.errors[0].errorStack
+        index = self.stackFramesShared - 1
+        frame = stack.getFrame(index, self.direction)
+        if frame.fileName is not None:
+            return frame
+        if parent is not None:
+            return parent.sourceFrame
+        while index > 0:
+            index -= 1
+            frame = stack.getFrame(index, self.direction)
+            if frame.fileName is not None:
+                return frame
+        return None
+
+    def countError(self, error, number):
+        """Add reports of an error to the counts of the node, or subtract them if 'number' is negative."""
+        self.numOccurrences += number
+        numKind = self.kindCounts.get(error.errorKind, 0) + number
+        if numKind != 0:
+            self.kindCounts[error.errorKind] = numKind
+        else:
+            del self.kindCounts[error.errorKind]
+
+    @property
+    def children(self):  # SharedStackError list
+        """The children of this node, created the first time they are asked for."""
+        if self.childNodes is None:
+            self.createChildren()
+        return self.childNodes
+
+    def hasChildNodes(self):  # Boolean
+        """True if the children have been created."""
+        return self.childNodes is not None
+
+    def createChildren(self):
+        """Create one child per distinct stack frame at index 'stackFramesShared'.
+        The errors are grouped in a single pass, keyed on the frame, and the
+        children are created in order of first appearance so that the sort by
+        number of reports keeps that order among equals. Errors whose call
+        stacks end at this node are not passed on to any child.
+        """
+        groups = {}  # StackFrame -> ParsedError list dictionary.
+        order = []  # StackFrame list. The frames in order of first appearance.
+        for error in self.errors:
+            frame = error.getStackFrame(self.stackFramesShared, self.direction)
+            if frame is None:
+                continue
+            group = groups.get(frame)
+            if group is None:
+                group = groups[frame] = []
+                order.append(frame)
+            group.append(error)
+
+        self.childNodes = [SharedStackError.createNode(groups[frame], self.stackFramesShared + 1, self.direction, self) for frame in order]
+        self.childNodes.sort(key=getNumOccurrences, reverse=True)
+
+    def createTree(self):
+        """Create every node below this one now, instead of when they are asked for."""
+        pending = [self]
+        while len(pending) > 0:
+            pending.extend(pending.pop().children)
 
     def addChild(self, child):
-        """"""
-        self.children.append(child)
+        """Add a child, placed after the children with at least as many reports."""
+        children = self.children
+        children.append(child)
+        if self.childrenByFrame is not None:
+            self.childrenByFrame[child.getLocation()] = child
+        self.reorderChild(len(children) - 1)
+
+    def removeChild(self, index, error):
+        """Remove the child at 'index', whose call stack continues like the error's."""
+        del self.childNodes[index]
+        if self.childrenByFrame is not None:
+            del self.childrenByFrame[error.getStackFrame(self.stackFramesShared, self.direction)]
+
+    def reorderChild(self, index):
+        """Move the child at 'index', whose number of reports has changed, to
+        where it belongs among its siblings ordered by number of reports. Only
+        the siblings it passes are moved, so the children are never re-sorted.
+        A child never passes a sibling with as many reports.
+        """
+        children = self.childNodes
+        child = children[index]
+        numOccurrences = child.numOccurrences
+        position = index
+        while position > 0 and children[position - 1].numOccurrences < numOccurrences:
+            position -= 1
+        if position == index:
+            while position + 1 < len(children) and children[position + 1].numOccurrences > numOccurrences:
+                position += 1
+        if position != index:
+            del children[index]
+            children.insert(position, child)
+
+    def findChildIndex(self, error):  # Integer
+        """Returns the index of the child whose call stack continues like the error's, or -1."""
+        child = self.findChild(error)
+        return self.childNodes.index(child) if child is not None else -1
+
+    def findChild(self, error):  # SharedStackError
+        """Returns the child whose call stack continues like the error's, or None."""
+        childrenByFrame = self.childrenByFrame
+        if childrenByFrame is None:
+            childrenByFrame = self.childrenByFrame = dict([(child.getLocation(), child) for child in self.children])
+        return childrenByFrame.get(error.getStackFrame(self.stackFramesShared, self.direction))
+
+    def insert(self, error):  # SharedStackError list
+        """Add an error to the tree that has this SharedStackError as root, without
+        rebuilding the tree. The error is added to every node along its call stack
+        and a new branch is created where its call stack leaves the existing tree.
+        The nodes that get more reports are moved forward among their siblings,
+        and a new branch is placed after the children with as many reports, so
+        the children stay ordered by number of reports. Below nodes whose
+        children have not been created nothing needs to be done, the error is
+        included when they are.
+        @param error - ParsedError - The error to add.
+        @return The nodes whose 'errors' changed, in order from this node and
+                down the error's call stack. If the error created a new branch
+                then the last node is the root of that branch.
+        """
+        changedNodes = []
+        parent = None
+        index = -1
+        node = self
+        while True:
+            node.errors.append(error)
+            node.countError(error, error.count)
+            if error.leak is not None:
+                node.leakedBytes += error.leak.bytes
+                node.leakedBlocks += error.leak.blocks
+            changedNodes.append(node)
+            if parent is not None:
+                parent.reorderChild(index)
+            if error.getStackFrame(node.stackFramesShared, node.direction) is None:
+                node.endingErrors.append(error)
+                return changedNodes
+            if node.childNodes is None:
+                return changedNodes
+
+            index = node.findChildIndex(error)
+            if index == -1:
+                child = SharedStackError.createNode([error], node.stackFramesShared + 1, node.direction, node)
+                node.addChild(child)
+                changedNodes.append(child)
+                return changedNodes
+            parent = node
+            node = node.childNodes[index]
+
+    def remove(self, error):  # SharedStackError list
+        """Remove an error from the tree that has this SharedStackError as root,
+        without rebuilding the tree. The error is removed from every node along
+        its call stack and a branch that is left without errors is removed from
+        its parent. The nodes that get fewer reports are moved back among their
+        siblings, so the children stay ordered by number of reports. The
+        errors of a node are made an OrderedErrorSet the first time one is
+        removed from it, so that later removes don't search them.
+        @param error - ParsedError - An error in the tree. An error that was
+               inserted more than once is removed once.
+        @return The nodes whose 'errors' changed, in order from this node and
+                down the error's call stack. If the error was the last of a
+                branch then the last node is the root of that branch, which is
+                no longer in the tree.
+        @raise ValueError if the error is not in the tree. The tree is not changed.
+        """
+        changedNodes = []
+        parent = None
+        index = -1
+        node = self
+        while True:
+            if not isinstance(node.errors, OrderedErrorSet):
+                node.errors = OrderedErrorSet(node.errors)
+            node.errors.remove(error)
+            node.countError(error, -error.count)
+            if error.leak is not None:
+                node.leakedBytes -= error.leak.bytes
+                node.leakedBlocks -= error.leak.blocks
+            changedNodes.append(node)
+            if parent is not None:
+                if len(node.errors) == 0:
+                    parent.removeChild(index, error)
+                    return changedNodes
+                parent.reorderChild(index)
+            if error.getStackFrame(node.stackFramesShared, node.direction) is None:
+                if not isinstance(node.endingErrors, OrderedErrorSet):
+                    node.endingErrors = OrderedErrorSet(node.endingErrors)
+                node.endingErrors.remove(error)
+                return changedNodes
+            if node.childNodes is None:
+                return changedNodes
+
+            parent = node
+            index = node.findChildIndex(error)
+            node = node.childNodes[index]
+
+    def addOccurrences(self, error, number):  # SharedStackError list
+        """Record that an error already in the tree has been reported more times,
+        e.g. because a duplicate of it was collapsed into it. The nodes along the
+        error's call stack are moved forward among their siblings as needed.
+        @param error - ParsedError - An error in the tree that has this SharedStackError as root.
+        @param number - Integer - The number of new reports.
+        @return The nodes along the error's call stack, from this node and down
+                to the first node whose children have not been created.
+        """
+        changedNodes = []
+        parent = None
+        index = -1
+        node = self
+        while True:
+            node.countError(error, number)
+            changedNodes.append(node)
+            if parent is not None:
+                parent.reorderChild(index)
+            if error.getStackFrame(node.stackFramesShared, node.direction) is None or node.childNodes is None:
+                return changedNodes
+
+            index = node.findChildIndex(error)
+            if index == -1:
+                return changedNodes
+            parent = node
+            node = node.childNodes[index]
+
+    def getNumErrors(self):  # Integer
+        return len(self.errors)
+
+    def getEndingErrors(self):  # ParsedError list
+        """The errors whose call stacks end at this node. Not to be changed."""
+        return self.endingErrors
+
+    def getNumRunFrames(self):  # Integer
+        """The number of stack frames covered by this node. Always one, except
+        for the root. See CompressedStackError.
+        """
+        return 1 if self.stackFramesShared > 0 else 0
 
     def getLocation(self):  # StackFrame
         """"""
@@ -94,28 +443,26 @@ class SharedStackError(object):
             return leafLocation
 
     def getNearestSourceLocation(self):  # StackFrame
-        """"""
-        if self.stackFramesShared > 0:
-            index = self.stackFramesShared - 1
-            frame = self.errors[0].getStackFrame(index, self.direction)
-            while frame is not None and frame.fileName is None and index > 0:
-                index -= 1
-                frame = self.errors[0].getStackFrame(index, self.direction)
-
-            if frame is not None and frame.fileName is not None:
-                return frame
-            else:
-                return self.getLocation()
+        """The nearest stack frame with a file name, or the location if there is none."""
+        if self.sourceFrame is not None:
+            return self.sourceFrame
         else:
             return self.getLocation()
 
-    def printTree(self, depth=0):
-        """"""
-        print(" " * depth + str(self.getLocation()))
+    def printTree(self, output=None):
+        """Print the tree, one node per line indented by its depth, followed by
+        the errors whose call stacks end at the node.
+        @param output - File - Where the tree is printed. Defaults to standard out.
+        """
+        if output is None:
+            output = sys.stdout
+        pending = [self]
+        while len(pending) > 0:
+            node = pending.pop()
+            depth = node.stackFramesShared
+            output.write(" " * depth + str(node.getLocation()) + "\n")
 
-        for error in self.errors:
-            if len(error.errorStack.frames) == depth:
-                print(" " * (depth + 1) + str(error))
+            for error in node.endingErrors:
+                output.write(" " * (depth + 1) + str(error) + "\n")
 
-        for child in self.children:
-            child.printTree(depth + 1)
+            pending.extend(reversed(node.children))
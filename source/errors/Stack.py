@@ -12,7 +12,15 @@ from LineMatching import Patterns
 patterns = Patterns()
 
 class StackFrame(object):
-  """A single stack frame within a call stack. Knows where in the applicaion it is."""
+  """A single stack frame within a call stack. Knows where in the applicaion it is.
+
+  Stack frames read from a Valgrind log should be created with
+  StackFrameTable.intern, so that each distinct frame line is only parsed once
+  and shared by all stacks it appears in.
+  """
+
+  ## There are many stack frames, keep them small.
+  __slots__ = ("id", "hashValue", "key", "address", "method", "arguments", "modifier", "fileName", "lineNumber", "library")
 
 
 
@@ -21,6 +29,13 @@ class StackFrame(object):
     \param line - String
     """
 
+    ## Set by StackFrameTable.intern. Interned frames with the same id represent
+    ## the same method, see __eq__, and 'key' is the line the frame was created
+    ## from with everything before the address removed.
+    self.id = None # Integer
+    self.hashValue = None # Integer
+    self.key = None # String
+
     self.address = None # String
     self.method = None # String
     self.arguments = None # String
@@ -30,15 +45,9 @@ class StackFrame(object):
     self.library = None # String
 
 
-    match = patterns.isAnyStackFrame.match(line)
-    if match != None:
-      self.fileName = match.group('fileName')
-      self.lineNumber = match.group('lineNumber')
-      self.library = match.group('library')
-      self.modifier = match.group('modifier')
-      self.address = match.group('address')
-      self.method = match.group('method')
-      self.arguments = match.group('arguments')
+    self.address, self.method, self.arguments, self.modifier, self.fileName, lineNumber, self.library = patterns.readStackFrame(line)
+    if lineNumber is not None:
+      self.lineNumber = int(lineNumber)
 
 
 
@@ -48,7 +57,7 @@ class StackFrame(object):
     """
 
     if self.fileName != None and self.lineNumber != None:
-      return self.fileName + ":" + self.lineNumber
+      return self.fileName + ":" + str(self.lineNumber)
     elif self.fileName != None:
       return self.fileName
     elif self.library != None and self.address != None:
@@ -92,7 +101,7 @@ class StackFrame(object):
     if self.fileName != None and self.lineNumber != None:
       valgrindString += self.fileName
       valgrindString += ":"
-      valgrindString += self.lineNumber
+      valgrindString += str(self.lineNumber)
     else:
       valgrindString += "in "
       valgrindString += self.library
@@ -102,13 +111,30 @@ class StackFrame(object):
 
 
 
+  def getFields(self): # Tuple
+    """All parsed parts of the stack frame, in the order restoreFrame expects them."""
+    return (self.address, self.method, self.arguments, self.modifier, self.fileName, self.lineNumber, self.library)
+
+
+
+  def getContent(self): # Tuple
+    """The parts of the stack frame that are compared by __eq__."""
+    return (self.method, self.arguments, self.fileName, self.lineNumber, self.library)
+
+
+
   def __eq__(self, other): # Boolean
     """Test if two StackFrames represents the same method. Instruction address
     is not included in the comparison.
     """
 
+    if self is other:
+      return True
+
     ### \todo Should perhaps look at address if 'library' is the only not-None member.
     if type(other) is type(self):
+      if self.id is not None and other.id is not None:
+        return self.id == other.id
       return self.method == other.method and \
              self.arguments == other.arguments and \
              self.fileName == other.fileName and \
@@ -125,11 +151,134 @@ class StackFrame(object):
 
 
 
+  def __hash__(self): # Integer
+    if self.hashValue is not None:
+      return self.hashValue
+    return hash(self.getContent())
+
+
+
+  def __reduce_ex__(self, protocol): # Tuple
+    """Interned stack frames are interned again when unpickled, e.g. when sent
+    from a worker process, so that their ids are valid in the receiving process.
+    """
+
+    if self.key is None:
+      return object.__reduce_ex__(self, 2) # Protocol 2 knows how to pickle __slots__.
+    return (restoreFrame, (self.key, self.getFields()))
+
+
+
+class StackFrameTable(object):
+  """Intern table for StackFrames. The same stack frame lines are repeated over
+  and over in a Valgrind log, main and the thread entry points are part of
+  almost every call stack. The table parses each distinct line once and hands
+  out the same StackFrame object every time the line is seen again.
+
+  Lines are keyed on the text from the instruction address onwards, so 'at' and
+  'by' lines share frames. Frames for different addresses are different objects
+  but are given the same id, and hash, when they represent the same method.
+  """
+
+  def __init__(self):
+    self.frames = {} # String -> StackFrame dictionary. Keyed on the line from the address onwards.
+    self.contentIds = {} # Tuple -> Integer dictionary. Frame id for each distinct StackFrame.getContent().
+    self.nextId = 0 # Integer. Never reset, so that ids are not reused after clear.
+
+
+
+  def intern(self, line): # StackFrame
+    """Returns the StackFrame for the given Valgrind stack frame line.
+    \param line - String - A line for which Patterns.isAnyStackFrameLine is true.
+    """
+
+    addressStart = line.find(" 0x")
+    if addressStart == -1:
+      return StackFrame(line) # Not a stack frame we know how to key. Don't intern.
+
+    return self.internKey(line[addressStart + 1:])
+
+
+
+  def internKey(self, key): # StackFrame
+    frame = self.frames.get(key)
+    if frame is not None:
+      return frame
+
+    ## The pattern picks the last 'at ' or 'by ' that makes the line match, so
+    ## the fields do not depend on what came before the address.
+    return self.internFrame(key, StackFrame("at " + key))
+
+
+
+  def internFrame(self, key, frame): # StackFrame
+    """Returns the frame already interned for 'key', or interns 'frame' for it.
+    Used for frames that are not parsed from a Valgrind text line, such as
+    those read by XmlErrorParser. 'key' should be what the text line would have
+    been from the address onwards.
+    """
+
+    interned = self.frames.get(key)
+    if interned is not None:
+      return interned
+
+    frame.key = key
+    content = frame.getContent()
+    frameId = self.contentIds.get(content)
+    if frameId is None:
+      frameId = self.contentIds[content] = self.nextId
+      self.nextId += 1
+    frame.id = frameId
+    frame.hashValue = hash(content)
+
+    self.frames[key] = frame
+    return frame
+
+
+
+  def __len__(self): # Integer
+    """The number of distinct stack frame lines seen."""
+    return len(self.frames)
+
+
+
+  def clear(self): # None
+    """Forget all interned frames. Frames handed out earlier stay valid, but will
+    not compare equal by id to frames interned afterwards.
+    """
+
+    self.frames.clear()
+    self.contentIds.clear()
+
+
+
+stackFrames = StackFrameTable()
+
+
+def restoreFrame(key, fields): # StackFrame
+  """Create a StackFrame from the fields saved by __reduce_ex__ or by
+  ErrorCache. The frame is interned, unless 'key' is None.
+  """
+
+  frame = stackFrames.frames.get(key)
+  if frame is not None:
+    return frame
+
+  frame = StackFrame("")
+  frame.address, frame.method, frame.arguments, frame.modifier, frame.fileName, frame.lineNumber, frame.library = fields
+  if key is None:
+    return frame
+  return stackFrames.internFrame(key, frame)
+
+
+
 
 
 class Stack(object):
   """An ordered list of stack frames."""
 
+  __slots__ = ("frames",)
+
 
   # Towards main.
   FROM_TOP = 1 # The top of the stack is the stack frame where the errored happened.
@@ -168,6 +317,15 @@ class Stack(object):
     return len(self.frames)
 
 
+  def getFrameIds(self): # Tuple
+    """Returns a value that is equal for stacks whose frames represent the same
+    methods, regardless of the addresses. Uses the ids of interned frames, and
+    the contents of frames that weren't interned.
+    """
+
+    return tuple([frame.id if frame.id is not None else frame.getContent() for frame in self.frames])
+
+
 
   def getFrame(self, index, direction):
     if index >= len(self.frames):
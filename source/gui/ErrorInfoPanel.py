@@ -5,6 +5,9 @@ See LICENSE for licensing information.
 
 import wx
 
+from errors.LineMatching import ErrorKind
+from errors.SharedStackError import getNumErrors
+
 
 class ErrorInfoPanel(wx.Panel):
     """"""
@@ -19,10 +22,24 @@ class ErrorInfoPanel(wx.Panel):
         sizer.Add(self.text, 1, wx.EXPAND)
         self.SetSizer(sizer)
 
-    def display(self, error):
-        """"""
+    def display(self, error, logText=None):
+        """Show the given ParsedError. If 'logText', the raw text of the error
+        in the Valgrind log, is given then it is shown below the error info.
+        """
         self.clear()
         self.text.write(error.info())
+        if logText is not None:
+            self.text.write("\nValgrind log:\n" + logText)
+
+    def displayNode(self, errorTreeNode):
+        """Show the number of reports of each kind of error that passes through
+        a node of an error tree.
+        """
+        self.clear()
+        self.text.write(str(getNumErrors(errorTreeNode)) + " errors reported " + str(errorTreeNode.numOccurrences) + " times.\n")
+        for kind in ErrorKind.ALL:
+            if kind in errorTreeNode.kindCounts:
+                self.text.write("  " + kind + ": " + str(errorTreeNode.kindCounts[kind]) + "\n")
 
     def clear(self):
         """"""
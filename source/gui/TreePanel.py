@@ -6,8 +6,10 @@ See LICENSE for licensing information.
 
 import wx
 
+from errors.SharedStackError import getLeakedBytes
+
 class TreeItemData(object):
-  def __init__(self, stackFrame, nearestSourceStackFrame, parsedError):
+  def __init__(self, stackFrame, nearestSourceStackFrame, parsedError, errorTreeNode=None):
     """Information stored at each node of the error tree. Holds the current stack
     frame, the closest stack frame with source code information, and the error, if
     a single error passed through this node in the tree.
@@ -15,53 +17,393 @@ class TreeItemData(object):
     self.stackFrame = stackFrame
     self.nearestSourceStackFrame = nearestSourceStackFrame ## May be same as stackFrame.
     self.parsedError = parsedError ## May be None.
+    self.errorTreeNode = errorTreeNode ## The error tree node of the GUI node. None for error leaves.
+
+
+
+class ErrorTreeCtrl(wx.TreeCtrl):
+  """A wx.TreeCtrl whose items are sorted by the ranks that TreePanel gives
+  their item data just before sorting.
+  """
+
+  def __init__(self, parent):
+    wx.TreeCtrl.__init__(self, parent)
+    self.ranks = {} # TreeItemData -> Tuple. The rank of each item being sorted.
+
+  def OnCompareItems(self, item1, item2):
+    return cmp(self.ranks[self.GetItemPyData(item1)], self.ranks[self.GetItemPyData(item2)])
 
 
 
 class TreePanel(wx.Panel):
-  """A GUI widget that displays a call graph tree."""
+  """A GUI widget that displays a call graph tree.
 
-  def __init__(self, parent, errorFromBottom, errorFromTop):
+  The GUI nodes below a node are added the first time it is expanded, so only
+  the parts of the error trees that the user looks at are ever created.
+
+  The error trees may be SharedStackErrors or CompressedStackErrors. A
+  compressed node that covers a run of several stack frames is shown as a
+  single GUI node, titled with the last frame of the run, until it is
+  activated, e.g. double clicked. It is then replaced by one GUI node per
+  frame.
+  """
+
+  def __init__(self, parent, processTrees, sortByLeaks=False):
+    """
+    @param processTrees - (string, SharedStackError, SharedStackError) list - The
+           process id and the error trees, from bottom and from top, of each
+           process to show. With more than one process each gets its own node.
+    @param sortByLeaks - boolean - Order the children of each node by leaked
+           bytes instead of by number of errors.
+    """
     wx.Panel.__init__(self, parent=parent)
 
-    self.tree = wx.TreeCtrl(self)
+    self.tree = ErrorTreeCtrl(self)
     self.callback = None
+    self.sortByLeaks = sortByLeaks
+
+    self.processTrees = [] # (string, SharedStackError, SharedStackError) list.
+    self.processIndices = {} # String -> Integer. Index in 'processTrees' of each process id.
+    self.processNodes = {} # String -> tree item. The GUI node of each process, if there is more than one.
+    self.treeItems = {} # SharedStackError -> tree item. The GUI node of every error tree node.
+    self.errorItems = {} # ParsedError -> tree item list. The GUI leaves of every error.
+    self.expandedRuns = set() # CompressedStackError set. Runs shown with one GUI node per frame.
+    self.populatedNodes = set() # SharedStackError set. Error tree nodes whose GUI children have been added.
 
     self.treeRoot = self.tree.AddRoot("Errors")
-    self.appendToTree(self.treeRoot, errorFromBottom, 0)
-    self.appendToTree(self.treeRoot, errorFromTop, 0)
+    for pid, errorFromBottom, errorFromTop in processTrees:
+      self.processIndices[pid] = len(self.processTrees)
+      self.processTrees.append((pid, errorFromBottom, errorFromTop))
+    self.buildTree()
+    self.tree.Bind(wx.EVT_TREE_ITEM_ACTIVATED, self.itemActivated)
+    self.tree.Bind(wx.EVT_TREE_ITEM_EXPANDING, self.itemExpanding)
 
     sizer = wx.BoxSizer(wx.VERTICAL)
     sizer.Add(self.tree, 1, flag=wx.EXPAND)
     self.SetSizer(sizer)
 
 
-  def appendToTree(self, guiTreeNode, errorTreeNode, depth): # None
-    """Recursively build the GUI tree from the error tree.
+  def buildTree(self): # None
+    """Build the GUI tree for all processes from scratch."""
+    self.tree.DeleteChildren(self.treeRoot)
+    self.processNodes.clear()
+    self.treeItems.clear()
+    self.errorItems.clear()
+    self.populatedNodes.clear()
+    for pid, errorFromBottom, errorFromTop in self.processTrees:
+      self.appendProcess(pid, errorFromBottom, errorFromTop)
+
+
+  def appendProcess(self, pid, errorFromBottom, errorFromTop): # None
+    if len(self.processTrees) == 1:
+      processNode = self.treeRoot
+    else:
+      processNode = self.tree.AppendItem(self.treeRoot, self.getProcessTitle(pid, errorFromBottom))
+      self.processNodes[pid] = processNode
+    self.appendToTree(processNode, errorFromBottom)
+    self.appendToTree(processNode, errorFromTop)
+
+
+  def setSortByLeaks(self, sortByLeaks): # None
+    """Choose between ordering children by leaked bytes or by number of errors.
+    The GUI tree is rebuilt, the error trees are not.
+    """
+    if sortByLeaks != self.sortByLeaks:
+      self.sortByLeaks = sortByLeaks
+      self.buildTree()
+
+
+  def hasProcess(self, pid): # Boolean
+    return pid in self.processIndices
+
+
+  def addProcess(self, pid, errorFromBottom, errorFromTop): # None
+    """Show the error trees of another process."""
+    self.processIndices[pid] = len(self.processTrees)
+    self.processTrees.append((pid, errorFromBottom, errorFromTop))
+    if len(self.processTrees) == 2:
+      ## The first process was shown without a process node. Now it needs one.
+      self.buildTree()
+    else:
+      self.appendProcess(pid, errorFromBottom, errorFromTop)
+
+
+  def insertError(self, error): # None
+    """Add a new error to the error trees of its process, which must have been
+    added already, and update the GUI nodes along the error's call stacks. The
+    rest of the GUI tree is left as is.
+    @param error - ParsedError - The error to add.
+    """
+    pid, errorFromBottom, errorFromTop = self.processTrees[self.processIndices[error.pid]]
+    for errorTree in [errorFromBottom, errorFromTop]:
+      changedNodes = errorTree.insert(error)
+      self.updateBranch(changedNodes, error)
+      self.sortBranch(changedNodes)
+
+    processNode = self.processNodes.get(pid)
+    if processNode is not None:
+      self.tree.SetItemText(processNode, self.getProcessTitle(pid, errorFromBottom))
+
+
+  def countError(self, error, number): # None
+    """Update the counts shown for an error that is already in the trees and
+    has been reported again, e.g. when a repetition was collapsed into it.
+    @param error - ParsedError - The error, whose 'count' has already been increased.
+    @param number - Integer - The number of new reports.
+    """
+    pid, errorFromBottom, errorFromTop = self.processTrees[self.processIndices[error.pid]]
+    for errorTree in [errorFromBottom, errorFromTop]:
+      changedNodes = errorTree.addOccurrences(error, number)
+      for errorTreeNode in changedNodes:
+        item = self.treeItems.get(errorTreeNode)
+        if item is None:
+          break # Not expanded yet.
+        self.tree.SetItemText(item, self.getTitle(errorTreeNode, self.tree.GetItemPyData(item).stackFrame))
+      self.sortBranch(changedNodes)
+
+    for item in self.errorItems.get(error, []):
+      self.tree.SetItemText(item, self.getErrorTitle(error))
+
+    processNode = self.processNodes.get(pid)
+    if processNode is not None:
+      self.tree.SetItemText(processNode, self.getProcessTitle(pid, errorFromBottom))
+
+
+  def updateBranch(self, changedNodes, error): # None
+    """Update the GUI nodes of error tree nodes that 'error' was inserted into.
+    @param changedNodes - SharedStackError list - As returned by SharedStackError.insert.
+    @param error - ParsedError - The inserted error.
+    """
+    parentItem = None
+    for errorTreeNode in changedNodes:
+      depth = errorTreeNode.stackFramesShared
+      item = self.treeItems.get(errorTreeNode)
+      if item is None:
+        ## A new branch below an expanded node.
+        self.appendToTree(parentItem, errorTreeNode)
+        return
+
+      treeItemData = self.createItemData(errorTreeNode)
+      self.tree.SetItemText(item, self.getTitle(errorTreeNode, treeItemData.stackFrame))
+      self.tree.SetItemPyData(item, treeItemData)
+      self.tree.SetItemHasChildren(item, True)
+      if errorTreeNode not in self.populatedNodes:
+        return # The error is shown when the node is expanded.
+      if error.errorStack.getNumFrames() == depth:
+        ## After the leaves of the errors that ended here before, like populate.
+        self.appendErrorItem(item, treeItemData, error, len(errorTreeNode.getEndingErrors()) - 1)
+      parentItem = item
+
+
+  def sortBranch(self, changedNodes): # None
+    """Move the GUI nodes of error tree nodes whose counts changed to where the
+    error tree now orders them among their siblings. The GUI nodes were in
+    order before the change and only the changed node of each set of siblings
+    can have moved, so siblings are only sorted if its neighbours differ.
+    @param changedNodes - SharedStackError list - A path down an error tree, as
+           returned by SharedStackError.insert or addOccurrences.
+    """
+    for parent, errorTreeNode in zip(changedNodes, changedNodes[1:]):
+      item = self.treeItems.get(errorTreeNode)
+      if item is None:
+        return # Not shown.
+      children = self.getOrderedChildren(parent)
+      index = children.index(errorTreeNode)
+      previousNode = children[index - 1] if index > 0 else None
+      nextNode = children[index + 1] if index + 1 < len(children) else None
+      if self.getItemNode(self.tree.GetPrevSibling(item)) is not previousNode or \
+         self.getItemNode(self.tree.GetNextSibling(item)) is not nextNode:
+        self.sortChildren(parent)
+
+
+  def sortChildren(self, errorTreeNode): # None
+    """Sort the GUI nodes of the children of a populated error tree node like
+    the error tree orders them. The leaves of the errors that end at the node
+    stay first, in their order.
+    """
+    item = self.treeItems[errorTreeNode]
+    positions = dict([(child, position) for position, child in enumerate(self.getOrderedChildren(errorTreeNode))])
+    ranks = {}
+    child, cookie = self.tree.GetFirstChild(item)
+    while child.IsOk():
+      treeItemData = self.tree.GetItemPyData(child)
+      if treeItemData.errorTreeNode is None:
+        ranks[treeItemData] = (0, len(ranks))
+      else:
+        ranks[treeItemData] = (1, positions[treeItemData.errorTreeNode])
+      child = self.tree.GetNextSibling(child)
+
+    self.tree.ranks = ranks
+    self.tree.SortChildren(item)
+    self.tree.ranks = {}
+
+
+  def getItemNode(self, item): # SharedStackError
+    """The error tree node of a GUI node, or None for error leaves and items that aren't OK."""
+    if not item.IsOk():
+      return None
+    return self.tree.GetItemPyData(item).errorTreeNode
+
+
+  def getOrderedChildren(self, errorTreeNode): # SharedStackError list
+    """The children of an error tree node in the order their GUI nodes are shown."""
+    children = errorTreeNode.children
+    if self.sortByLeaks:
+      ## The leak totals are precomputed, so sorting is cheap. The sort is
+      ## stable, children with equal leaks keep their order by count.
+      children = sorted(children, key=getLeakedBytes, reverse=True)
+    return children
+
+
+  def appendToTree(self, guiTreeNode, errorTreeNode, index=None): # Tree item
+    """Add the GUI node of an error tree node. The GUI nodes below it are added
+    when it is expanded, see populate.
     @param guiTreeNode - The GUI tree node at which the error should be inserted.
-    @param errorTreeNode - SharedStackError - The error to insert into the tree.
-    @param depth - integer - Current tree level. Also the index in the call stack for the current stack frame.
+    @param errorTreeNode - SharedStackError or CompressedStackError - The error to insert into the tree.
+    @param index - integer - Position among the children of 'guiTreeNode', or None to append.
+    @return The new GUI node.
+    """
+
+    ## The frames of an expanded run, except the last, get a GUI node each.
+    if errorTreeNode in self.expandedRuns:
+      frames = errorTreeNode.getRunFrames()
+      for frameIndex, frame in enumerate(frames[:-1], errorTreeNode.firstFrame):
+        runItemData = TreeItemData(frame, errorTreeNode.getNearestSourceLocation(frameIndex), self.getSingleError(errorTreeNode), errorTreeNode)
+        guiTreeNode = self.addItem(guiTreeNode, index, self.getTitle(errorTreeNode, frame), runItemData)
+        index = None
+
+    treeItemData = self.createItemData(errorTreeNode)
+    title = self.getTitle(errorTreeNode, treeItemData.stackFrame)
+    if errorTreeNode.getNumRunFrames() > 1 and errorTreeNode not in self.expandedRuns:
+      title += " (+" + str(errorTreeNode.getNumRunFrames() - 1) + " frames)"
+
+    newNode = self.addItem(guiTreeNode, index, title, treeItemData)
+    self.treeItems[errorTreeNode] = newNode
+
+    ## Every error either ends at the node or continues in a child.
+    self.tree.SetItemHasChildren(newNode, errorTreeNode.getNumErrors() > 0)
+    return newNode
+
+
+  def populate(self, errorTreeNode): # None
+    """Add the GUI nodes of the children of an error tree node, and the leaves
+    of the errors that end at it, unless that has been done already.
     """
+    if errorTreeNode in self.populatedNodes:
+      return
+    self.populatedNodes.add(errorTreeNode)
+
+    item = self.treeItems[errorTreeNode]
+    treeItemData = self.tree.GetItemPyData(item)
+    for error in errorTreeNode.getEndingErrors():
+      self.appendErrorItem(item, treeItemData, error)
+
+    for child in self.getOrderedChildren(errorTreeNode):
+      self.appendToTree(item, child)
+
+
+  def addItem(self, guiTreeNode, index, title, treeItemData): # Tree item
+    if index is None:
+      return self.tree.AppendItem(guiTreeNode, title, 1, 1, wx.TreeItemData(treeItemData))
+    return self.tree.InsertItemBefore(guiTreeNode, index, title, 1, 1, wx.TreeItemData(treeItemData))
+
+
+  def expandRun(self, errorTreeNode): # None
+    """Show each stack frame of a compressed run as a GUI node of its own. The
+    GUI nodes of the run and the nodes below it are recreated in place.
+    @param errorTreeNode - CompressedStackError - A node shown in the tree.
+    """
+    item = self.treeItems[errorTreeNode]
+    parentItem = self.tree.GetItemParent(item)
+    index = 0
+    sibling = self.tree.GetPrevSibling(item)
+    while sibling.IsOk():
+      index += 1
+      sibling = self.tree.GetPrevSibling(sibling)
+
+    populated = self.forgetBranch(errorTreeNode)
+    self.tree.Delete(item)
+    self.expandedRuns.add(errorTreeNode)
+    item = self.appendToTree(parentItem, errorTreeNode, index)
+
+    ## Show the branch as it was, parents are populated before their children.
+    for node, wasExpanded in populated:
+      self.populate(node)
+      if wasExpanded:
+        self.tree.Expand(self.treeItems[node])
+    self.tree.SelectItem(item)
 
+
+  def forgetBranch(self, errorTreeNode): # (SharedStackError, Boolean) list
+    """Drop the GUI nodes of an error tree node and its descendants from the bookkeeping.
+    @return The nodes that were populated, parents first, and whether they were expanded.
+    """
+    populated = []
+    pending = [errorTreeNode]
+    while len(pending) > 0:
+      node = pending.pop()
+      item = self.treeItems.pop(node)
+      if node not in self.populatedNodes:
+        continue
+      populated.append((node, self.tree.IsExpanded(item)))
+      self.populatedNodes.remove(node)
+      for error in node.getEndingErrors():
+        self.errorItems[error] = [errorItem for errorItem in self.errorItems[error] if self.tree.GetItemParent(errorItem) != item]
+      pending.extend(node.children)
+    return populated
+
+
+  def appendErrorItem(self, guiTreeNode, treeItemData, error, index=None): # None
+    """Add a leaf for an error whose call stack ends at the given node.
+    @param index - integer - Position among the children of 'guiTreeNode', or None to append.
+    """
+    errorTreeItemData = TreeItemData(treeItemData.stackFrame, treeItemData.nearestSourceStackFrame, error)
+    item = self.addItem(guiTreeNode, index, self.getErrorTitle(error), errorTreeItemData)
+    self.errorItems.setdefault(error, []).append(item)
+
+
+  @staticmethod
+  def createItemData(errorTreeNode): # TreeItemData
     stackFrame = errorTreeNode.getLocation()
     nearestSourceStackFrame = errorTreeNode.getNearestSourceLocation()
-    if len(errorTreeNode.errors) == 1:
-      error = errorTreeNode.errors[0]
-    else:
-      error = None
+    return TreeItemData(stackFrame, nearestSourceStackFrame, TreePanel.getSingleError(errorTreeNode), errorTreeNode)
 
-    treeItemData = TreeItemData(stackFrame, nearestSourceStackFrame, error)
-    title = "["+str(len(errorTreeNode.errors))+"]" + stackFrame.method + ":" + (stackFrame.lineNumber and stackFrame.lineNumber or stackFrame.address or "")
 
-    newNode = self.tree.AppendItem(guiTreeNode, title, 1, 1, wx.TreeItemData(treeItemData))
+  @staticmethod
+  def getSingleError(errorTreeNode): # ParsedError
+    """The error of a node that only one error passes through, or None."""
+    if errorTreeNode.getNumErrors() == 1:
+      return errorTreeNode.errors[0]
+    return None
+
+
+  @staticmethod
+  def getTitle(errorTreeNode, stackFrame): # String
+    """The counts in titles are numbers of reports, which includes collapsed repetitions."""
+    title = "["+str(errorTreeNode.numOccurrences)+"]" + stackFrame.method + ":" + (stackFrame.lineNumber and str(stackFrame.lineNumber) or stackFrame.address or "")
+    if errorTreeNode.leakedBytes > 0:
+      title += " (" + TreePanel.formatBytes(errorTreeNode.leakedBytes) + " leaked)"
+    return title
 
-    for error in errorTreeNode.errors:
-      if error.errorStack.getNumFrames() == depth:
-        errorTreeItemData = TreeItemData(stackFrame, nearestSourceStackFrame, error)
-        self.tree.AppendItem(newNode, error.errorType, 1, 1, wx.TreeItemData(errorTreeItemData))
 
-    for child in errorTreeNode.children:
-      self.appendToTree(newNode, child, depth+1)
+  @staticmethod
+  def formatBytes(numBytes): # String
+    return "{:,}".format(numBytes) + " bytes"
+
+
+  @staticmethod
+  def getProcessTitle(pid, errorTree): # String
+    title = "["+str(errorTree.numOccurrences)+"]Process " + pid
+    if errorTree.leakedBytes > 0:
+      title += " (" + TreePanel.formatBytes(errorTree.leakedBytes) + " leaked)"
+    return title
+
+
+  @staticmethod
+  def getErrorTitle(error): # String
+    if error.count > 1:
+      return "["+str(error.count)+"]" + error.errorType
+    return error.errorType
 
 
 
@@ -75,6 +417,25 @@ class TreePanel(wx.Panel):
     self.callback(treeItemData)
 
 
+  def itemExpanding(self, event):
+    treeItemData = self.tree.GetItemPyData(event.GetItem())
+    if treeItemData is not None and treeItemData.errorTreeNode is not None:
+      self.populate(treeItemData.errorTreeNode)
+    event.Skip()
+
+
+  def itemActivated(self, event):
+    treeItemData = self.tree.GetItemPyData(event.GetItem())
+    if treeItemData is None or treeItemData.errorTreeNode is None:
+      event.Skip()
+      return
+    errorTreeNode = treeItemData.errorTreeNode
+    if errorTreeNode.getNumRunFrames() <= 1 or errorTreeNode in self.expandedRuns:
+      event.Skip()
+      return
+    self.expandRun(errorTreeNode)
+
+
   def setItemSelectedCallback(self, callback):
     frame = wx.GetTopLevelParent(self)
     frame.Bind(wx.EVT_TREE_SEL_CHANGED, self.itemSelectedCallback, self.tree)
@@ -0,0 +1,53 @@
+"""
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+
+class ErrorCollapser(object):
+  """Collapses errors that are identical, except for addresses, into a single
+  ParsedError. Code in a loop may make Valgrind report the same error thousands
+  of times. Only the first of them is kept, and its 'count' is increased for
+  each repetition, so that the error trees and the GUI grow with the number of
+  distinct errors instead of the number of reports.
+
+  Errors are identical if they were reported by the same process and have the
+  same ParsedError.getDuplicateKey(). Errors of different processes are never
+  collapsed, since each process has its own error trees.
+  """
+
+  def __init__(self):
+    self.representatives = {} # (String, Tuple) -> ParsedError dictionary. The first error seen with each process id and duplicate key.
+
+
+  def add(self, error): # ParsedError
+    """Add an error to the set of seen errors.
+    @param error - ParsedError - The error.
+    @return 'error' itself if no identical error has been seen before. Otherwise
+            the earlier error, whose 'count' has been increased by the count of
+            'error'. 'error' should then be discarded.
+    """
+
+    key = (error.pid, error.getDuplicateKey())
+    representative = self.representatives.get(key)
+    if representative is None:
+      self.representatives[key] = error
+      return error
+
+    representative.count += error.count
+    return representative
+
+
+  def collapse(self, errors): # ParsedError list
+    """Returns the errors that weren't identical to an earlier error, in their
+    original order. The counts of the returned errors include the collapsed
+    repetitions.
+    @param errors - ParsedError iterable - May be a generator such as ErrorParser.parseStream.
+    """
+
+    return [error for error in errors if self.add(error) is error]
+
+
+  def __len__(self): # Integer
+    """The number of distinct errors seen."""
+    return len(self.representatives)
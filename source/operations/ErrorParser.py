@@ -3,236 +3,315 @@ Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibb
 See LICENSE for licensing information.
 """
 
+from errors.LineMatching import ErrorKind
 from errors.LineMatching import Patterns
 from errors.ParsedError import ParsedError
 
-class ErrorParser(object):
-  """Converts a list of strings, the Valgrind log, to a list of ParsedErrors."""
 
-  def __init__(self):
-    self.patterns = Patterns()
-    self.resetState()
+class ProcessState(object):
+  """The parser state for the lines of a single process. Valgrind prefixes every
+  line with the id of the process that wrote it, and when child processes are
+  traced the lines of several processes may be interleaved in the log, even in
+  the middle of a call stack. ErrorParser keeps one ProcessState per process id
+  so that the lines of one process never end up in an error of another.
+  """
 
+  HEADER = 0 # Skipping the Valgrind header at the start of the process' output.
+  SEEKING = 1 # Looking for the first line of the next error.
+  ERROR_START = 2 # Read the first line of an error, expecting the top of its call stack.
+  ERROR_STACK = 3 # Reading the callers of the error call stack.
+  SOURCE_START = 4 # Read the source line, expecting the top of the source call stack.
+  SOURCE_STACK = 5 # Reading the callers of the source call stack.
+  STOPPED = 6 # Found an error without a call stack. The rest of the process' lines are ignored.
 
+  def __init__(self, pid, state=HEADER):
+    self.pid = pid # String.
+    self.state = state # One of the state constants above.
+    self.error = None # ParsedError. The error currently being read.
 
-  def parse(self, lines): # (ParsedError list, string list, process id)
-    """Parser ParsedErrors from the given line list. All elements of 'lines'
-    must be string-like. None elements are not allowed.
-    @param lines - String list - The contents of a Valgrind log.
-    @return (ParsedError list, string list, process id) tuple containing the
-            errors found and a list of unknown valgrind lines, or None if there
-            was an error before any errors could be read. Process id is the PID
-            extracted from the Valgrind log file.
-    """
+    ## Byte span of 'error' in the log, if the lines come with spans.
+    self.errorStart = None # Integer. Offset of the start of the first line of the error.
+    self.errorEnd = None # Integer. Offset of the end of the last line of the error.
 
-    setupSuccessful = self.setupState(lines)
-    if not setupSuccessful:
-      return (None, None, None)
 
-    self.parseImplementation()
+  def startError(self, error, span): # None
+    self.error = error
+    self.state = ProcessState.ERROR_START
+    if span is not None:
+      self.errorStart, self.errorEnd = span
 
-    id = self.id
-    errorList = self.errors
-    unknownErrors = self.unknownErrors
-    self.resetState()
-    return  (errorList, unknownErrors, id)
 
+  def extendError(self, span): # None
+    if span is not None:
+      self.errorEnd = span[1]
 
 
-  def resetState(self): # None
-    """Prepare the parser for a new round of parsing. The parser is placed in a
-    dormant state, waiting for the next call to parse().
+  def hasCompleteError(self): # Boolean
+    """Returns True if the error being read has its call stack and would be
+    complete if the process wrote no more lines.
     """
+    return self.state == ProcessState.ERROR_STACK or \
+      self.state == ProcessState.SOURCE_START or \
+      self.state == ProcessState.SOURCE_STACK
+
+
+  def finishError(self): # ParsedError
+    """Returns the error being read and starts looking for the next one."""
+    error = self.error
+    if self.errorStart is not None:
+      error.setLogSpan(self.errorStart, self.errorEnd)
+    self.error = None
+    self.errorStart = None
+    self.errorEnd = None
+    self.state = ProcessState.SEEKING
+    return error
+
 
-    self.lines = None
-    self.line = None
-    self.currentLine = None
+  def stop(self): # None
+    self.error = None
+    self.state = ProcessState.STOPPED
 
 
 
-  def setupState(self, lines): # Boolean
-    """Prepare the parser for parsing from the given string list."""
+class ErrorParser(object):
+  """Converts a sequence of strings, the Valgrind log, to a list of ParsedErrors.
 
-    if lines == None or len(lines) == 0:
-      return False
+  The parser is pushed one line at a time with feedLine, and the lines of each
+  process are parsed separately. Errors are produced in the order they are
+  completed, which for logs with a single process is the order of the log.
+  """
 
-    self.errors = [] # ParsedError list.
-    self.unknownErrors = [] # String list. Lines that the parser didn't recognize.
+  def __init__(self):
+    self.patterns = Patterns()
+    self.resetState()
 
-    self.id = None
-    self.lines = lines # String list. Provided by user.
-    self.currentLine = 0 # Integer. The index of 'line' in 'lines'.
-    self.line = self.lines[self.currentLine] # String. One of the string in 'lines'. Is always either None or a Valgrind line.
-    return self.initFirstLine()
+    ## Statistics over all lines fed to the parser, kept across parses.
+    self.numLines = 0 # Integer. Lines fed to the parser.
+    self.numValgrindLines = 0 # Integer. Lines with the Valgrind prefix.
 
 
 
-  def isParsing(self): # Boolean
-    """Returns True if the parser is valid for continued parsing. Calling
-    resetState will cause future calls to isParsing to return False until
-    setupState is called.
+  def parse(self, lines): # (ParsedError list, string list, process id)
+    """Parser ParsedErrors from the given lines. All elements of 'lines' must
+    be string-like. None elements are not allowed. 'lines' may be any iterable,
+    it is only traversed once.
+    @param lines - String iterable - The contents of a Valgrind log.
+    @return (ParsedError list, string list, process id) tuple containing the
+            errors found and a list of unknown valgrind lines, or None if there
+            was an error before any errors could be read. Process id is the PID
+            of the first Valgrind line in the log. The PID of each error is
+            stored in the error.
     """
-    return self.lines != None and self.line != None and self.currentLine != None
 
+    if lines == None:
+      return (None, None, None)
 
+    errorList = list(self.parseStream(lines))
 
-  def parseImplementation(self):
-    """Main parsing loop. Iteratively reads errors from the lines list and adds
-    them to the errors list.
-    @precondition self.line is a Valgrind line.
-    """
+    id = self.id
+    unknownErrors = self.unknownErrors
+    self.resetState()
+    if id is None:
+      return (None, None, None) # There were no Valgrind lines.
 
-    self.readHeader()
+    return  (errorList, unknownErrors, id)
 
-    error = self.readError()
-    while error != None:
-      self.errors.append(error)
-      error = self.readError()
 
 
+  def parseStream(self, lines): # ParsedError generator
+    """Generator version of parse. Lines are pulled from 'lines' one at a time
+    and each ParsedError is yielded as soon as it has been completely read, so
+    the log is never held in memory. 'lines' can be a file object, sys.stdin or
+    any other iterable of strings. Trailing newlines are stripped.
 
-  def readHeader(self): # Boolean
-    """Jump past the Valgrind header. Resets the parser state if no Valgrind lines
-    are found after the header.
-    @return True if a Valgrind line was found after the header. False otherwise.
-    @precondition self.line is a Valgrind line.
-    @postcondition On True: self.line is a Valgrind line. On False: isParsing() returns false.
+    The unknown Valgrind lines and the process id are not part of the yielded
+    values. They are available in 'unknownErrors' and 'id' once the generator
+    has been exhausted.
+    @param lines - String iterable - The contents of a Valgrind log.
     """
 
-    while self.patterns.isHeader.match(self.line) != None:
-      hadAnotherLine = self.nextValgrindLine()
-      if not hadAnotherLine:
-        return False
-
-    return True
+    if lines == None:
+      return
 
+    self.resetState()
 
+    ## If the lines come from a source that knows where in the log each line is,
+    ## e.g. a MappedLog, then the byte span of every error is recorded.
+    spanSource = lines if hasattr(lines, "getLineSpan") else None
 
-  def readError(self): # ParsedError
-    """Read an error from the lines list. Will skip unknown Valgrind lines until
-    an error is found. Skipped lines are added to unknownErrors.
-    @precondition self.line is a Valgrind line.
-    """
+    for line in lines:
+      span = spanSource.getLineSpan() if spanSource is not None else None
+      error = self.feedLine(line, span)
+      if error is not None:
+        yield error
 
-    if not self.isParsing():
-      return None
+    for error in self.finish():
+      yield error
 
-    while not self.patterns.isErrorStart(self.line):
-      if len(self.line) > 0:
-        self.unknownErrors.append(self.line)
-      hadAnotherLine = self.nextValgrindLine()
-      if not hadAnotherLine:
-        return None
 
-    error = ParsedError(self.line)
 
-    hadAnotherLine = self.nextValgrindLine()
-    if not hadAnotherLine:
-      return None
+  def resetState(self): # None
+    """Prepare the parser for a new round of parsing. All process states are
+    forgotten.
+    """
 
-    hadStacks = self.readStacks(error)
-    if not hadStacks:
-      return None
+    self.unknownErrors = [] # String list. Lines that the parser didn't recognize.
+    self.id = None # String. The process id of the first Valgrind line.
+    self.processes = {} # String -> ProcessState dictionary. The parser state of each process id.
+    self.processOrder = [] # String list. The process ids in order of first appearance.
 
-    return error
 
 
+  def addProcess(self, pid, state=ProcessState.HEADER): # ProcessState
+    """Start parsing the lines of a new process."""
 
-  def readStacks(self, error):
-    # There can be up to two call stacks; a mandatory one for the error and an
-    # optional one for the source.
+    if self.id is None:
+      self.id = pid
 
-    if self.patterns.isStackFrameTop.match(self.line) == None:
-      return False
+    process = ProcessState(pid, state)
+    self.processes[pid] = process
+    self.processOrder.append(pid)
+    return process
 
-    error.setLocation(self.line)
 
-    while self.nextValgrindLine() and self.patterns.isStackFrameCaller.match(self.line):
-      error.addCaller(self.line)
 
-    if not self.isParsing():
-      return True # It is OK to run out of lines while reading callers.
+  def feedLine(self, line, span=None): # ParsedError
+    """Parse the next line of the log. Lines that aren't Valgrind lines are
+    ignored.
+    @param line - String - The line.
+    @param span - (Integer, Integer) - Byte span of the line in the log, or None if not known.
+    @return The error of the line's process that was completed by this line, or None.
+    """
 
-    if not self.patterns.isSourceStart(self.line):
-      return True # This error didn't have a source locaiton.
+    assert line != None, "Found 'None' in lines list. This is not allowed."
 
-    error.setSourceType(self.line)
+    self.numLines += 1
+    pidAndPayload = self.patterns.splitValgrind(line)
+    if pidAndPayload is None:
+      return None
 
-    hadAnotherLine = self.nextValgrindLine()
-    if not hadAnotherLine:
-      return True # This is not really a valid error, but it's close enough to be usable.
+    self.numValgrindLines += 1
+    pid, payload = pidAndPayload
+    process = self.processes.get(pid)
+    if process is None:
+      process = self.addProcess(pid)
 
-    if not self.patterns.isStackFrameTop.match(self.line):
-      return True # # This is not really a valid error, but it's close enough to be usable.
+    return self.parseLine(process, payload, span)
 
-    error.setSourceLocation(self.line)
 
-    while self.nextValgrindLine() and self.patterns.isStackFrameCaller.match(self.line):
-      error.addSourceCaller(self.line)
 
-    return True
+  def finish(self): # ParsedError list
+    """Called when there are no more lines. Returns the errors that were still
+    being read, in order of process appearance. Errors that never got a call
+    stack are dropped.
+    """
 
+    errors = []
+    for pid in self.processOrder:
+      process = self.processes[pid]
+      if process.hasCompleteError():
+        errors.append(process.finishError())
+      elif process.state == ProcessState.ERROR_START:
+        process.stop()
 
+    return errors
 
-  def initFirstLine(self): # Boolean
-    while not self.isValgrindLine():
-      hadAnotherLine = self.nextLine()
-      if not hadAnotherLine:
-        return False
 
-    idMatch = self.patterns.readId.match(self.line)
-    self.id = idMatch.group(1)
 
-    self.stripValgrindPrefix()
-    return True
+  def parseLine(self, process, line, span): # ParsedError
+    """Advance the state of a process by one line.
+    @param process - ProcessState - The process that wrote the line.
+    @param line - String - The line, with the Valgrind prefix removed.
+    @param span - (Integer, Integer) - Byte span of the line in the log, or None.
+    @return The error that was completed by this line, or None.
+    """
 
+    state = process.state
+    finishedError = None
 
+    if state == ProcessState.ERROR_STACK or state == ProcessState.SOURCE_STACK:
+      if self.patterns.isStackFrameCallerLine(line):
+        if state == ProcessState.ERROR_STACK:
+          process.error.addCaller(line)
+        else:
+          process.error.addSourceCaller(line)
+        process.extendError(span)
+        return None
 
+      # There can be up to two call stacks; a mandatory one for the error and an
+      # optional one for the source.
+      if state == ProcessState.ERROR_STACK and self.patterns.isSourceStart(line):
+        process.error.setSourceType(line)
+        process.extendError(span)
+        process.state = ProcessState.SOURCE_START
+        return None
 
-  def isValgrindLine(self): # Boolean
-    return self.line != None and self.patterns.isValgrind.match(self.line) != None
+      finishedError = process.finishError()
 
+    elif state == ProcessState.SOURCE_START:
+      if self.patterns.isStackFrameTopLine(line):
+        process.error.setSourceLocation(line)
+        process.extendError(span)
+        process.state = ProcessState.SOURCE_STACK
+        return None
 
+      # This is not really a valid error, but it's close enough to be usable.
+      finishedError = process.finishError()
 
-  def stripValgrindPrefix(self): # None
-    match = self.patterns.stripValgrind.match(self.line)
-    self.line = match.group(1)
-    self.line = self.line.strip()
+    elif state == ProcessState.ERROR_START:
+      if self.patterns.isStackFrameTopLine(line):
+        process.error.setLocation(line)
+        process.extendError(span)
+        process.state = ProcessState.ERROR_STACK
+        return None
 
+      ## An error without a call stack. Don't trust anything else this process says.
+      process.stop()
+      return None
 
+    elif state == ProcessState.HEADER:
+      if self.patterns.isHeader.match(line):
+        return None
 
-  def nextLine(self): # Boolean
-    """Updates self.line and self.currentLine to points to the next line in
-    self.lines. Resets the parser's internal state if the end of self.lines is
-    reached.
-    """
+    elif state == ProcessState.STOPPED:
+      return None
 
-    self.currentLine += 1
-    if (self.currentLine < len(self.lines)):
-      self.line = self.lines[self.currentLine]
-      assert self.line != None, "Found 'None' in lines list. This is not allowed."
-      return True
+    ## The line isn't part of an error, it either starts a new one or is unknown.
+    kind = self.patterns.classifyError(line)
+    if kind is None:
+      process.state = ProcessState.SEEKING
+      if len(line) > 0:
+        self.addUnknown(process, line, span)
     else:
-      self.resetState()
-      return False
+      error = ParsedError(line, kind, process.pid)
+      if kind == ErrorKind.MEMORY_LOSS:
+        error.leak = self.patterns.readLeak(line)
+      process.startError(error, span)
 
+    return finishedError
 
 
-  def nextValgrindLine(self): # Boolean
-    """Step forward through the lines until a Valgrind line is found. Resets
-    the parser's internal state and returns False if the end of the list is
-    reached.
-    """
 
-    hadAnotherLine = self.nextLine()
-    if not hadAnotherLine:
-      return False
+  def addUnknown(self, process, line, span): # None
+    """Called for every Valgrind line that the parser doesn't recognize."""
+    self.unknownErrors.append(line)
 
-    while not self.isValgrindLine():
-      hadAnotherLine = self.nextLine()
-      if not hadAnotherLine:
-        return False;
 
-    self.stripValgrindPrefix()
-    return True
 
+  @staticmethod
+  def groupByProcess(errors): # (String, ParsedError list) list
+    """Split a list of errors by the id of the process that reported them.
+    @return List of (process id, errors) tuples in order of first appearance.
+            The errors of each process are kept in their original order.
+    """
+
+    groups = {}
+    order = []
+    for error in errors:
+      group = groups.get(error.pid)
+      if group is None:
+        group = groups[error.pid] = []
+        order.append(error.pid)
+      group.append(error)
+
+    return [(pid, groups[pid]) for pid in order]
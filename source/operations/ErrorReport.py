@@ -0,0 +1,146 @@
+"""
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+import json
+import sys
+
+from errors.LineMatching import ErrorKind
+from errors.SharedStackError import getNumErrors
+
+
+class ErrorReport(object):
+    """The errors of a Valgrind log printed as text or written as JSON, instead
+    of being shown in the GUI. Used to inspect logs where there is no display,
+    e.g. in continuous integration.
+
+    The report holds a summary of each process' errors followed by its error
+    tree, built from the bottom of the call stacks so that errors with a
+    common call path are merged. In JSON the tree is a flat list of nodes that
+    refer to their parent by id, so that deep call stacks don't make deeply
+    nested documents that JSON encoders and decoders can't recurse through.
+    """
+
+    TEXT = "text"
+    JSON = "json"
+
+    def __init__(self, processTrees, unknowns):
+        """
+        @param processTrees - (String, SharedStackError) list - The process ids and
+               their error trees, built from Stack.FROM_BOTTOM.
+        @param unknowns - String list - The Valgrind lines the parser didn't recognize.
+        """
+
+        self.processTrees = processTrees # (String, SharedStackError) list
+        self.unknowns = unknowns if unknowns is not None else [] # String list
+
+
+    def write(self, format, output=None): # None
+        """Write the report in the given format, TEXT or JSON.
+        @param output - File - Where the report is written. Defaults to standard out.
+        """
+
+        if output is None:
+            output = sys.stdout
+
+        if format == ErrorReport.JSON:
+            json.dump(self.getResults(), output, indent=2, separators=(",", ": "), sort_keys=True)
+            output.write("\n")
+        else:
+            self.printText(output)
+
+
+    def printText(self, output): # None
+        for pid, tree in self.processTrees:
+            summary = ErrorReport.summarize(tree)
+            output.write("Process " + pid + ": " + str(summary["errors"]) + " errors reported " +
+                         str(summary["occurrences"]) + " times, " + str(summary["leakedBytes"]) + " bytes leaked in " +
+                         str(summary["leakedBlocks"]) + " blocks.\n")
+            for kind in ErrorKind.ALL:
+                if kind in summary["kinds"]:
+                    output.write("  " + kind + ": " + str(summary["kinds"][kind]) + "\n")
+            output.write("\n")
+            tree.printTree(output)
+            output.write("\n")
+
+        if len(self.unknowns) > 0:
+            output.write("The parser didn't recognize the following error types:\n")
+            for unknown in self.unknowns:
+                output.write("  " + unknown + "\n")
+
+
+    def getResults(self): # Dictionary
+        """Returns the report as a dictionary that can be written as JSON."""
+
+        processes = []
+        for pid, tree in self.processTrees:
+            process = ErrorReport.summarize(tree)
+            process["pid"] = pid
+            process["tree"] = ErrorReport.describeTree(tree)
+            processes.append(process)
+        return {"processes": processes, "unknowns": self.unknowns}
+
+
+    @staticmethod
+    def summarize(tree): # Dictionary
+        """The number of errors, reports and leaked bytes of a tree, and the
+        number of reports of each error kind.
+        """
+
+        return {
+            "errors": getNumErrors(tree),
+            "occurrences": tree.numOccurrences,
+            "leakedBytes": tree.leakedBytes,
+            "leakedBlocks": tree.leakedBlocks,
+            "kinds": dict(tree.kindCounts),
+        }
+
+
+    @staticmethod
+    def describeTree(root): # Dictionary list
+        """Returns the nodes of a tree as a list of dictionaries, the root first
+        with id 0. Each node has the id of its parent, None for the root, and
+        comes after it. The children of a node are listed in the order of the
+        tree. The tree is walked without recursion, so deep call stacks don't
+        matter.
+        """
+
+        nodes = []
+        pending = [(root, None)]
+        while len(pending) > 0:
+            node, parentId = pending.pop()
+            nodeId = len(nodes)
+            nodes.append(ErrorReport.describeNode(node, nodeId, parentId))
+            pending.extend([(child, nodeId) for child in reversed(node.children)])
+        return nodes
+
+
+    @staticmethod
+    def describeNode(node, nodeId, parentId): # Dictionary
+        ## Errors whose call stacks end at the node are listed at the node.
+        errors = [ErrorReport.describeError(error) for error in node.getEndingErrors()]
+        return {
+            "id": nodeId,
+            "parent": parentId,
+            "location": str(node.getLocation()),
+            "errors": getNumErrors(node),
+            "occurrences": node.numOccurrences,
+            "leakedBytes": node.leakedBytes,
+            "kinds": dict(node.kindCounts),
+            "endingErrors": errors,
+        }
+
+
+    @staticmethod
+    def describeError(error): # Dictionary
+        leak = None
+        if error.leak is not None:
+            leak = {"bytes": error.leak.bytes, "blocks": error.leak.blocks, "category": error.leak.category}
+        return {
+            "type": error.errorType,
+            "kind": error.errorKind,
+            "count": error.count,
+            "source": error.sourceType,
+            "leak": leak,
+        }
@@ -0,0 +1,286 @@
+"""
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+import multiprocessing
+
+from disk.MappedLog import MappedLog
+from errors.LineMatching import Patterns
+from operations.ErrorParser import ErrorParser, ProcessState
+
+
+def isSafeStart(patterns, payload): # Boolean
+    """Test if a Valgrind line, with the prefix removed, is one where parsing of
+    a process can start without knowing what came before. That is the case for
+    lines that start an error and that can't be mistaken for anything else.
+    Whatever state the process is in when it reaches such a line, it will
+    either end the error it is reading or stop, and then start a new error at
+    the line.
+    """
+
+    return patterns.isErrorStart(payload) and \
+        not patterns.isSourceStart(payload) and \
+        not patterns.isAnyStackFrameLine(payload) and \
+        patterns.isHeader.match(payload) is None
+
+
+
+def parseChunk(chunk): # (tuple list, tuple list, dictionary, String list, dictionary, dictionary)
+    """Parse the errors within a byte range of a Valgrind log. This is the work
+    done by each worker process of a ParallelErrorParser.
+    @param chunk - (string, Integer, Integer, Boolean) - Path to the log file,
+           the byte range to parse and whether the range is the start of the log.
+    @return The result of ChunkParser.parseChunk.
+    """
+
+    path, start, end, isFirst = chunk
+    log = MappedLog(path, start, end)
+    try:
+        return ChunkParser(not isFirst).parseChunk(log)
+    finally:
+        log.close()
+
+
+
+class ChunkParser(ErrorParser):
+    """ErrorParser for one chunk of a log. The state of the processes at the
+    start of the chunk isn't known, so a process is only parsed from its first
+    safe start line in the chunk. The lines of the process before that, its
+    lead-in, are instead returned for the merge to replay on the state carried
+    over from the previous chunk. Nothing is finished at the end of the chunk.
+
+    Errors and unknown lines are recorded together with the log offset at which
+    a sequential parse would have produced them, so that the merge can put them
+    in the same order.
+    """
+
+    def __init__(self, isContinuation):
+        """
+        @param isContinuation - Boolean - False for the first chunk of the log, where all processes start in the header.
+        """
+        ErrorParser.__init__(self)
+        self.isContinuation = isContinuation # Boolean
+
+
+    def resetState(self): # None
+        ErrorParser.resetState(self)
+        self.finishedErrors = [] # (Integer, ParsedError) list. Completion offset and error.
+        self.offsetUnknowns = [] # (Integer, String, String) list. Offset, process id and line.
+        self.leadIns = {} # String -> (String, (Integer, Integer)) list dictionary. Lines and spans before each process' first safe start.
+        self.safeStarts = {} # String -> Integer dictionary. Offset of each process' first safe start.
+        self.chunkOrder = [] # String list. Process ids in order of first appearance in the chunk.
+
+
+    def parseChunk(self, log): # (tuple list, tuple list, dictionary, String list, dictionary, dictionary)
+        """Parse the Valgrind lines of a MappedLog.
+        @return (finished errors, unknowns, lead-ins, process order, safe starts,
+                process states) where the process states are the ProcessStates
+                at the end of the chunk of the processes that had a safe start.
+        """
+
+        self.resetState()
+        for line in log:
+            self.feedLine(line, log.getLineSpan())
+
+        return (self.finishedErrors, self.offsetUnknowns, self.leadIns,
+                self.chunkOrder, self.safeStarts, self.processes)
+
+
+    def feedLine(self, line, span=None): # None
+        self.numLines += 1
+        pidAndPayload = self.patterns.splitValgrind(line)
+        if pidAndPayload is None:
+            return None
+
+        self.numValgrindLines += 1
+        pid, payload = pidAndPayload
+        process = self.processes.get(pid)
+        if process is None:
+            leadIn = self.leadIns.get(pid)
+            if leadIn is None:
+                leadIn = self.leadIns[pid] = []
+                self.chunkOrder.append(pid)
+
+            if self.isContinuation and not isSafeStart(self.patterns, payload):
+                leadIn.append((payload, span))
+                return None
+
+            self.safeStarts[pid] = span[0]
+            process = self.addProcess(pid, ProcessState.SEEKING if self.isContinuation else ProcessState.HEADER)
+
+        self.replayLine(process, payload, span)
+        return None
+
+
+    def replayLine(self, process, line, span): # None
+        """Parse a line, recording the error it completes with its offset."""
+        error = self.parseLine(process, line, span)
+        if error is not None:
+            self.finishedErrors.append((span[0], error))
+
+
+    def addUnknown(self, process, line, span): # None
+        self.offsetUnknowns.append((span[0], process.pid, line))
+
+
+
+class ParallelErrorParser(object):
+    """Converts a memory mapped Valgrind log to a list of ParsedErrors using a
+    pool of worker processes. The log is split into chunks that each start at
+    the first line of an error, the chunks are parsed in parallel and the
+    results are joined in log order. The result is identical to that of
+    ErrorParser.parse on the whole log.
+    """
+
+    def __init__(self, numProcesses=None, minChunkSize=16 * 1024 * 1024):
+        """
+        @param numProcesses - Integer - The number of worker processes. Defaults to the number of CPUs.
+        @param minChunkSize - Integer - Logs are not split into chunks smaller than this many bytes.
+        """
+
+        self.patterns = Patterns()
+        self.numProcesses = numProcesses if numProcesses is not None else multiprocessing.cpu_count() # Integer
+        self.minChunkSize = minChunkSize # Integer
+
+
+
+    def parse(self, log): # (ParsedError list, string list, process id)
+        """Parse ParsedErrors from the given log. Logs that aren't MappedLogs,
+        or that are too small to be worth splitting, are parsed by a single
+        ErrorParser in this process.
+        @param log - MappedLog - The Valgrind log to parse.
+        @return Same as ErrorParser.parse.
+        """
+
+        if self.numProcesses <= 1 or not isinstance(log, MappedLog):
+            return ErrorParser().parse(log)
+
+        boundaries = self.findChunkBoundaries(log)
+        if len(boundaries) <= 2:
+            return ErrorParser().parse(log)
+
+        chunks = [(log.path, boundaries[i], boundaries[i + 1], i == 0) for i in range(len(boundaries) - 1)]
+        pool = multiprocessing.Pool(min(self.numProcesses, len(chunks)))
+        try:
+            results = pool.map(parseChunk, chunks)
+        finally:
+            ## Not terminate, which can deadlock on Python 2 if a worker is
+            ## still sending its result.
+            pool.close()
+            pool.join()
+
+        return ParallelErrorParser.mergeResults(results)
+
+
+
+    def findChunkBoundaries(self, log): # Integer list
+        """Split the byte range of the log into chunks. There are a few chunks
+        per worker process, so that a slow chunk doesn't leave the other
+        workers idle.
+        @return Sorted list of byte offsets. Chunk i is the range [boundaries[i], boundaries[i+1]).
+        """
+
+        size = log.end - log.start
+        numChunks = min(self.numProcesses * 4, size // self.minChunkSize)
+
+        boundaries = [log.start]
+        for i in range(1, numChunks):
+            target = log.start + size * i // numChunks
+            if target <= boundaries[-1]:
+                continue # The previous boundary was found past this target.
+            boundary = self.findSafeBoundary(log, target)
+            if boundary == -1:
+                break
+            boundaries.append(boundary)
+        boundaries.append(log.end)
+
+        return boundaries
+
+
+
+    def findSafeBoundary(self, log, target): # Integer
+        """Find the first line at or after byte offset 'target' where the log can
+        be split with as little lead-in as possible, see isSafeBoundary.
+        @return The offset of the start of the line, or -1 if there is no such line.
+        """
+
+        lineStart = log.findMarker(target - 1)
+        if lineStart == -1:
+            return -1
+
+        for line in log.iterateRange(lineStart, log.end):
+            if self.isSafeBoundary(line):
+                return log.lineStart
+
+        return -1
+
+
+
+    def isSafeBoundary(self, line): # Boolean
+        """Test if a chunk should start at the given line. Any line would do,
+        since the lines of each process before its first safe start are replayed
+        during the merge, but starting at a safe start line means that at least
+        one process can be parsed from the very first line of the chunk.
+        """
+
+        pidAndPayload = self.patterns.splitValgrind(line)
+        if pidAndPayload is None:
+            return False
+
+        return isSafeStart(self.patterns, pidAndPayload[1])
+
+
+
+    @staticmethod
+    def mergeResults(results): # (ParsedError list, string list, process id)
+        """Join the parse results of consecutive chunks, given in log order. The
+        state of every process is carried from chunk to chunk. A process' lead-in
+        is parsed using the carried state, after which the carried state is
+        replaced by the state at the end of the chunk. If the carried state had
+        stopped, or was about to stop at the process' first safe start, then
+        everything the chunk found for the process is dropped.
+        """
+
+        merger = ChunkParser(True)
+
+        errors = []
+        unknowns = []
+        for finishedErrors, offsetUnknowns, leadIns, chunkOrder, safeStarts, endStates in results:
+            stoppedPids = set()
+            for pid in chunkOrder:
+                process = merger.processes.get(pid)
+                if process is None:
+                    process = merger.addProcess(pid)
+
+                for line, span in leadIns[pid]:
+                    merger.replayLine(process, line, span)
+
+                if pid not in safeStarts:
+                    continue # The process is still in its lead-in.
+
+                if process.state == ProcessState.ERROR_START or process.state == ProcessState.STOPPED:
+                    process.stop()
+                    stoppedPids.add(pid)
+                    continue
+
+                if process.hasCompleteError():
+                    merger.finishedErrors.append((safeStarts[pid], process.finishError()))
+                merger.processes[pid] = endStates[pid]
+
+            errors.extend([entry for entry in finishedErrors if entry[1].pid not in stoppedPids])
+            unknowns.extend([entry for entry in offsetUnknowns if entry[1] not in stoppedPids])
+
+        if merger.id is None:
+            return (None, None, None) # There were no Valgrind lines.
+
+        errors.extend(merger.finishedErrors)
+        errors.sort(key=lambda entry: entry[0])
+        unknowns.extend(merger.offsetUnknowns)
+        unknowns.sort(key=lambda entry: entry[0])
+
+        ## Errors still being read at the end of the log come last.
+        errorList = [error for offset, error in errors]
+        errorList.extend(merger.finish())
+
+        return (errorList, [line for offset, pid, line in unknowns], merger.id)
@@ -0,0 +1,249 @@
+"""
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+import gc
+import multiprocessing
+
+from errors.SharedStackError import SharedStackError
+from errors.Stack import Stack
+from errors.Stack import stackFrames
+
+
+def getFrameKey(frame): # Integer or Tuple
+    """A small value that is equal for stack frames that compare equal. The id
+    of interned frames, and of frames with the same content as an interned one.
+    Frames unlike any interned frame are keyed on their content.
+    """
+
+    if frame.id is not None:
+        return frame.id
+    content = frame.getContent()
+    frameId = stackFrames.contentIds.get(content)
+    return frameId if frameId is not None else content
+
+
+
+def getStackKeys(error, direction): # Tuple
+    """The frame keys of an error's call stack, in the order the tree is built in."""
+
+    keys = [frame.id if frame.id is not None else getFrameKey(frame) for frame in error.errorStack.frames]
+    if direction == Stack.FROM_BOTTOM:
+        keys.reverse()
+    return tuple(keys)
+
+
+
+def groupSubtree(errors): # Tuple list
+    """Group the errors of a subtree into nodes and count the reports, leaks and
+    error kinds of each node, the way SharedStackError does. This is the work
+    done by each worker process of a ParallelTreeBuilder.
+    @param errors - Tuple list - For each error of the subtree, the frame keys
+           of its call stack from the frame below the subtree root and on, its
+           number of reports, its ErrorKind and its leaked bytes and blocks.
+    @return The nodes below the subtree root, parents before their children
+            and the children of a node consecutive and ordered like
+            SharedStackError orders them. A node with several errors is
+            (position of the parent in the list or -1 for the subtree root,
+            number of reports, indices in 'errors' of the node's errors,
+            indices of the errors that end at the node, leaked bytes, leaked
+            blocks, reports per ErrorKind). A node with a single error is
+            (position of the parent, number of reports, index of the error),
+            and stands for the chain of nodes down to the end of the error's
+            call stack, see SharedStackError.createChain.
+    """
+
+    nodes = []
+    pending = [(-1, range(len(errors)), 0)]
+    while len(pending) > 0:
+        parent, indices, depth = pending.pop()
+        groups = {} # Key -> Integer list dictionary.
+        order = [] # Key list. The frame keys in order of first appearance.
+        for index in indices:
+            keys = errors[index][0]
+            if depth >= len(keys):
+                continue # The error ends at the parent.
+            key = keys[depth]
+            group = groups.get(key)
+            if group is None:
+                groups[key] = [index]
+                order.append(key)
+            else:
+                group.append(index)
+
+        children = []
+        for key in order:
+            group = groups[key]
+            if len(group) == 1:
+                children.append((parent, errors[group[0]][1], group[0]))
+                continue
+            numOccurrences = 0
+            leakedBytes = 0
+            leakedBlocks = 0
+            kindCounts = {}
+            endingIndices = []
+            for index in group:
+                keys, count, kind, bytes, blocks = errors[index]
+                numOccurrences += count
+                kindCounts[kind] = kindCounts.get(kind, 0) + count
+                leakedBytes += bytes
+                leakedBlocks += blocks
+                if len(keys) == depth + 1:
+                    endingIndices.append(index)
+            children.append((parent, numOccurrences, group, endingIndices, leakedBytes, leakedBlocks, kindCounts))
+
+        ## Stable, so children with as many reports keep their order of appearance.
+        children.sort(key=getChildOccurrences, reverse=True)
+        for child in children:
+            if len(child) > 3 and len(child[3]) < len(child[2]):
+                pending.append((len(nodes), child[2], depth + 1))
+            nodes.append(child)
+
+    return nodes
+
+
+
+def getChildOccurrences(node): # Integer
+    """The number of reports of a node returned by groupSubtree."""
+    return node[1]
+
+
+
+class ParallelTreeBuilder(object):
+    """Creates every node of SharedStackError trees using a pool of worker
+    processes, instead of as they are asked for. Used where the whole trees
+    are needed, e.g. for --report.
+
+    The first levels of the trees are created in this process, until the
+    subtrees below are small enough to give each worker several of them. Each
+    subtree is sent to a worker as the frame keys of its errors' call stacks
+    and the few numbers that are counted per node, which are small to pickle
+    compared to the errors. The worker groups the errors into nodes, counts
+    them and orders the children, so this process only creates the nodes from
+    the result. The subtrees of all the trees, of both directions, share the
+    pool. The result is identical to the trees created one node at a time.
+    """
+
+    def __init__(self, numProcesses=None, tasksPerProcess=4, maxSplitDepth=8):
+        """
+        @param numProcesses - Integer - The number of worker processes. Defaults to the number of CPUs.
+        @param tasksPerProcess - Integer - Roughly how many subtrees to give each worker, so that
+               the work is spread evenly even though subtrees differ in size.
+        @param maxSplitDepth - Integer - Subtrees are sent to the workers at this depth at the
+               latest, however large, so that long shared call paths are not created here.
+        """
+
+        self.numProcesses = numProcesses if numProcesses is not None else multiprocessing.cpu_count() # Integer
+        self.tasksPerProcess = tasksPerProcess # Integer
+        self.maxSplitDepth = maxSplitDepth # Integer
+
+
+
+    def createTrees(self, trees): # None
+        """Create every node of the given trees.
+        @param trees - SharedStackError list - Roots whose children have not been created.
+        """
+
+        if self.numProcesses <= 1:
+            for tree in trees:
+                tree.createTree()
+            return
+
+        ## The nodes hold no reference cycles, and creating this many of them in
+        ## one go would otherwise start many garbage collections that find nothing.
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            subtrees = self.findSubtrees(trees)
+            if len(subtrees) == 0:
+                return
+            results = self.groupSubtrees(subtrees)
+            for subtree, nodes in zip(subtrees, results):
+                ParallelTreeBuilder.attachSubtree(subtree, nodes)
+        finally:
+            if collecting:
+                gc.enable()
+
+
+
+    def groupSubtrees(self, subtrees): # List
+        """Let the workers group the errors of each subtree into nodes.
+        @return What groupSubtree returned for each subtree.
+        """
+
+        keys = {} # (Integer, Integer) -> Tuple dictionary. Frame keys by error id and direction.
+        tasks = []
+        for subtree in subtrees:
+            task = []
+            for error in subtree.errors:
+                stackKeys = keys.get((id(error), subtree.direction))
+                if stackKeys is None:
+                    stackKeys = keys[(id(error), subtree.direction)] = getStackKeys(error, subtree.direction)
+                leak = error.leak
+                task.append((stackKeys[subtree.stackFramesShared:], error.count, error.errorKind,
+                             leak.bytes if leak is not None else 0, leak.blocks if leak is not None else 0))
+            tasks.append(task)
+        keys = None
+
+        pool = multiprocessing.Pool(min(self.numProcesses, len(tasks)))
+        try:
+            return pool.map(groupSubtree, tasks)
+        finally:
+            ## Not terminate, which can deadlock on Python 2 if a worker is
+            ## still sending its result.
+            pool.close()
+            pool.join()
+
+
+
+    def findSubtrees(self, trees): # SharedStackError list
+        """Create the first levels of the trees and find the subtrees below them
+        to send to the workers. A node is split further while it has more than
+        its share of the errors, so that there are several subtrees for each
+        worker. Subtrees that need no more nodes, or whose nodes all have the
+        same single error, are created here and left out.
+        @return The subtree roots, with their children not created.
+        """
+
+        numErrors = sum([tree.getNumErrors() for tree in trees])
+        maxSubtreeErrors = numErrors // (self.numProcesses * self.tasksPerProcess)
+
+        subtrees = []
+        pending = list(trees)
+        while len(pending) > 0:
+            node = pending.pop()
+            if len(node.endingErrors) == node.getNumErrors():
+                node.childNodes = [] # Every call stack ends here.
+            elif node.getNumErrors() == 1:
+                node.childNodes = [SharedStackError.createChain(node.errors[0], node)]
+            elif node.getNumErrors() > maxSubtreeErrors and node.stackFramesShared < self.maxSplitDepth:
+                pending.extend(node.children)
+            else:
+                subtrees.append(node)
+        return subtrees
+
+
+
+    @staticmethod
+    def attachSubtree(subtree, nodes): # None
+        """Create the nodes of a subtree from what a worker found.
+        @param subtree - SharedStackError - The subtree root.
+        @param nodes - List - What groupSubtree returned for the subtree.
+        """
+
+        errors = subtree.errors
+        direction = subtree.direction
+        subtree.childNodes = []
+        created = []
+        for node in nodes:
+            parent = created[node[0]] if node[0] >= 0 else subtree
+            if len(node) == 3:
+                child = SharedStackError.createChain(errors[node[2]], parent)
+            else:
+                parentPosition, numOccurrences, indices, endingIndices, leakedBytes, leakedBlocks, kindCounts = node
+                child = SharedStackError.createCountedNode([errors[index] for index in indices], parent.stackFramesShared + 1, direction, parent,
+                                                           numOccurrences, leakedBytes, leakedBlocks, kindCounts,
+                                                           [errors[index] for index in endingIndices])
+            parent.childNodes.append(child)
+            created.append(child)
@@ -0,0 +1,193 @@
+"""
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None # Peak memory is not reported.
+
+
+def getPeakMemory(): # Float
+    """Returns the peak resident memory of the process so far, in MiB, or None
+    if it can't be measured on this platform.
+    """
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / (1024.0 * 1024.0) # Bytes on macOS.
+    return peak / 1024.0 # Kilobytes on Linux.
+
+
+def countNodes(sharedStackError, onlyCreated=False): # Integer
+    """Returns the number of nodes in the tree rooted at a SharedStackError.
+    Children are created when they are first asked for, so counting the nodes
+    creates the whole tree, unless 'onlyCreated' is True. Then only the nodes
+    that have been created so far are counted.
+    """
+
+    numNodes = 0
+    pending = [sharedStackError]
+    while len(pending) > 0:
+        node = pending.pop()
+        numNodes += 1
+        if not onlyCreated or node.hasChildNodes():
+            pending.extend(node.children)
+    return numNodes
+
+
+
+class Phase(object):
+    """Context manager timing one run of a phase of a Profiler."""
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler # Profiler
+        self.name = name # String
+        self.start = None # Float
+
+
+    def __enter__(self): # Phase
+        self.start = time.time()
+        return self
+
+
+    def __exit__(self, excType, excValue, traceback): # Boolean
+        self.profiler.addTime(self.name, time.time() - self.start)
+        return False
+
+
+
+class NoPhase(object):
+    """Context manager that does nothing, used when profiling is off."""
+
+    def __enter__(self): # NoPhase
+        return self
+
+
+    def __exit__(self, excType, excValue, traceback): # Boolean
+        return False
+
+
+
+class Profiler(object):
+    """Records the wall time and peak memory of the phases of a run, such as
+    reading, parsing and tree building, and counters such as the number of
+    lines and errors read.
+
+    The hot paths don't report to the Profiler. They keep plain integer
+    counters of their own, e.g. ErrorParser.numLines and FileReader.numCacheHits,
+    that are handed to the Profiler once the work is done. When profiling is
+    off, phase returns a context manager that does nothing and counters are
+    ignored, so all that is left is a handful of method calls per run.
+    """
+
+    ## Shared by every disabled phase.
+    noPhase = NoPhase()
+
+    def __init__(self, enabled=True):
+        """
+        @param enabled - Boolean - Whether anything is recorded.
+        """
+
+        self.enabled = enabled # Boolean
+        self.phaseOrder = [] # String list. Phase names in order of first run.
+        self.phases = {} # String -> [Float, Integer, Float] dictionary. Seconds, runs and peak MiB of each phase.
+        self.counterOrder = [] # String list. Counter names in order of first count.
+        self.counters = {} # String -> Integer dictionary.
+
+
+    def phase(self, name): # Context manager
+        """Time the code in a with statement as a run of the named phase. A
+        phase that is run several times, e.g. once per check of a followed log,
+        accumulates its time over the runs.
+        """
+
+        if not self.enabled:
+            return Profiler.noPhase
+        return Phase(self, name)
+
+
+    def addTime(self, name, seconds): # None
+        """Add a run of the named phase. The peak memory of the phase is the
+        peak of the whole process when the run ended.
+        """
+
+        entry = self.phases.get(name)
+        if entry is None:
+            entry = self.phases[name] = [0.0, 0, None]
+            self.phaseOrder.append(name)
+        entry[0] += seconds
+        entry[1] += 1
+        entry[2] = getPeakMemory()
+
+
+    def count(self, name, number=1): # None
+        """Add 'number' to the named counter."""
+
+        if not self.enabled:
+            return
+        if name not in self.counters:
+            self.counters[name] = 0
+            self.counterOrder.append(name)
+        self.counters[name] += number
+
+
+    def getResults(self): # Dictionary
+        """Returns the phases and counters as a dictionary that can be written as JSON."""
+
+        phases = []
+        for name in self.phaseOrder:
+            seconds, runs, peak = self.phases[name]
+            phases.append({"name": name, "seconds": seconds, "runs": runs, "peakMiB": peak})
+        counters = [{"name": name, "value": self.counters[name]} for name in self.counterOrder]
+        return {"phases": phases, "counters": counters}
+
+
+    def format(self): # String list
+        """Returns the phases and counters as human readable lines."""
+
+        lines = ["%-24s %10s %6s %10s" % ("Phase", "Seconds", "Runs", "Peak MiB")]
+        for name in self.phaseOrder:
+            seconds, runs, peak = self.phases[name]
+            peakText = "%.1f" % peak if peak is not None else "-"
+            lines.append("%-24s %10.3f %6d %10s" % (name, seconds, runs, peakText))
+        lines.append("")
+        lines.append("%-24s %10s" % ("Counter", "Value"))
+        for name in self.counterOrder:
+            lines.append("%-24s %10d" % (name, self.counters[name]))
+        return lines
+
+
+    def write(self, path, output=None): # Boolean
+        """Print the results, or write them as JSON to the file at 'path'.
+        @param path - String - Path of the JSON file, or '-' to print the results as text.
+        @param output - File - Where the text and any error message are printed. Defaults to standard out.
+        @return True if the results were written.
+        """
+
+        if not self.enabled:
+            return False
+
+        if output is None:
+            output = sys.stdout
+
+        if path == "-":
+            for line in self.format():
+                output.write(line + "\n")
+            return True
+
+        try:
+            with open(path, "w") as profileFile:
+                json.dump(self.getResults(), profileFile, indent=2, separators=(",", ": "))
+                profileFile.write("\n")
+        except EnvironmentError:
+            output.write("Could not write the profile to '" + path + "'.\n")
+            return False
+        return True
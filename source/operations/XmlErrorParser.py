@@ -0,0 +1,269 @@
+"""
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
+from errors.LeakInfo import LeakInfo
+from errors.LineMatching import ErrorKind
+from errors.LineMatching import Patterns
+from errors.ParsedError import ParsedError
+from errors.Stack import Stack
+from errors.Stack import StackFrame
+from errors.Stack import stackFrames
+
+
+## The <kind> values written by Memcheck, and the ErrorKind each corresponds
+## to. Errors of other kinds are reported as unknown.
+xmlKinds = {
+    "UninitCondition": ErrorKind.CONDITIONAL_JUMP_OR_MOVE,
+    "UninitValue": ErrorKind.USE_OF_UNINITIALISED_VALUE,
+    "InvalidRead": ErrorKind.INVALID_READ,
+    "InvalidWrite": ErrorKind.INVALID_WRITE,
+    "InvalidFree": ErrorKind.INVALID_FREE,
+    "MismatchedFree": ErrorKind.MISMATCHED_FREE,
+    "Overlap": ErrorKind.OVERLAPPING_MEMCPY,
+    "SyscallParam": ErrorKind.SYSCALL_PARAM,
+    "Leak_DefinitelyLost": ErrorKind.MEMORY_LOSS,
+    "Leak_IndirectlyLost": ErrorKind.MEMORY_LOSS,
+    "Leak_PossiblyLost": ErrorKind.MEMORY_LOSS,
+    "Leak_StillReachable": ErrorKind.MEMORY_LOSS,
+}
+
+
+## The loss category of each of the leak kinds.
+leakCategories = {
+    "Leak_DefinitelyLost": LeakInfo.DEFINITELY_LOST,
+    "Leak_IndirectlyLost": LeakInfo.INDIRECTLY_LOST,
+    "Leak_PossiblyLost": LeakInfo.POSSIBLY_LOST,
+    "Leak_StillReachable": LeakInfo.STILL_REACHABLE,
+}
+
+
+def splitFunction(function): # (String, String, String)
+    """Split a demangled function name, as found in the <fn> element, into the
+    method, arguments and modifier parts of a StackFrame. For example
+    'Foo::bar(int) const' is split into 'Foo::bar', '(int)' and 'const'.
+    @return (method, arguments, modifier). Arguments and modifier are None if not present.
+    """
+
+    body = function
+    modifier = None
+    if not body.endswith(")"):
+        head, space, last = body.rpartition(" ")
+        if head.endswith(")") and last.isalpha():
+            body = head
+            modifier = last
+
+    if body.endswith(")"):
+        depth = 0
+        for index in range(len(body) - 1, 0, -1):
+            if body[index] == ")":
+                depth += 1
+            elif body[index] == "(":
+                depth -= 1
+                if depth == 0:
+                    return (body[:index], body[index:], modifier)
+
+    return (function, None, None)
+
+
+
+class XmlErrorParser(object):
+    """Converts a Valgrind log written with --xml=yes to a list of ParsedErrors.
+
+    The XML is read incrementally and every top level element is cleared as soon
+    as it has been consumed, so memory use does not grow with the size of the
+    log. The errors are built from the structured elements and never run through
+    the text patterns, so function names that the patterns can't handle are
+    read correctly.
+    """
+
+    def __init__(self):
+        self.patterns = Patterns()
+        self.resetState()
+
+
+
+    def resetState(self): # None
+        self.unknownErrors = [] # String list. Descriptions of errors of unknown kinds.
+        self.id = None # String. The process id of the log.
+
+
+
+    def parse(self, source): # (ParsedError list, string list, process id)
+        """Parse ParsedErrors from an XML Valgrind log.
+        @param source - String or file object - Path to the log, or the log itself.
+        @return Same as ErrorParser.parse.
+        """
+
+        if source is None:
+            return (None, None, None)
+
+        errorList = list(self.parseStream(source))
+
+        id = self.id
+        unknownErrors = self.unknownErrors
+        self.resetState()
+        if id is None:
+            return (None, None, None) # Not a Valgrind XML log.
+
+        return (errorList, unknownErrors, id)
+
+
+
+    def parseStream(self, source): # ParsedError generator
+        """Generator version of parse. Each ParsedError is yielded as soon as its
+        <error> element has been read. 'unknownErrors' and 'id' are available once
+        the generator has been exhausted. A log that ends in the middle, e.g.
+        because Valgrind was killed, yields the errors read up to that point.
+        """
+
+        self.resetState()
+
+        root = None
+        depth = 0
+        try:
+            for event, element in ElementTree.iterparse(source, events=("start", "end")):
+                if event == "start":
+                    if root is None:
+                        root = element
+                    depth += 1
+                    continue
+
+                depth -= 1
+                if depth != 1:
+                    continue # Not a direct child of <valgrindoutput>.
+
+                if element.tag == "pid":
+                    self.id = element.text.strip()
+                elif element.tag == "error":
+                    error = self.readError(element)
+                    if error is not None:
+                        yield error
+
+                ## Everything the parser needs from the element has been read.
+                root.clear()
+        except ElementTree.ParseError:
+            pass
+
+
+
+    def readError(self, element): # ParsedError
+        """Build a ParsedError from an <error> element. Errors of unknown kinds
+        are added to unknownErrors and None is returned. Errors without a
+        description are described by their kind, e.g. 'InvalidRead'.
+        """
+
+        what = XmlErrorParser.readDescription(element, "what", "xwhat")
+        xmlKind = element.findtext("kind")
+        kind = xmlKinds.get(xmlKind)
+        if kind is None:
+            if what is not None:
+                self.unknownErrors.append(what)
+            return None
+
+        stacks = element.findall("stack")
+        if len(stacks) == 0:
+            return None # Same as the text parser, an error must have a call stack.
+
+        if what is None:
+            what = xmlKind
+
+        error = ParsedError(what, kind, self.id)
+        error.errorStack = XmlErrorParser.readStack(stacks[0])
+        if kind == ErrorKind.MEMORY_LOSS:
+            error.leak = self.readLeak(element, what)
+
+        ## The first auxiliary description, if followed by a second stack, is
+        ## where the memory involved was allocated or freed.
+        auxWhat = XmlErrorParser.readDescription(element, "auxwhat", "xauxwhat")
+        if auxWhat is not None:
+            error.setSourceType(auxWhat)
+            if len(stacks) > 1:
+                error.sourceStack = XmlErrorParser.readStack(stacks[1])
+
+        return error
+
+
+
+    def readLeak(self, element, what): # LeakInfo
+        """Read the sizes of a leak error. The description has the same format
+        as in text logs, and is the only place the direct and indirect bytes
+        are given. The <leakedbytes> and <leakedblocks> elements are used if
+        the description can't be read.
+        """
+
+        leak = self.patterns.readLeak(what) if what is not None else None
+        if leak is not None:
+            return leak
+
+        leakedBytes = element.findtext("xwhat/leakedbytes")
+        leakedBlocks = element.findtext("xwhat/leakedblocks")
+        if leakedBytes is None or leakedBlocks is None:
+            return None
+        return LeakInfo(int(leakedBytes), int(leakedBlocks), leakCategories.get(element.findtext("kind")))
+
+
+
+    @staticmethod
+    def readDescription(element, plainTag, extendedTag): # String
+        """Returns the text of the first <what>-like child of 'element'. Some
+        kinds of errors use an extended form, e.g. <xwhat>, where the text is in
+        a <text> child.
+        """
+
+        text = element.findtext(plainTag)
+        if text is None:
+            text = element.findtext(extendedTag + "/text")
+        return text.strip() if text is not None else None
+
+
+
+    @staticmethod
+    def readStack(element): # Stack
+        stack = Stack()
+        for frameElement in element.findall("frame"):
+            stack.addCaller(XmlErrorParser.readFrame(frameElement))
+        return stack
+
+
+
+    @staticmethod
+    def readFrame(element): # StackFrame
+        """Returns the interned StackFrame for a <frame> element. The key is the
+        line Valgrind would have written for the frame in a text log.
+        """
+
+        address = element.findtext("ip")
+        function = element.findtext("fn")
+        fileName = element.findtext("file")
+        lineNumber = element.findtext("line")
+        library = element.findtext("obj")
+
+        if function is None:
+            function = "???"
+        if fileName is not None and lineNumber is not None:
+            lineNumber = int(lineNumber)
+            library = None
+            key = address + ": " + function + " (" + fileName + ":" + str(lineNumber) + ")"
+        else:
+            fileName = None
+            lineNumber = None
+            key = address + ": " + function + " (in " + str(library) + ")"
+
+        frame = stackFrames.frames.get(key)
+        if frame is not None:
+            return frame
+
+        frame = StackFrame("")
+        frame.address = address
+        frame.method, frame.arguments, frame.modifier = splitFunction(function)
+        frame.fileName = fileName
+        frame.lineNumber = lineNumber
+        frame.library = library
+        return stackFrames.internFrame(key, frame)
@@ -0,0 +1,121 @@
+"""
+Unit tests for DecompressingFile.
+
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+
+import bz2
+import gzip
+import os
+import sys
+import tempfile
+from StringIO import StringIO
+sys.path.append("../../source")
+
+from disk import DecompressingFile
+from disk.FileReader import FileReader
+from operations.ErrorParser import ErrorParser
+
+
+valgrindLogFileName = "../valgrind.errors"
+try:
+  with open(valgrindLogFileName, "rb") as valgrindLogFile:
+    contents = valgrindLogFile.read()
+except:
+  sys.exit("Could not read Valgrind log file '" + valgrindLogFileName + "'.")
+
+
+def gzipCompress(data):
+  compressed = StringIO()
+  gzipFile = gzip.GzipFile(fileobj=compressed, mode="wb")
+  gzipFile.write(data)
+  gzipFile.close()
+  return compressed.getvalue()
+
+compressors = [(DecompressingFile.GZIP, gzipCompress), (DecompressingFile.BZIP2, bz2.compress)]
+if DecompressingFile.lzma is not None:
+  compressors.append((DecompressingFile.XZ, DecompressingFile.lzma.compress))
+
+
+for compression, compress in compressors:
+  compressed = compress(contents)
+  assert FileReader.detectCompression(compressed[:6]) == compression, "Did not detect " + compression + " compression."
+
+  ## Small chunks, so that lines and streams are split between chunks.
+  for chunkSize in [7, 1000, 64 * 1024]:
+    lines = list(DecompressingFile.DecompressingFile(StringIO(compressed), compression, chunkSize))
+    assert "".join(lines) == contents, "Reading " + compression + " lines in chunks of " + str(chunkSize) + " did not give the original."
+    assert lines == contents.splitlines(True), "Did not get the original lines from " + compression + "."
+
+    decompressingFile = DecompressingFile.DecompressingFile(StringIO(compressed), compression, chunkSize)
+    pieces = []
+    piece = decompressingFile.read(100)
+    while len(piece) > 0:
+      pieces.append(piece)
+      piece = decompressingFile.read(100)
+    assert "".join(pieces) == contents, "Reading " + compression + " in pieces did not give the original."
+
+  ## Several compressed streams after each other.
+  concatenated = compress(contents[:1000]) + compress(contents[1000:])
+  for chunkSize in [7, len(compress(contents[:1000])), 64 * 1024]:
+    decompressingFile = DecompressingFile.DecompressingFile(StringIO(concatenated), compression, chunkSize)
+    assert decompressingFile.read() == contents, "Did not read all streams of a concatenated " + compression + " file."
+
+  ## Reading stops at damaged data, keeping what came before.
+  for damaged in [compressed + "trailing garbage", compressed[:len(compressed) // 2] + "\xff" * 64 + compressed[len(compressed) // 2:]]:
+    for chunkSize in [7, 64 * 1024]:
+      decompressingFile = DecompressingFile.DecompressingFile(StringIO(damaged), compression, chunkSize)
+      stdout = sys.stdout
+      sys.stdout = StringIO()
+      try:
+        data = decompressingFile.read()
+        warning = sys.stdout.getvalue()
+      finally:
+        sys.stdout = stdout
+      assert decompressingFile.damaged and "damaged" in warning, "Damaged " + compression + " data was not noticed."
+      assert contents.startswith(data), "Damaged " + compression + " data gave something else than the start of the original."
+      assert decompressingFile.read() == "" and decompressingFile.readline() == "", "Read on after damaged " + compression + " data."
+  assert not DecompressingFile.DecompressingFile(StringIO(compressed), compression).damaged, "Undamaged " + compression + " data was thought damaged."
+
+  ## Opening a compressed log gives the same errors as the plain log, and the
+  ## file is closed once the log has been read.
+  expectedErrors, expectedUnknowns, expectedId = ErrorParser().parse(contents.splitlines())
+  compressedFile = StringIO(compressed)
+  log, isXml = FileReader.openLogFile(compressedFile)
+  assert not isXml, "Compressed text log was detected as XML."
+  errors, unknowns, id = ErrorParser().parse(log)
+  assert [error.info() for error in errors] == [error.info() for error in expectedErrors], "Did not get the same errors from the " + compression + " log."
+  assert unknowns == expectedUnknowns and id == expectedId, "Did not get the same unknowns from the " + compression + " log."
+  assert compressedFile.closed, "The " + compression + " file was not closed after reading the log."
+
+  compressedFile = StringIO(compressed)
+  log, isXml = FileReader.openLogFile(compressedFile)
+  next(log)
+  log.close()
+  assert compressedFile.closed, "Closing a partly read " + compression + " log did not close the file."
+
+  handle, path = tempfile.mkstemp()
+  os.write(handle, compressed)
+  os.close(handle)
+  try:
+    log, isXml = FileReader().openLog(path)
+    errors, unknowns, id = ErrorParser().parse(log)
+    assert len(errors) == len(expectedErrors), "Did not get the same errors from the " + compression + " file."
+  finally:
+    os.remove(path)
+
+
+## Compressed XML logs are detected as XML, and closing the log closes the file.
+with open("../valgrind.xml", "rb") as xmlFile:
+  compressedFile = StringIO(gzipCompress(xmlFile.read()))
+log, isXml = FileReader.openLogFile(compressedFile)
+assert isXml, "Compressed XML log was not detected."
+with log:
+  pass
+assert compressedFile.closed, "Closing the compressed XML log did not close the file."
+
+## Uncompressed logs are passed through.
+log, isXml = FileReader.openLogFile(StringIO(contents))
+assert not isXml and "\n".join(log) == contents.rstrip("\n"), "Uncompressed log was not read as is."
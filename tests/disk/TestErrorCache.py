@@ -0,0 +1,80 @@
+"""
+Unit tests for ErrorCache.
+
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+
+import os
+import shutil
+import sys
+import tempfile
+sys.path.append("../../source")
+
+from disk.ErrorCache import ErrorCache
+from disk.FileReader import FileReader
+from errors.Stack import stackFrames
+from operations.ErrorParser import ErrorParser
+
+
+directory = tempfile.mkdtemp()
+logPath = os.path.join(directory, "valgrind.log")
+shutil.copyfile("../valgrind.errors", logPath)
+
+try:
+  errors, unknowns, id = ErrorParser().parse(FileReader().readFile(logPath))
+
+  errors[0].count = 7 # As if collapsed with repetitions.
+
+  cache = ErrorCache(logPath)
+  assert cache.cachePath == logPath + ".hvc", "Cache not stored next to the log."
+  assert cache.load() is None, "Loaded a cache that was never written."
+
+  assert cache.store(errors, unknowns, id), "Could not write the cache."
+  assert os.path.exists(cache.cachePath), "No cache file was written."
+  assert sorted(os.listdir(directory)) == ["valgrind.log", "valgrind.log.hvc"], "Temporary cache file left behind."
+
+  ## A stale temporary file of the old fixed name doesn't stop the write.
+  with open(cache.cachePath + ".tmp", "wb") as staleFile:
+    staleFile.write("stale")
+  assert cache.store(errors, unknowns, id), "Could not write the cache next to a stale temporary file."
+  assert open(cache.cachePath + ".tmp", "rb").read() == "stale", "Wrote into another run's temporary file."
+  os.remove(cache.cachePath + ".tmp")
+
+  ## A new ErrorCache reads what the first one wrote.
+  cachedErrors, cachedUnknowns, cachedId = ErrorCache(logPath).load()
+  assert len(cachedErrors) == len(errors), "Did not get all errors from the cache."
+  assert [error.info() for error in cachedErrors] == [error.info() for error in errors], "Cached errors are not the parsed errors."
+  assert [(error.errorKind, error.pid, error.logSpan, error.count, error.leak) for error in cachedErrors] == [(error.errorKind, error.pid, error.logSpan, error.count, error.leak) for error in errors], "Cached error kinds, process ids, log spans, counts or leaks differ."
+  assert len([error for error in cachedErrors if error.leak is not None]) == 2, "Leaks were not cached."
+  assert cachedUnknowns == unknowns and cachedId == id, "Cached unknowns or process id differ."
+
+  ## Frames read from the cache are the interned frames, not copies.
+  for cachedError, error in zip(cachedErrors, errors):
+    for cachedFrame, frame in zip(cachedError.errorStack.frames, error.errorStack.frames):
+      assert cachedFrame is frame or frame.key is None, "Cached frame was not interned: " + frame.fileLocation()
+    assert (cachedError.sourceStack is None) == (error.sourceStack is None), "Cached source stack presence differs."
+
+  ## Changing the log, or only its modification time, invalidates the cache.
+  with open(logPath, "ab") as logFile:
+    logFile.write("==7420== \n")
+  assert ErrorCache(logPath).load() is None, "Cache was used for a log that grew."
+
+  assert ErrorCache(logPath).store(errors, unknowns, id), "Could not rewrite the cache."
+  assert ErrorCache(logPath).load() is not None, "Rewritten cache was not used."
+  status = os.stat(logPath)
+  os.utime(logPath, (status.st_atime, status.st_mtime + 10))
+  assert ErrorCache(logPath).load() is None, "Cache was used for a log with a new modification time."
+
+  ## Corrupt caches are ignored.
+  for garbage in ["", "not a cache", open(cache.cachePath, "rb").read()[:100]]:
+    with open(cache.cachePath, "wb") as cacheFile:
+      cacheFile.write(garbage)
+    assert ErrorCache(logPath).load() is None, "Corrupt cache was used."
+
+  ## A missing log has no cache.
+  assert ErrorCache(os.path.join(directory, "missing.log")).load() is None, "Loaded a cache for a missing log."
+  assert not ErrorCache(os.path.join(directory, "missing.log")).store(errors, unknowns, id), "Stored a cache for a missing log."
+finally:
+  shutil.rmtree(directory)
@@ -0,0 +1,103 @@
+"""
+Unit tests for LogFollower.
+
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+sys.path.append("../../source")
+
+from disk.LogFollower import LogFollower
+from disk.MappedLog import MappedLog
+from operations.ErrorParser import ErrorParser
+
+
+valgrindLogFileName = "../valgrind.errors"
+try:
+  with open(valgrindLogFileName, "rb") as valgrindLogFile:
+    contents = valgrindLogFile.read()
+except:
+  sys.exit("Could not read Valgrind log file '" + valgrindLogFileName + "'.")
+
+expectedErrors, expectedUnknowns, expectedId = ErrorParser().parse(MappedLog(valgrindLogFileName))
+
+
+def describe(errors): # (String, span) list
+  return [(error.info(), error.logSpan) for error in errors]
+
+
+directory = tempfile.mkdtemp()
+logPath = os.path.join(directory, "valgrind.log")
+
+try:
+  ## Write the log in pieces of random size, often splitting lines, and poll
+  ## after every piece. The result must be the same as parsing the complete log.
+  random.seed(4711)
+  for maxPieceSize in [1, 50, 1000, len(contents)]:
+    with open(logPath, "wb") as logFile:
+      follower = LogFollower(logPath)
+      errors = []
+      written = 0
+      while written < len(contents):
+        pieceSize = random.randint(1, maxPieceSize)
+        logFile.write(contents[written:written + pieceSize])
+        logFile.flush()
+        written += pieceSize
+
+        newErrors = follower.poll()
+        assert all([error.logSpan[1] <= written for error in newErrors]), "Got an error before it was written."
+        errors.extend(newErrors)
+        assert follower.offset <= written and contents[follower.offset - 1:follower.offset] in ["", "\n"], "Parsed past the end of the last complete line."
+
+      assert follower.poll() == [], "Polling without new data gave errors."
+      errors.extend(follower.finish())
+      follower.close()
+
+    assert describe(errors) == describe(expectedErrors), "Following the log written in pieces of up to " + str(maxPieceSize) + " bytes did not give the same errors."
+    assert follower.parser.unknownErrors == expectedUnknowns and follower.parser.id == expectedId, "Following the log did not give the same unknowns."
+
+  ## An error is pending until a line after it arrives, since more callers may follow.
+  lastError = expectedErrors[-1]
+  with open(logPath, "wb") as logFile:
+    logFile.write(contents[:lastError.logSpan[1]] + "\n")
+  follower = LogFollower(logPath)
+  errors = follower.poll()
+  assert len(errors) == len(expectedErrors) - 1, "The last error was returned before it was complete."
+  with open(logPath, "ab") as logFile:
+    logFile.write("==" + expectedId + "== \n")
+  assert describe(follower.poll()) == describe([lastError]), "The last error was not completed by the next line."
+
+  ## The raw text of an error is read back from the log.
+  for error in errors:
+    assert follower.readSpan(error.logSpan) == contents[error.logSpan[0]:error.logSpan[1]], "Read the wrong text for an error."
+  follower.close()
+
+  ## A limited poll stops at a line end and the next poll continues from there.
+  with open(logPath, "wb") as logFile:
+    logFile.write(contents)
+  follower = LogFollower(logPath)
+  errors = []
+  numPolls = 0
+  while follower.offset < len(contents):
+    errors.extend(follower.poll(maxBytes=1))
+    numPolls += 1
+  errors.extend(follower.finish())
+  follower.close()
+  assert numPolls > 1, "A limited poll read the whole log."
+  assert describe(errors) == describe(expectedErrors), "Limited polls did not give the same errors."
+
+  ## Program output between the Valgrind lines is skipped.
+  with open(logPath, "wb") as logFile:
+    logFile.write("Program output\n" + contents.replace("\n==", "\nProgram output\n=="))
+  follower = LogFollower(logPath)
+  errors = follower.poll() + follower.finish()
+  follower.close()
+  assert [error.info() for error in errors] == [error.info() for error in expectedErrors], "Program output changed the errors."
+finally:
+  shutil.rmtree(directory)
@@ -0,0 +1,97 @@
+"""
+Tests for MappedLog.
+
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+
+import os
+import sys
+import tempfile
+sys.path.append("../../source")
+
+from disk.MappedLog import MappedLog
+from operations.ErrorParser import ErrorParser
+
+
+valgrindLogFileName = "../valgrind.errors"
+try:
+  with open(valgrindLogFileName, "r") as valgrindLogFile:
+    lines = valgrindLogFile.read().splitlines()
+except:
+  sys.exit("Could not read Valgrind log file '" + valgrindLogFileName + "'.")
+
+listErrors, listUnknowns, listId = ErrorParser().parse(lines)
+
+
+## Parsing the mapped log must give the same result as parsing the line list.
+log = MappedLog(valgrindLogFileName)
+errors, unknowns, id = ErrorParser().parse(log)
+
+assert len(errors) == len(listErrors), "Parsing the mapped log did not find the same number of errors."
+for mapped, listed in zip(errors, listErrors):
+  assert mapped.info() == listed.info(), "Parsing the mapped log produced a different error: '" + str(mapped) + "'."
+assert unknowns == listUnknowns, "Parsing the mapped log did not find the same unknowns."
+assert id == listId, "Parsing the mapped log did not find the same process id."
+
+
+## Every error knows its span in the log, and the text in that span is the
+## error as Valgrind printed it. Parsing that text again gives the same error.
+for error in errors:
+  assert error.logSpan != None, "Error '" + str(error) + "' did not get a log span."
+  text = log.readSpan(error.logSpan)
+  assert text.startswith("==7420== " + error.errorType), "Span of '" + str(error) + "' doesn't start at the error: '" + text[:40] + "'."
+  assert not text.endswith("\n"), "Span of '" + str(error) + "' includes the trailing newline."
+  reparsed, reparsedUnknowns, reparsedId = ErrorParser().parse(text.splitlines())
+  assert len(reparsed) == 1, "Span of '" + str(error) + "' does not contain exactly one error."
+  assert reparsed[0].info() == error.info(), "Span of '" + str(error) + "' does not contain the same error."
+
+log.close()
+
+
+## Program output interleaved with the Valgrind lines is skipped, and the byte
+## range can be restricted to a part of the file.
+interleaved = [
+  "program output",
+  "==1== Invalid write of size 8",
+  "== not Valgrind, but starts with the marker",
+  "==1==    at 0x400A5F: setArray(double*) (errorProducingApplication.cpp:54)",
+  "more program output with == inside",
+  "==1==    by 0x400C7C: main (errorProducingApplication.cpp:89)",
+  "",
+  "==1== ",
+]
+handle, path = tempfile.mkstemp()
+try:
+  os.write(handle, ("\n".join(interleaved) + "\n").encode("utf-8"))
+  os.close(handle)
+
+  log = MappedLog(path)
+  yielded = list(log)
+  assert yielded == [line for line in interleaved if line.startswith("==")], "Did not get exactly the lines starting with the marker."
+
+  errors, unknowns, id = ErrorParser().parse(log)
+  assert len(errors) == 1 and len(errors[0].errorStack.frames) == 2, "Program output interfered with parsing."
+  text = log.readSpan(errors[0].logSpan)
+  assert text.splitlines() == interleaved[1:6], "The span did not cover the error and the interleaved output."
+
+  secondLine = len(interleaved[0]) + 1
+  partial = MappedLog(path, secondLine, secondLine + len(interleaved[1]) + 1)
+  assert list(partial) == [interleaved[1]], "The byte range was not respected."
+  partial.close()
+  log.close()
+finally:
+  os.remove(path)
+
+
+## Empty files cannot be mapped, but are still valid logs without lines.
+handle, path = tempfile.mkstemp()
+try:
+  os.close(handle)
+  empty = MappedLog(path)
+  assert list(empty) == [], "Got lines from an empty file."
+  assert ErrorParser().parse(empty) == (None, None, None), "Parsed errors from an empty file."
+  empty.close()
+finally:
+  os.remove(path)
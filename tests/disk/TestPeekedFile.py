@@ -0,0 +1,44 @@
+"""
+Unit tests for PeekedFile.
+
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+
+import sys
+from StringIO import StringIO
+sys.path.append("../../source")
+
+from disk.PeekedFile import PeekedFile
+
+
+contents = "==7420== Memcheck, a memory error detector\n==7420== Command: ./a.out\n==7420== \n"
+
+peeked = PeekedFile(StringIO(contents))
+assert peeked.head == "==7420== Memcheck, a memory error detector\n", "Did not peek at the first line."
+assert list(peeked) == contents.splitlines(True), "Iterating did not give all lines, including the first."
+
+peeked = PeekedFile(StringIO(contents))
+assert peeked.read() == contents, "Reading everything did not give the whole file."
+
+peeked = PeekedFile(StringIO(contents))
+chunks = []
+chunk = peeked.read(7)
+while len(chunk) > 0:
+  assert len(chunk) <= 7, "Read more than asked for."
+  chunks.append(chunk)
+  chunk = peeked.read(7)
+assert "".join(chunks) == contents, "Reading in chunks did not give the whole file."
+
+peeked = PeekedFile(StringIO(contents))
+assert peeked.readline() == peeked.head, "First readline did not return the peeked line."
+assert peeked.readline() == "==7420== Command: ./a.out\n", "Second readline did not continue after the peeked line."
+
+peeked = PeekedFile(StringIO(""))
+assert peeked.head == "" and peeked.read() == "" and list(peeked) == [], "Empty file was not empty."
+
+wrapped = StringIO(contents)
+with PeekedFile(wrapped) as peeked:
+  assert peeked.readline() == peeked.head, "Could not read within a with statement."
+assert wrapped.closed, "Leaving the with statement did not close the wrapped file."
@@ -0,0 +1,142 @@
+"""
+Unit tests for CompressedStackError.
+
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+
+import sys
+import StringIO
+sys.path.append("../../source")
+
+from operations.ErrorParser import ErrorParser
+from operations.Profiler import countNodes
+from errors.CompressedStackError import CompressedStackError
+from errors.SharedStackError import SharedStackError
+from errors.Stack import Stack
+
+valgrindLogFileName = "../valgrind.errors"
+try:
+  with open(valgrindLogFileName, "r") as valgrindLogFile:
+    lines = valgrindLogFile.read().splitlines()
+except:
+  sys.exit("Could not read Valgrind log file '" + valgrindLogFileName + "'.")
+
+errors, unknowns, pid = ErrorParser().parse(lines)
+
+
+def printed(errorTree): # String
+  stdout = sys.stdout
+  sys.stdout = StringIO.StringIO()
+  try:
+    errorTree.printTree()
+    return sys.stdout.getvalue()
+  finally:
+    sys.stdout = stdout
+
+
+def checkAgainstShared(compressedNode, sharedNode):
+  """Every compressed node is a run of shared nodes, starting at 'sharedNode',
+  that each have a single child and no ending errors, except the last, which
+  has the same errors, counts and children as the compressed node.
+  """
+  location = str(compressedNode.getLocation())
+  frames = compressedNode.getRunFrames()
+  assert len(frames) == compressedNode.getNumRunFrames(), "Wrong number of run frames at " + location
+  node = sharedNode
+  for index, frame in enumerate(frames):
+    if index > 0:
+      assert len(node.children) == 1 and len(node.getEndingErrors()) == 0, "Compressed a node that isn't a run at " + location
+      node = node.children[0]
+    assert node.getLocation() == frame, "Wrong run frame at " + location
+  assert node.stackFramesShared == compressedNode.stackFramesShared, "Run has the wrong length at " + location
+  assert sorted(map(id, node.errors)) == sorted(map(id, compressedNode.errors)), "Wrong errors at " + location
+  assert node.getEndingErrors() == compressedNode.getEndingErrors(), "Wrong ending errors at " + location
+  assert node.numOccurrences == compressedNode.numOccurrences, "Wrong number of reports at " + location
+  assert node.kindCounts == compressedNode.kindCounts, "Wrong error kinds at " + location
+  assert node.getNearestSourceLocation() is compressedNode.getNearestSourceLocation() or node.stackFramesShared == 0, "Wrong nearest source frame at " + location
+  assert (node.leakedBytes, node.leakedBlocks) == (compressedNode.leakedBytes, compressedNode.leakedBlocks), "Wrong leak totals at " + location
+  assert len(node.children) == len(compressedNode.children), "Wrong number of children at " + location
+  for sharedChild, compressedChild in zip(node.children, compressedNode.children):
+    assert compressedChild.firstFrame == compressedNode.stackFramesShared, "Child run doesn't start at its parent at " + location
+    assert compressedNode.start <= compressedChild.start and compressedChild.end <= compressedNode.end, "Child range outside its parent at " + location
+    assert sharedChild.getLocation() == compressedChild.getRunFrames()[0], "Children in the wrong order at " + location
+    checkAgainstShared(compressedChild, sharedChild)
+
+
+## The compressed tree holds the same information as the shared tree.
+for direction in [Stack.FROM_BOTTOM, Stack.FROM_TOP]:
+  sharedTree = SharedStackError(errors, 0, direction)
+  compressedTree = CompressedStackError.build(errors, direction)
+  assert compressedTree.getNumRunFrames() == 0, "The root covers stack frames."
+  assert compressedTree.getNumErrors() == len(errors), "The root doesn't hold every error."
+  assert str(compressedTree.getLocation()) == str(sharedTree.getLocation()), "Wrong root location."
+  checkAgainstShared(compressedTree, sharedTree)
+  assert printed(compressedTree) == printed(sharedTree), "The trees print differently."
+  assert countNodes(compressedTree) < countNodes(sharedTree), "Nothing was compressed."
+
+
+## Building doesn't change the list of errors.
+errorsBefore = errors[:]
+CompressedStackError.build(errors, Stack.FROM_BOTTOM)
+assert errors == errorsBefore, "Building the tree changed the error list."
+assert countNodes(CompressedStackError.build([], Stack.FROM_TOP)) == 1, "An empty tree is a single node."
+
+
+## Deep call stacks are a few nodes, however deep they are. From the bottom
+## main and the levels are one run, from the top each leaf and its callers are.
+depth = 60
+deepLines = ["==1== Memcheck, a memory error detector"]
+for branch in range(100):
+  deepLines.append("==1== Invalid read of size 4")
+  deepLines.append("==1==    at 0x50%04X: leaf%d() (leaf.cpp:%d)" % (branch, branch % 10, branch % 10))
+  for level in range(depth, 0, -1):
+    deepLines.append("==1==    by 0x40%04X: level%d() (levels.cpp:%d)" % (level, level, level))
+  deepLines.append("==1==    by 0x400100: main (main.cpp:10)")
+  deepLines.append("==1== ")
+deepErrors, deepUnknowns, deepPid = ErrorParser().parse(deepLines)
+assert len(deepErrors) == 100, "Did not parse the deep errors."
+for direction, numShared, numCompressed in [(Stack.FROM_BOTTOM, 1 + depth + 1 + 10, 1 + 1 + 10), (Stack.FROM_TOP, 1 + 10 * (depth + 2), 1 + 10)]:
+  sharedTree = SharedStackError(deepErrors, 0, direction)
+  compressedTree = CompressedStackError.build(deepErrors, direction)
+  checkAgainstShared(compressedTree, sharedTree)
+  assert printed(compressedTree) == printed(sharedTree), "The deep trees print differently."
+  assert countNodes(sharedTree) == numShared, "Unexpected shared tree."
+  assert countNodes(compressedTree) == numCompressed, "Deep runs were not compressed."
+bottomTree = CompressedStackError.build(deepErrors, Stack.FROM_BOTTOM)
+assert len(bottomTree.children) == 1 and bottomTree.children[0].getNumRunFrames() == depth + 1, "main and the levels are not one run."
+assert [child.numOccurrences for child in bottomTree.children[0].children] == [10] * 10, "Wrong leaves below the run."
+
+
+## Call stacks deeper than the recursion limit.
+deepLines = ["==1== Memcheck, a memory error detector"]
+for branch in range(3):
+  deepLines.append("==1== Invalid read of size 4")
+  deepLines.append("==1==    at 0x500000: readToken() (lexer.cpp:%d)" % (10 + branch))
+  for level in range(1500):
+    deepLines.append("==1==    by 0x40%04X: parseExpression() (parser.cpp:%d)" % (level, 100 + level % 2))
+  deepLines.append("==1==    by 0x400100: main (main.cpp:10)")
+  deepLines.append("==1== ")
+deepErrors, deepUnknowns, deepPid = ErrorParser().parse(deepLines)
+for direction, numCompressed in [(Stack.FROM_BOTTOM, 1 + 1 + 3), (Stack.FROM_TOP, 1 + 3)]:
+  sharedTree = SharedStackError(deepErrors, 0, direction)
+  compressedTree = CompressedStackError.build(deepErrors, direction)
+  assert printed(compressedTree) == printed(sharedTree), "The deepest trees print differently."
+  assert countNodes(compressedTree) == numCompressed, "Deepest runs were not compressed."
+
+
+## Children are only created when they are asked for. Creating them reorders
+## only the node's own range, so the other nodes keep their errors.
+lazyTree = CompressedStackError.build(errors, Stack.FROM_TOP)
+assert not lazyTree.hasChildNodes(), "Children were created before they were asked for."
+assert lazyTree.numOccurrences == len(errors) and lazyTree.leakedBytes == 160, "Counts not known before the children."
+children = lazyTree.children
+assert not any([child.hasChildNodes() for child in children]), "Asking for children created more than one level."
+assert all([child.getEndingErrors() == [error for error in child.errors if error.errorStack.getNumFrames() == child.stackFramesShared] for child in children]), "Ending errors not known before the children."
+assert not any([child.hasChildNodes() for child in children]), "Asking for the ending errors created children."
+childErrors = [sorted(map(id, child.errors)) for child in children]
+for child in reversed(children):
+  child.children
+assert [sorted(map(id, child.errors)) for child in children] == childErrors, "Creating children changed the errors of other nodes."
+checkAgainstShared(lazyTree, SharedStackError(errors, 0, Stack.FROM_TOP))
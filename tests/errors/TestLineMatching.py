@@ -11,6 +11,8 @@ import sys
 sys.path.append("../../source")
 
 from errors.LineMatching import Patterns
+from errors.LineMatching import ErrorKind
+from errors.LeakInfo import LeakInfo
 
 patterns = Patterns();
 
@@ -40,10 +42,10 @@ expectInvalidRead = 7
 expectInvalidWrite = 4
 expectMissmatchFreeDelete = 2
 expectInvalidFreeDelete = 0
-expectMemoryLoss = 0
+expectMemoryLoss = 2
 expectStackAllocation = 14
 expectHeapAllocation = 13
-expectError = 27
+expectError = 29
 expectSource = 27
 
 numValgrind = 0;
@@ -128,4 +130,149 @@ assert numMemoryLoss == expectMemoryLoss, "Did not find the expected number of m
 assert numStackAllocation == expectStackAllocation, "Did not find the expected number of stack allocation sources."
 assert numHeapAllocation == expectHeapAllocation, "Did not find the expected number of head allocation sources."
 assert numError == expectError, "Did not find the expected number of error starts."
-assert numSource == expectSource, "Did not find the expected number of sources."
\ No newline at end of file
+assert numSource == expectSource, "Did not find the expected number of sources."
+
+
+
+## Differential test of Patterns.classifyError against the individual error
+## patterns. Every line of the test log, both with and without the Valgrind
+## prefix, must be classified as the first individual pattern that matches it,
+## in the order that isErrorStart used to test them.
+kindPatterns = [
+  (ErrorKind.CONDITIONAL_JUMP_OR_MOVE, patterns.isConditionalJumpOrMoveDependsOnUninitialisedValues),
+  (ErrorKind.INVALID_READ, patterns.isInvalidRead),
+  (ErrorKind.INVALID_WRITE, patterns.isInvalidWrite),
+  (ErrorKind.MISMATCHED_FREE, patterns.isMissmatchedFreeDelete),
+  (ErrorKind.INVALID_FREE, patterns.isInvalidFreeDelete),
+  (ErrorKind.MEMORY_LOSS, patterns.isMemoryLoss),
+  (ErrorKind.USE_OF_UNINITIALISED_VALUE, patterns.isUseOfUninitialisedValue),
+  (ErrorKind.SYSCALL_PARAM, patterns.isSyscallParam),
+  (ErrorKind.NOT_STACKED_MALLOCED, patterns.isNotStackedMalloced),
+  (ErrorKind.OVERLAPPING_MEMCPY, patterns.isOverlappingMemcpy),
+]
+assert [kind for kind, pattern in kindPatterns] == list(ErrorKind.ALL), "ErrorKind.ALL is not in pattern order."
+
+def classifyWithIndividualPatterns(line):
+  for kind, pattern in kindPatterns:
+    if pattern.match(line) is not None:
+      return kind
+  return None
+
+differentialFileName = "../valgrind.test"
+try :
+  with open(differentialFileName) as differentialFile:
+    differentialLines = differentialFile.read().splitlines()
+except:
+  sys.exit("Could not read file '" + differentialFileName + "'.")
+
+## Lines that only the anchored patterns can match once the prefix is gone.
+differentialLines += [
+  "Use of uninitialised value of size 8",
+  "Syscall param write(buf) points to uninitialised byte(s)",
+  "Source and destination overlap in memcpy(0x5a1d040, 0x5a1d044, 8)",
+  "Invalid free() / delete / delete[] / realloc()",
+  "1,024 (512 direct, 512 indirect) bytes in 2 blocks are definitely lost in loss record 3 of 7",
+]
+
+numClassified = 0
+for line in differentialLines:
+  candidates = [line]
+  if patterns.isValgrind.match(line) != None:
+    candidates.append(patterns.stripValgrind.match(line).group(1).strip())
+  for candidate in candidates:
+    expected = classifyWithIndividualPatterns(candidate)
+    kind = patterns.classifyError(candidate)
+    assert kind == expected, "Line '" + candidate + "' was classified as " + str(kind) + " but the individual patterns say " + str(expected) + "."
+    assert patterns.isErrorStart(candidate) == (expected is not None), "isErrorStart disagrees with the individual patterns for '" + candidate + "'."
+    if kind is not None:
+      numClassified += 1
+
+assert numClassified > len(ErrorKind.ALL), "Differential test classified suspiciously few lines."
+
+
+
+## Patterns.splitValgrind must agree with the isValgrind, readId and
+## stripValgrind regular expressions on every line.
+for line in lines + differentialLines + ["==12==== x", "==== x", "==12==", "== 12== x", "==1a== x", "==42== "]:
+  split = patterns.splitValgrind(line)
+  if patterns.isValgrind.match(line) == None:
+    assert split == None, "splitValgrind accepted the non-Valgrind line '" + line + "'."
+  else:
+    expectedPid = patterns.readId.match(line).group(1)
+    expectedPayload = patterns.stripValgrind.match(line).group(1).strip()
+    assert split == (expectedPid, expectedPayload), "splitValgrind gave " + str(split) + " for '" + line + "'."
+
+
+
+## Leak sizes are read from memory loss lines.
+leakLines = [
+  ("80 bytes in 1 blocks are definitely lost in loss record 1 of 2", LeakInfo(80, 1, LeakInfo.DEFINITELY_LOST)),
+  ("==7420== 80 bytes in 1 blocks are definitely lost in loss record 1 of 2", LeakInfo(80, 1, LeakInfo.DEFINITELY_LOST)),
+  ("1,024 (512 direct, 512 indirect) bytes in 2 blocks are definitely lost in loss record 3 of 7", LeakInfo(1024, 2, LeakInfo.DEFINITELY_LOST, 512, 512)),
+  ("1,048,576 bytes in 1,000 blocks are still reachable in loss record 9 of 9", LeakInfo(1048576, 1000, LeakInfo.STILL_REACHABLE)),
+  ("16 bytes in 1 blocks are possibly lost in loss record 1 of 1", LeakInfo(16, 1, LeakInfo.POSSIBLY_LOST)),
+  ("32 bytes in 4 blocks are indirectly lost in loss record 2 of 5", LeakInfo(32, 4, LeakInfo.INDIRECTLY_LOST)),
+]
+for line, expected in leakLines:
+  leak = patterns.readLeak(line)
+  assert leak == expected, "Read " + str(leak and leak.getFields()) + " from '" + line + "'."
+  assert patterns.classifyError(line) == ErrorKind.MEMORY_LOSS, "Leak line '" + line + "' was not classified as a memory loss."
+
+for line in ["Invalid read of size 4", "definitely lost: 160 bytes in 2 blocks", "80 bytes in 1 blocks are definitely lost"]:
+  assert patterns.readLeak(line) is None, "Read a leak from '" + line + "'."
+
+
+
+## Differential test of the stack frame tokenizer against the stack frame
+## patterns, over the test logs and a large number of generated frames. The
+## frames are built from parts that are valid in Valgrind output, parts that
+## the patterns only accept in some positions, and parts that they reject.
+import random
+from errors.LineMatching import FrameTokenizer
+
+frameGroups = ("address", "method", "arguments", "modifier", "fileName", "lineNumber", "library")
+
+def readWithPattern(line):
+  match = patterns.isAnyStackFrame.match(line)
+  if match is None:
+    return FrameTokenizer.NO_FRAME
+  return match.group(*frameGroups)
+
+generator = random.Random(4711)
+prefixes = ["at ", "by ", "   at ", "==12== by ", "x", "cat ", "at  ", ""]
+addresses = ["0x4C2AB80", "0x0", "0xdeadBEEF", "0x", "0xZZ", "0x12:", "0x12 "]
+methods = ["main", "set", "???", "(?)", "(?))", "Foo::bar", "(anonymous namespace)::run", "(anonymous namespace)",
+           "std::vector<int, std::allocator<int> >::push_back", "operator new[]", "operator()", "operator<<",
+           "~Foo", "memcpy@@GLIBC_2.14", "(below main)", "_dl_start", "a b", "f-g", "", " ", "x at 0x1: y", "__libc_start_main"]
+argumentLists = ["", "()", "(int)", "(char const*, unsigned long)", "(int (*)(int))", "(std::pair<int, int>&)",
+                 "(int", "(a) (b)", "(in libc)", "(x.cpp:1)", "(void*) ", "( )", "(int[4])"]
+modifiers = ["", " const", " volatile", " const ", " &&", "  ", " c-d"]
+locations = [" (main.cpp:20)", " (errorProducingApplication.cpp:37)", " (in /usr/lib/valgrind/vgpreload_memcheck-amd64-linux.so)",
+             " (in libc)", " (in /lib/ld-2.19.so)", " (vg_replace_malloc.c:1,234)", " (a.c:1)", " (ab:1)", " (a.+:1)",
+             " (x y/z-w.cpp:12)", " (in a:b)", " (in a b)", " (main.cpp:)", " (main.cpp:20) extra", " (main.cpp:20", "",
+             "(main.cpp:20)", " (in )", " (in /lib/x.so) by 0x1: f",
+             " (a.c:12:34)", " (a.c:1x:2)", " (in a) (b.c:1)", " (in a)x", " (a.c:1)(in b)", " (:1)", " (a-:1)", " (.c:1)"]
+
+def generateFrame():
+  return generator.choice(prefixes) + generator.choice(addresses) + ": " + generator.choice(methods) + \
+    generator.choice(argumentLists) + generator.choice(modifiers) + generator.choice(locations)
+
+tokenizer = patterns.frameTokenizer
+frameLines = lines + differentialLines + [generateFrame() for i in range(30000)]
+numHandled = 0
+for line in frameLines:
+  fields = tokenizer.tokenize(line)
+  if fields is not None:
+    numHandled += 1
+    assert fields == readWithPattern(line), "Tokenizer gave " + str(fields) + " but the pattern gave " + str(readWithPattern(line)) + " for '" + line + "'."
+  assert patterns.readStackFrame(line) == readWithPattern(line), "readStackFrame disagrees with the pattern for '" + line + "'."
+  assert patterns.isStackFrameTopLine(line) == (patterns.isStackFrameTop.match(line) is not None), "isStackFrameTopLine disagrees for '" + line + "'."
+  assert patterns.isStackFrameCallerLine(line) == (patterns.isStackFrameCaller.match(line) is not None), "isStackFrameCallerLine disagrees for '" + line + "'."
+  assert patterns.isAnyStackFrameLine(line) == (patterns.isAnyStackFrame.match(line) is not None), "isAnyStackFrameLine disagrees for '" + line + "'."
+
+assert numHandled > 0.9 * len(frameLines), "The tokenizer fell back to the pattern for " + str(len(frameLines) - numHandled) + " of " + str(len(frameLines)) + " lines."
+
+## Every stack frame of the test log is handled without the pattern.
+for line in lines:
+  if patterns.isAnyStackFrameLine(line):
+    assert tokenizer.tokenize(line) not in (None, FrameTokenizer.NO_FRAME), "The tokenizer did not handle '" + line + "'."
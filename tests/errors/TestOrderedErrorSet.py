@@ -0,0 +1,65 @@
+"""
+Unit tests for OrderedErrorSet.
+
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+
+import sys
+sys.path.append("../../source")
+
+from errors.OrderedErrorSet import OrderedErrorSet
+from operations.ErrorParser import ErrorParser
+
+
+valgrindLogFileName = "../valgrind.errors"
+try:
+  with open(valgrindLogFileName, "r") as valgrindLogFile:
+    lines = valgrindLogFile.read().splitlines()
+except:
+  sys.exit("Could not read Valgrind log file '" + valgrindLogFileName + "'.")
+
+errors, unknowns, pid = ErrorParser().parse(lines * 10)
+assert len(errors) > 20, "Too few errors to test with."
+
+
+## Reads like the list it was created from.
+errorSet = OrderedErrorSet(errors)
+assert len(errorSet) == len(errors) and list(errorSet) == errors, "Not the errors it was created from."
+assert errorSet == errors and errors == errorSet and errorSet == OrderedErrorSet(errors), "Did not compare equal to the same errors."
+assert errorSet != errors[1:] and errorSet != None, "Compared equal to other errors."
+assert errorSet[0] is errors[0] and errorSet[-1] is errors[-1] and errorSet[3:5] == errors[3:5], "Indexing differs from the list."
+assert errors[4] in errorSet, "An error in the set was not found."
+
+## Removing keeps the order of the remaining errors, also across compaction.
+remaining = errors[:]
+for error in errors[::3] + errors[1::3]:
+  errorSet.remove(error)
+  remaining.remove(error)
+  assert len(errorSet) == len(remaining) and errorSet == remaining, "Removing did not keep the order."
+  assert errorSet[0] is remaining[0] and error not in errorSet, "Wrong first error after removing."
+  assert len(errorSet.items) < 2 * len(remaining) + 2, "Holes were not closed."
+errorSet.append(errors[0])
+assert list(errorSet) == remaining + [errors[0]] and errorSet[len(remaining)] is errors[0], "Appending after removing differs from the list."
+
+## Removing a missing error raises like a list, and changes nothing.
+try:
+  errorSet.remove(errors[1])
+  assert False, "Removed an error that isn't in the set."
+except ValueError:
+  pass
+assert list(errorSet) == remaining + [errors[0]], "Removing a missing error changed the set."
+
+## An error added twice is removed once, the first occurrence, like from a list.
+twice = OrderedErrorSet([errors[0], errors[1], errors[0]])
+twice.remove(errors[0])
+assert list(twice) == [errors[1], errors[0]], "Did not remove the first of an error added twice."
+twice.remove(errors[0])
+twice.remove(errors[1])
+assert len(twice) == 0 and list(twice) == [] and twice == [], "Not empty after removing every error."
+try:
+  twice[0]
+  assert False, "Indexed an empty set."
+except IndexError:
+  pass
@@ -6,11 +6,15 @@ See LICENSE for licensing information.
 """
 
 
+import gc
 import sys
+import types
 sys.path.append("../../source")
 
 from errors.LineMatching import Patterns
 from errors.ParsedError import ParsedError
+from errors.Stack import Stack
+from operations.ErrorParser import ErrorParser
 
 
 valgrindLog = [
@@ -62,3 +66,60 @@ for i in range(0,2):
   lineIndex += 1
 
 assert lineIndex == len(valgrindLog), "Did not run out of lines when expected to. i="+str(lineIndex)+", len(lines)="+str(len(valgrindLog))
+
+assert error.getStackFrame(0, Stack.FROM_TOP).lineNumber == 400, "Line numbers are not stored as integers."
+assert error.sourceStack.getNumFrames() == 3, "Did not get the expected number of source stack frames."
+assert ParsedError("Invalid read of size 4").sourceStack is None, "Errors without a source should not have a source stack."
+
+
+## Duplicate keys ignore addresses, in frames as well as in diagnostic lines.
+def parseSingle(lines): # ParsedError
+  errors, unknowns, id = ErrorParser().parse(lines + ["==7420== "])
+  assert len(errors) == 1, "Expected a single error."
+  return errors[0]
+
+invalidWrite = [
+  "==7420== Invalid write of size 8",
+  "==7420==    at 0x400A5F: setArray(double*) (errorProducingApplication.cpp:54)",
+  "==7420==    by 0x400C7C: main (errorProducingApplication.cpp:89)",
+  "==7420==  Address 0x5a1d038 is 8 bytes before a block of size 80 alloc'd",
+  "==7420==    at 0x4C2B800: operator new[](unsigned long) (in /usr/lib/valgrind/vgpreload_memcheck-amd64-linux.so)",
+]
+original = parseSingle(invalidWrite)
+assert original.count == 1 and "Reported" not in original.info(), "A new error was reported more than once."
+moved = parseSingle([line.replace("0x4", "0x6").replace("0x5a1d038", "0x5a2f000") for line in invalidWrite])
+assert moved.getDuplicateKey() == original.getDuplicateKey(), "Duplicate key depends on addresses."
+otherLine = parseSingle([line.replace(":89)", ":90)") for line in invalidWrite])
+assert otherLine.getDuplicateKey() != original.getDuplicateKey(), "Duplicate key ignores line numbers."
+otherSize = parseSingle([line.replace("size 80", "size 40") for line in invalidWrite])
+assert otherSize.getDuplicateKey() != original.getDuplicateKey(), "Duplicate key ignores the source description."
+original.count = 3
+assert "Reported 3 times." in original.info(), "Count is not part of the error info."
+
+
+
+## Memory use. Parse a synthetic log and measure everything reachable from the
+## errors, shared objects counted once.
+def getReachableSize(root): # Integer
+  seen = set()
+  pending = [root]
+  size = 0
+  while len(pending) > 0:
+    obj = pending.pop()
+    if id(obj) in seen or isinstance(obj, (type, types.ModuleType, types.FunctionType)):
+      continue
+    seen.add(id(obj))
+    size += sys.getsizeof(obj)
+    pending.extend(gc.get_referents(obj))
+  return size
+
+syntheticLog = []
+for repetition in range(100):
+  for line in valgrindLog:
+    syntheticLog.append(line.replace("==7420==", "==" + str(7420 + repetition % 4) + "=="))
+errors, unknowns, pid = ErrorParser().parse(syntheticLog)
+assert len(errors) == 100, "Did not parse the synthetic log."
+
+bytesPerError = getReachableSize(errors) // len(errors)
+print("Memory per parsed error: " + str(bytesPerError) + " bytes.")
+assert bytesPerError < 1000, "A parsed error uses " + str(bytesPerError) + " bytes. Did something lose its __slots__?"
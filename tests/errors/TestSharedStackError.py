@@ -6,12 +6,14 @@ See LICENSE for licensing information.
 """
 
 
+import StringIO
 import sys
 sys.path.append("../../source")
 
 from operations.ErrorParser import ErrorParser
 from errors.SharedStackError import SharedStackError
 from errors.Stack import Stack
+from errors.Stack import StackFrame
 
 valgrindLogFileName = "../valgrind.errors"
 try:
@@ -31,3 +33,277 @@ errorTree = SharedStackError(errors, 0, Stack.FROM_BOTTOM)
 
 if "--print" in sys.argv:
   errorTree.printTree()
+
+
+def describeTree(errorTree): # Nested tuples
+  """The shape of a tree with the errors at each node. Children are compared
+  regardless of order."""
+  children = sorted([describeTree(child) for child in errorTree.children])
+  return (str(errorTree.getLocation()), [errors.index(error) for error in errorTree.errors], children)
+
+def findErrorNodes(errorTree, error): # SharedStackError list
+  """The nodes that the error passes through, from the root and down."""
+  nodes = [errorTree]
+  for child in errorTree.children:
+    if error in child.errors:
+      nodes.extend(findErrorNodes(child, error))
+      break
+  return nodes
+
+## Inserting errors one at a time gives the same tree as building it at once.
+for direction in [Stack.FROM_BOTTOM, Stack.FROM_TOP]:
+  completeTree = SharedStackError(errors, 0, direction)
+  growingTree = SharedStackError([], 0, direction)
+  for error in errors:
+    numNodes = len(findErrorNodes(growingTree, error))
+    changedNodes = growingTree.insert(error)
+    assert changedNodes[0] is growingTree, "The root was not reported as changed."
+    ## Nodes below a new branch are not reported, only the root of the branch.
+    assert changedNodes == findErrorNodes(growingTree, error)[:len(changedNodes)], "Did not report the nodes along the error's call stack."
+    assert len(changedNodes) >= numNodes, "Did not report all existing nodes the error passes through."
+    for parent, child in zip(changedNodes, changedNodes[1:]):
+      assert child in parent.children, "Reported nodes are not a path in the tree."
+  assert describeTree(growingTree) == describeTree(completeTree), "Inserting errors did not give the same tree as building it."
+
+  ## Inserting an error that is already in the tree adds a copy along the same
+  ## path, without creating any new nodes.
+  numChildren = len(growingTree.children)
+  changedNodes = growingTree.insert(errors[0])
+  assert changedNodes == findErrorNodes(growingTree, errors[0]), "Reinserting did not follow the existing path."
+  assert all([node.errors.count(errors[0]) == 2 for node in changedNodes]), "Reinserted error not added to every node on the path."
+  assert len(growingTree.children) == numChildren, "Reinserting created a new branch."
+
+
+## Leak totals of every node are the sums of the leaks of its errors.
+def checkLeakTotals(errorTree):
+  leaks = [error.leak for error in errorTree.errors if error.leak is not None]
+  assert errorTree.leakedBytes == sum([leak.bytes for leak in leaks]), "Wrong leaked bytes at " + str(errorTree.getLocation())
+  assert errorTree.leakedBlocks == sum([leak.blocks for leak in leaks]), "Wrong leaked blocks at " + str(errorTree.getLocation())
+  for child in errorTree.children:
+    checkLeakTotals(child)
+
+errors, unknowns, pid = ErrorParser().parse(lines)
+leakingErrors = [error for error in errors if error.leak is not None]
+assert len(leakingErrors) > 0, "There are no leaks in the test log."
+for direction in [Stack.FROM_BOTTOM, Stack.FROM_TOP]:
+  errorTree = SharedStackError(errors, 0, direction)
+  assert errorTree.leakedBytes == 160 and errorTree.leakedBlocks == 2, "Wrong leak totals at the root."
+  checkLeakTotals(errorTree)
+
+  growingTree = SharedStackError([], 0, direction)
+  for error in errors:
+    growingTree.insert(error)
+  checkLeakTotals(growingTree)
+
+
+## Children are ordered by number of reports, and among equals by first
+## appearance. Each child holds the errors that continue through its frame, in
+## their original order, and errors whose call stacks end at a node go nowhere.
+def checkChildren(errorTree):
+  numReports = [child.numOccurrences for child in errorTree.children]
+  assert numReports == sorted(numReports, reverse=True), "Children not ordered by number of reports at " + str(errorTree.getLocation())
+  index = errorTree.stackFramesShared
+  continuing = [error for error in errorTree.errors if error.getStackFrame(index, errorTree.direction) is not None]
+  assert sum([len(child.errors) for child in errorTree.children]) == len(continuing), "Errors lost or duplicated at " + str(errorTree.getLocation())
+  for child in errorTree.children:
+    frame = child.errors[0].getStackFrame(index, errorTree.direction)
+    assert child.errors == [error for error in continuing if error.getStackFrame(index, errorTree.direction) == frame], "Wrong errors in child " + str(child.getLocation())
+  for first, second in zip(errorTree.children, errorTree.children[1:]):
+    if first.numOccurrences == second.numOccurrences:
+      assert continuing.index(first.errors[0]) < continuing.index(second.errors[0]), "Equal children not in order of appearance at " + str(errorTree.getLocation())
+  for child in errorTree.children:
+    checkChildren(child)
+
+for direction in [Stack.FROM_BOTTOM, Stack.FROM_TOP]:
+  checkChildren(SharedStackError(errors, 0, direction))
+
+
+## A wide node, main calling thousands of distinct methods, gets one child per method.
+numCallees = 3000
+wideLines = ["==1== Memcheck, a memory error detector"]
+for callee in range(numCallees):
+  for repetition in range(1 + callee % 3):
+    wideLines.append("==1== Invalid read of size 4")
+    wideLines.append("==1==    at 0x40%04X: callee%d(int) (callees.cpp:%d)" % (callee, callee, callee))
+    wideLines.append("==1==    by 0x400100: main (main.cpp:10)")
+    wideLines.append("==1== ")
+wideErrors, wideUnknowns, widePid = ErrorParser().parse(wideLines)
+wideTree = SharedStackError(wideErrors, 0, Stack.FROM_BOTTOM)
+assert len(wideTree.children) == 1, "main was split."
+mainNode = wideTree.children[0]
+assert len(mainNode.children) == numCallees, "Wrong number of callees of main."
+assert [child.getLocation().method for child in mainNode.children[:3]] == ["callee2", "callee5", "callee8"], "Callees not ordered by reports, then appearance."
+checkChildren(wideTree)
+
+## Inserting into the wide node finds the callee without comparing the error to every sibling.
+lastCallee = ErrorParser().parse(wideLines[:1] + wideLines[-4:])[0][0]
+frameComparisons = [0]
+frameEquals = StackFrame.__eq__
+def countingEquals(frame, other):
+  frameComparisons[0] += 1
+  return frameEquals(frame, other)
+mainNode.findChild(wideErrors[0]) # Index the children before counting.
+StackFrame.__eq__ = countingEquals
+try:
+  changedNodes = wideTree.insert(lastCallee)
+finally:
+  StackFrame.__eq__ = frameEquals
+assert changedNodes[-1].errors[-1] is lastCallee and len(changedNodes[-1].errors) == 4, "Inserted into the wrong callee."
+assert frameComparisons[0] < 10, "Compared the error to the siblings of the node it goes to: " + str(frameComparisons[0])
+checkChildren(wideTree)
+
+
+## Trees built from the same list don't share it, so inserting into one leaves
+## the other, and the list, as they were.
+sharedList = errors[:]
+bottomTree = SharedStackError(sharedList, 0, Stack.FROM_BOTTOM)
+topTree = SharedStackError(sharedList, 0, Stack.FROM_TOP)
+bottomTree.insert(errors[0])
+assert len(sharedList) == len(errors), "Inserting changed the list the tree was built from."
+assert len(topTree.errors) == len(errors), "Inserting into one tree changed another."
+
+
+## Call stacks deeper than the recursion limit, as from a recursive parser run
+## with --num-callers=500 or more.
+depth = 1500
+deepLines = ["==1== Memcheck, a memory error detector"]
+for branch in range(3):
+  deepLines.append("==1== Invalid read of size 4")
+  deepLines.append("==1==    at 0x500000: readToken() (lexer.cpp:%d)" % (10 + branch))
+  for level in range(depth):
+    deepLines.append("==1==    by 0x40%04X: parseExpression() (parser.cpp:%d)" % (level, 100 + level % 2))
+  deepLines.append("==1==    by 0x400100: main (main.cpp:10)")
+  deepLines.append("==1== ")
+deepErrors, deepUnknowns, deepPid = ErrorParser().parse(deepLines)
+assert len(deepErrors) == 3 and deepErrors[0].errorStack.getNumFrames() == depth + 2, "Did not parse the deep errors."
+assert depth > sys.getrecursionlimit(), "The call stacks are not deep enough to test recursion."
+
+for direction in [Stack.FROM_BOTTOM, Stack.FROM_TOP]:
+  deepTree = SharedStackError(deepErrors, 0, direction)
+  node = deepTree
+  numNodes = 1
+  while len(node.children) == 1:
+    node = node.children[0]
+    numNodes += 1
+  if direction == Stack.FROM_BOTTOM:
+    assert numNodes == depth + 2 and len(node.children) == 3, "Wrong shape of the deep tree from the bottom."
+  else:
+    assert numNodes == 1 and len(node.children) == 3, "Wrong shape of the deep tree from the top."
+  assert deepTree.numOccurrences == 3, "Wrong number of reports in the deep tree."
+
+  stdout = sys.stdout
+  sys.stdout = StringIO.StringIO()
+  try:
+    deepTree.printTree()
+    printedLines = sys.stdout.getvalue().splitlines()
+  finally:
+    sys.stdout = stdout
+  assert len([line for line in printedLines if "Invalid read" in line]) == 3, "Did not print every error of the deep tree."
+  assert max([len(line) - len(line.lstrip()) for line in printedLines]) == depth + 3, "Did not print the deepest frames."
+
+  growingTree = SharedStackError([], 0, direction)
+  for error in deepErrors:
+    changedNodes = growingTree.insert(error)
+  assert changedNodes == [growingTree], "Inserting went below nodes that have not been asked for their children."
+  pending = [(growingTree, deepTree)]
+  while len(pending) > 0:
+    grown, built = pending.pop()
+    assert grown.getLocation() == built.getLocation() and grown.errors == built.errors, "Inserting deep errors did not give the same tree as building it."
+    assert len(grown.children) == len(built.children), "Inserting deep errors gave other branches."
+    pending.extend(zip(grown.children, built.children))
+
+
+## Children are only created when they are asked for, and the counts of a node
+## are known before that.
+lazyTree = SharedStackError(errors, 0, Stack.FROM_BOTTOM)
+assert not lazyTree.hasChildNodes(), "Children were created before they were asked for."
+assert lazyTree.numOccurrences == len(errors) and lazyTree.leakedBytes == 160, "Counts not known before the children."
+firstChild = lazyTree.children[0]
+assert lazyTree.hasChildNodes() and not firstChild.hasChildNodes(), "Asking for children created more than one level."
+assert lazyTree.children is lazyTree.children, "Children were created again."
+assert firstChild.numOccurrences == sum([error.count for error in firstChild.errors]), "Wrong counts of a new child."
+
+## Errors inserted above nodes that were never asked for their children show up when they are.
+lazyTree = SharedStackError([], 0, Stack.FROM_TOP)
+for error in errors:
+  assert lazyTree.insert(error) == [lazyTree], "Inserting created nodes nobody asked for."
+assert describeTree(lazyTree) == describeTree(SharedStackError(errors, 0, Stack.FROM_TOP)), "Lazily created tree differs from the built one."
+lazyTree = SharedStackError(errors, 0, Stack.FROM_TOP)
+path = lazyTree.addOccurrences(errors[0], 2)
+assert path == [lazyTree] and lazyTree.numOccurrences == len(errors) + 2, "Added occurrences below nodes nobody asked for."
+
+
+## Inserting and removing errors keeps the children of every created node
+## ordered by number of reports, and removing an error undoes inserting it.
+def checkCountOrder(errorTree):
+  pending = [errorTree]
+  while len(pending) > 0:
+    node = pending.pop()
+    if not node.hasChildNodes():
+      continue
+    numReports = [child.numOccurrences for child in node.children]
+    assert numReports == sorted(numReports, reverse=True), "Children not ordered by number of reports at " + str(node.getLocation())
+    pending.extend(node.children)
+
+## The errors that end at a node, the number of reports of each error kind and
+## the nearest source frame are kept up to date at every created node.
+def checkNodeData(errorTree):
+  pending = [errorTree]
+  while len(pending) > 0:
+    node = pending.pop()
+    location = str(node.getLocation())
+    assert node.getEndingErrors() == [error for error in node.errors if error.errorStack.getNumFrames() == node.stackFramesShared], "Wrong ending errors at " + location
+    kindCounts = {}
+    for error in node.errors:
+      kindCounts[error.errorKind] = kindCounts.get(error.errorKind, 0) + error.count
+    assert node.kindCounts == kindCounts, "Wrong error kinds at " + location
+    sourceFrame = node.getLocation()
+    for index in range(node.stackFramesShared - 1, -1, -1):
+      if node.errors[0].getStackFrame(index, node.direction).fileName is not None:
+        sourceFrame = node.errors[0].getStackFrame(index, node.direction)
+        break
+    assert node.getNearestSourceLocation() == sourceFrame or node.stackFramesShared == 0, "Wrong nearest source frame at " + location
+    if node.hasChildNodes():
+      pending.extend(node.children)
+
+for direction in [Stack.FROM_BOTTOM, Stack.FROM_TOP]:
+  growingTree = SharedStackError(errors[:len(errors) // 2], 0, direction)
+  growingTree.createTree()
+  for error in errors[len(errors) // 2:]:
+    growingTree.insert(error)
+    checkCountOrder(growingTree)
+    checkNodeData(growingTree)
+  growingTree.addOccurrences(errors[-1], len(errors))
+  checkCountOrder(growingTree)
+  assert findErrorNodes(growingTree, errors[-1])[1] is growingTree.children[0], "Added occurrences did not move the branch forward."
+  growingTree.addOccurrences(errors[-1], -len(errors))
+
+  completeTree = SharedStackError(errors, 0, direction)
+  completeTree.createTree()
+  remaining = errors[:]
+  for error in errors[::2][::-1] + errors[1::2]:
+    pathBefore = findErrorNodes(completeTree, error)
+    changedNodes = completeTree.remove(error)
+    remaining.remove(error)
+    checkCountOrder(completeTree)
+    assert changedNodes[0] is completeTree and changedNodes == pathBefore[:len(changedNodes)], "Did not report the nodes along the error's call stack."
+    for parent, child in zip(changedNodes, changedNodes[1:-1]):
+      assert child in parent.children and error not in child.errors, "Error left in a node along its call stack."
+    if len(changedNodes[-1].errors) == 0:
+      assert changedNodes[-1] not in changedNodes[-2].children, "Empty branch was not removed."
+    else:
+      assert changedNodes == pathBefore, "Did not remove the error from every node it passes through."
+    assert completeTree.numOccurrences == sum([remainingError.count for remainingError in remaining]), "Wrong number of reports after removing."
+    assert describeTree(completeTree) == describeTree(SharedStackError(remaining, 0, direction)), "Removing errors did not give the same tree as building it."
+    checkLeakTotals(completeTree)
+    checkNodeData(completeTree)
+  assert completeTree.children == [] and completeTree.numOccurrences == 0, "Removing every error left nodes in the tree."
+
+  ## Removing an error that isn't in the tree changes nothing.
+  try:
+    completeTree.remove(errors[0])
+    assert False, "Removed an error that isn't in the tree."
+  except ValueError:
+    pass
+  assert completeTree.errors == [] and completeTree.numOccurrences == 0, "Removing a missing error changed the tree."
+  assert completeTree.kindCounts == {} and completeTree.getEndingErrors() == [], "Removing every error left kinds or ending errors."
@@ -0,0 +1,70 @@
+"""
+Tests for Stack and StackFrame.
+
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+
+import pickle
+import sys
+sys.path.append("../../source")
+
+from errors.Stack import StackFrame
+from errors.Stack import StackFrameTable
+
+
+topLine = "==7420==    at 0x400A5F: setArray(double*) (errorProducingApplication.cpp:54)"
+callerLine = "==7420==    by 0x400A5F: setArray(double*) (errorProducingApplication.cpp:54)"
+movedLine = "==7421==    by 0x500A5F: setArray(double*) (errorProducingApplication.cpp:54)"
+otherLine = "==7420==    by 0x400C7C: main (errorProducingApplication.cpp:89)"
+libraryLine = "==7420==    by 0x4EBAFAF: ??? (in /usr/lib/x86_64-linux-gnu/libstdc++.so.6.0.19)"
+
+
+table = StackFrameTable()
+
+## The same frame line is parsed once and shared, whether it is an 'at' or a 'by' line.
+top = table.intern(topLine)
+caller = table.intern(callerLine)
+assert top is caller, "The same stack frame line was not interned to the same StackFrame."
+assert len(table) == 1, "The intern table did not key the frame on the text after the address."
+
+## A frame at another address is a different object with the same id.
+moved = table.intern(movedLine)
+assert moved is not top, "Frames with different addresses were merged."
+assert moved.address == "0x500A5F", "The interned frame did not keep its own address."
+assert moved.id == top.id, "Frames for the same method were given different ids."
+assert moved == top and hash(moved) == hash(top), "Frames for the same method did not compare equal."
+
+other = table.intern(otherLine)
+assert other.id != top.id and other != top, "Frames for different methods compared equal."
+
+
+## Interned frames are parsed exactly like frames created directly from the line.
+for line in [topLine, callerLine, movedLine, otherLine, libraryLine]:
+  interned = table.intern(line)
+  direct = StackFrame(line)
+  assert interned.getContent() == direct.getContent(), "Interned frame differs from parsed frame for '" + line + "'."
+  assert interned.address == direct.address and interned.modifier == direct.modifier, "Interned frame got a different address or modifier for '" + line + "'."
+  assert interned == direct and direct == interned, "Interned frame isn't equal to the parsed frame for '" + line + "'."
+  assert hash(interned) == hash(direct), "Interned frame hashes differently from the parsed frame for '" + line + "'."
+
+
+## Frames interned after a clear get new ids.
+clearedTable = StackFrameTable()
+before = clearedTable.intern("==1==    at 0x1: foo (a.c:1)")
+clearedTable.clear()
+after = clearedTable.intern("==1==    by 0x2: bar (b.c:2)")
+assert after.id != before.id and after != before, "A frame interned after clear reused an id."
+
+
+## Unpickling an interned frame, as done when errors are sent from a worker
+## process, interns it again.
+from errors.Stack import stackFrames
+shared = stackFrames.intern(topLine)
+for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+  assert pickle.loads(pickle.dumps(shared, protocol)) is shared, "Unpickled frame was not interned."
+
+leaf = StackFrame("")
+leaf.method = "<Below main>"
+assert pickle.loads(pickle.dumps(leaf, 2)).method == "<Below main>", "Frames that aren't interned could not be pickled."
@@ -0,0 +1,77 @@
+"""
+Unit tests for ErrorCollapser.
+
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+
+import sys
+sys.path.append("../../source")
+
+from errors.SharedStackError import SharedStackError
+from errors.Stack import Stack
+from operations.ErrorCollapser import ErrorCollapser
+from operations.ErrorParser import ErrorParser
+from operations.Profiler import countNodes
+
+
+valgrindLogFileName = "../valgrind.errors"
+try:
+  with open(valgrindLogFileName, "r") as valgrindLogFile:
+    lines = valgrindLogFile.read().splitlines()
+except:
+  sys.exit("Could not read Valgrind log file '" + valgrindLogFileName + "'.")
+
+errors, unknowns, pid = ErrorParser().parse(lines)
+collapser = ErrorCollapser()
+distinctErrors = collapser.collapse(errors)
+assert len(collapser) == len(distinctErrors), "Collapser does not know all distinct errors."
+assert sum([error.count for error in distinctErrors]) == len(errors), "Collapsing lost or added reports."
+assert all([error in errors for error in distinctErrors]), "Collapsed errors are not the parsed errors."
+assert [errors.index(error) for error in distinctErrors] == sorted([errors.index(error) for error in distinctErrors]), "Collapsing changed the order of the errors."
+for error in distinctErrors:
+  duplicates = [other for other in errors if other.getDuplicateKey() == error.getDuplicateKey()]
+  assert duplicates[0] is error, "The first of identical errors was not kept."
+  assert error.count == len(duplicates), "Wrong count for '" + str(error) + "'."
+
+
+## The same errors reported again, at other addresses, are collapsed into the
+## first reports.
+body = lines[5:]
+repeatedLines = lines + [line.replace("0x", "0x1") for line in body] + [line.replace("0x", "0x2") for line in body]
+repeatedErrors, repeatedUnknowns, repeatedPid = ErrorParser().parse(repeatedLines)
+assert len(repeatedErrors) == 3 * len(errors), "Did not parse all repeated errors."
+assert repeatedErrors[0].errorStack.getTop().address != repeatedErrors[len(errors)].errorStack.getTop().address, "Repeated errors have the same addresses."
+
+collapsedErrors = ErrorCollapser().collapse(repeatedErrors)
+assert [error.getDuplicateKey() for error in collapsedErrors] == [error.getDuplicateKey() for error in distinctErrors], "Repeated errors were not collapsed."
+assert all([error in repeatedErrors[:len(errors)] for error in collapsedErrors]), "Repeated errors did not collapse into the first reports."
+assert [error.count for error in collapsedErrors] == [3 * error.count for error in distinctErrors], "Repetitions were not counted."
+
+
+## Errors of different processes are not collapsed.
+otherProcessLines = lines + [line.replace("==7420==", "==7421==") for line in body]
+otherProcessErrors, otherUnknowns, otherPid = ErrorParser().parse(otherProcessLines)
+collapsedErrors = ErrorCollapser().collapse(otherProcessErrors)
+assert len(collapsedErrors) == 2 * len(distinctErrors), "Errors of different processes were collapsed."
+
+
+## Error trees count reports, not errors.
+for direction in [Stack.FROM_BOTTOM, Stack.FROM_TOP]:
+  errorTree = SharedStackError(distinctErrors, 0, direction)
+  assert len(errorTree.errors) == len(distinctErrors), "Tree contains collapsed repetitions."
+  assert errorTree.numOccurrences == len(errors), "Tree root does not count all reports."
+  for child in errorTree.children:
+    assert child.numOccurrences == sum([error.count for error in child.errors]), "Child does not count the reports of its errors."
+  assert [child.numOccurrences for child in errorTree.children] == sorted([child.numOccurrences for child in errorTree.children], reverse=True), "Children are not sorted by number of reports."
+
+  ## More reports of an error already in the tree update the counts along its
+  ## path. Only nodes that have been created are updated, so create them all.
+  countNodes(errorTree)
+  error = distinctErrors[0]
+  before = errorTree.numOccurrences
+  changedNodes = errorTree.addOccurrences(error, 5)
+  assert changedNodes[0] is errorTree and errorTree.numOccurrences == before + 5, "Root count was not updated."
+  assert all([error in node.errors for node in changedNodes]), "Updated a node the error does not pass through."
+  assert len(changedNodes) == error.errorStack.getNumFrames() + 1, "Did not update every node along the error's call stack."
@@ -43,9 +43,70 @@ if "--verbose" in sys.argv:
     print("<"+str(unknown)+">")
 
 
-assert len(errors) == 27, "Did not get the expected number of errors."
-assert (len(unknowns)) == 19, "Did not get the expected number of unknowns."
-
+assert len(errors) == 29, "Did not get the expected number of errors."
+assert (len(unknowns)) == 11, "Did not get the expected number of unknowns."
+for error in errors:
+  assert error.errorKind != None, "Error '" + str(error) + "' was not given an error kind."
+  assert error.pid == "7420", "Error '" + str(error) + "' was not given the process id of its Valgrind line."
+assert id == "7420", "Did not get the process id of the first Valgrind line."
+
+## The parser counts the lines it is fed, and the Valgrind lines among them.
+assert parser.numLines == len(lines), "Did not count the lines fed to the parser."
+assert parser.numValgrindLines == len([line for line in lines if line.startswith("==")]), "Did not count the Valgrind lines."
+
+
+
+## Parsing straight from the file object, one line at a time, must produce the
+## same errors as parsing the fully read line list.
+streamParser = ErrorParser()
+with open(valgrindLogFileName, "r") as valgrindLogFile:
+  streamedErrors = list(streamParser.parseStream(valgrindLogFile))
+
+assert len(streamedErrors) == len(errors), "Streaming parse did not find the same number of errors."
+for streamed, listed in zip(streamedErrors, errors):
+  assert streamed.info() == listed.info(), "Streaming parse produced a different error: '" + str(streamed) + "'."
+assert streamParser.unknownErrors == unknowns, "Streaming parse did not find the same unknowns."
+assert streamParser.id == id, "Streaming parse did not find the same process id."
+
+## Errors are yielded before the end of the input has been reached.
+linesRead = [0]
+def countingLines():
+  for line in lines:
+    linesRead[0] += 1
+    yield line
+
+firstError = next(ErrorParser().parseStream(countingLines()))
+assert linesRead[0] < len(lines), "The first error wasn't available until the entire log had been read."
+
+
+
+## Lines from several processes may be interleaved, even within a call stack.
+## Every process must be parsed as if its lines were alone in the log.
+childLines = [line.replace("==7420==", "==7421==") for line in lines]
+mixedLines = []
+for parentLine, childLine in zip(lines, childLines):
+  mixedLines.append(parentLine)
+  mixedLines.append(childLine)
+mixedErrors, mixedUnknowns, mixedId = ErrorParser().parse(mixedLines)
+
+assert mixedId == "7420", "Did not get the process id of the first Valgrind line in the interleaved log."
+assert len(mixedErrors) == 2 * len(errors), "Did not get the errors of both processes in the interleaved log."
+assert len(mixedUnknowns) == 2 * len(unknowns), "Did not get the unknowns of both processes in the interleaved log."
+
+processes = ErrorParser.groupByProcess(mixedErrors)
+assert [pid for pid, processErrors in processes] == ["7420", "7421"], "Errors were not grouped by process id in order of appearance."
+for pid, processErrors in processes:
+  assert len(processErrors) == len(errors), "Process " + pid + " did not get the expected number of errors."
+  for mixed, single in zip(processErrors, errors):
+    assert mixed.info() == single.info(), "Lines from another process ended up in '" + str(mixed) + "'."
+
+## An error without a call stack stops the parsing of its own process only.
+brokenLines = list(mixedLines)
+brokenLines.insert(len(brokenLines) // 2, "==7421== Invalid read of size 4")
+brokenErrors, brokenUnknowns, brokenId = ErrorParser().parse(brokenLines)
+brokenProcesses = dict(ErrorParser.groupByProcess(brokenErrors))
+assert len(brokenProcesses["7420"]) == len(errors), "A broken error in one process stopped the parsing of another."
+assert len(brokenProcesses["7421"]) < len(errors), "A broken error did not stop the parsing of its own process."
 
 
 if "--printLog" in sys.argv:
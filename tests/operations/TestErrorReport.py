@@ -0,0 +1,129 @@
+"""
+Unit tests for ErrorReport.
+
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+
+import json
+import sys
+import StringIO
+sys.path.append("../../source")
+
+from errors.SharedStackError import SharedStackError
+from errors.Stack import Stack
+from operations.ErrorCollapser import ErrorCollapser
+from operations.ErrorParser import ErrorParser
+from operations.ErrorReport import ErrorReport
+
+
+valgrindLogFileName = "../valgrind.errors"
+try:
+  with open(valgrindLogFileName, "r") as valgrindLogFile:
+    lines = valgrindLogFile.read().splitlines()
+except:
+  sys.exit("Could not read Valgrind log file '" + valgrindLogFileName + "'.")
+
+errors, unknowns, pid = ErrorParser().parse(lines)
+distinctErrors = ErrorCollapser().collapse(errors)
+tree = SharedStackError(distinctErrors, 0, Stack.FROM_BOTTOM)
+report = ErrorReport([(pid, tree)], unknowns + ["Some unknown line"])
+
+
+## The summary counts errors, reports, leaks and error kinds.
+results = report.getResults()
+assert len(results["processes"]) == 1, "Wrong number of processes."
+process = results["processes"][0]
+assert process["pid"] == pid, "Wrong process id."
+assert process["errors"] == len(distinctErrors), "Wrong number of errors."
+assert process["occurrences"] == len(errors), "Wrong number of reports."
+assert process["leakedBytes"] == 160, "Wrong number of leaked bytes."
+assert process["leakedBlocks"] == 2, "Wrong number of leaked blocks."
+assert sum(process["kinds"].values()) == len(errors), "The error kinds don't add up to the reports."
+for error in errors:
+  assert error.errorKind in process["kinds"], "Error kind '" + error.errorKind + "' is missing."
+assert results["unknowns"][-1] == "Some unknown line", "Unknown lines are missing."
+
+
+## Every error ends at exactly one node of the tree, which is a flat list of
+## nodes that come after their parent.
+nodes = process["tree"]
+numEndingErrors = 0
+numLeaks = 0
+childOccurrences = [0] * len(nodes)
+for index, node in enumerate(nodes):
+  assert node["id"] == index, "Node ids are not their positions."
+  assert (node["parent"] is None) == (index == 0), "Only the root has no parent."
+  assert node["parent"] is None or node["parent"] < index, "A node comes before its parent."
+  numEndingErrors += sum([error["count"] for error in node["endingErrors"]])
+  numLeaks += len([error for error in node["endingErrors"] if error["leak"] is not None])
+  assert sum(node["kinds"].values()) == node["occurrences"], "The error kinds of a node don't add up to its reports."
+  if node["parent"] is not None:
+    childOccurrences[node["parent"]] += node["occurrences"]
+for node in nodes:
+  assert node["occurrences"] >= childOccurrences[node["id"]], "A node has fewer reports than its children."
+assert numEndingErrors == len(errors), "Not every error ends at a node."
+assert numLeaks == 2, "Wrong number of leaks."
+assert nodes[0]["occurrences"] == len(errors), "The root doesn't hold every report."
+assert len(nodes) > 1, "The tree has no children."
+
+## Nodes are listed depth first in the order of the tree.
+expectedLocations = []
+pending = [tree]
+while len(pending) > 0:
+  node = pending.pop()
+  expectedLocations.append(str(node.getLocation()))
+  pending.extend(reversed(node.children))
+assert [node["location"] for node in nodes] == expectedLocations, "The nodes are not in tree order."
+
+
+## The JSON output can be read back, and is written where asked to.
+jsonOutput = StringIO.StringIO()
+report.write(ErrorReport.JSON, jsonOutput)
+jsonText = jsonOutput.getvalue()
+textOutput = StringIO.StringIO()
+report.write(ErrorReport.TEXT, textOutput)
+text = textOutput.getvalue()
+assert json.loads(jsonText) == json.loads(json.dumps(results)), "Wrong JSON output."
+
+stdout = sys.stdout
+sys.stdout = StringIO.StringIO()
+try:
+  report.write(ErrorReport.JSON)
+  defaultText = sys.stdout.getvalue()
+finally:
+  sys.stdout = stdout
+assert defaultText == jsonText, "The report was not written to standard out by default."
+
+
+## The text output has the summary and the tree.
+textLines = text.splitlines()
+assert textLines[0] == "Process " + pid + ": " + str(len(distinctErrors)) + " errors reported " + str(len(errors)) + " times, 160 bytes leaked in 2 blocks.", "Wrong summary line."
+assert "  MemoryLoss: 2" in textLines, "The error kinds are missing."
+assert any([line.strip() == str(distinctErrors[0]) for line in textLines]), "The tree is missing."
+assert textLines[-1] == "  Some unknown line", "Unknown lines are missing."
+
+
+## Call stacks deeper than the recursion limit of the JSON encoder and decoder.
+deepLines = ["==1== Memcheck, a memory error detector"]
+for branch in range(3):
+  deepLines.append("==1== Invalid read of size 4")
+  deepLines.append("==1==    at 0x500000: readToken() (lexer.cpp:%d)" % (10 + branch))
+  for level in range(2000):
+    deepLines.append("==1==    by 0x40%04X: parseExpression() (parser.cpp:%d)" % (level, 100 + level % 2))
+  deepLines.append("==1==    by 0x400100: main (main.cpp:10)")
+  deepLines.append("==1== ")
+deepErrors, deepUnknowns, deepPid = ErrorParser().parse(deepLines)
+deepTree = SharedStackError(deepErrors, 0, Stack.FROM_BOTTOM)
+deepTree.createTree()
+deepOutput = StringIO.StringIO()
+ErrorReport([(deepPid, deepTree)], deepUnknowns).write(ErrorReport.JSON, deepOutput)
+deepNodes = json.loads(deepOutput.getvalue())["processes"][0]["tree"]
+assert len(deepNodes) == 2002 + 3, "Wrong number of nodes in the deep tree."
+assert max([node["parent"] for node in deepNodes[1:]]) == 2001, "The deep tree lost its depth."
+assert sum([len(node["endingErrors"]) for node in deepNodes]) == 3, "Not every deep error ends at a node."
+
+
+## A report never needs the GUI.
+assert "wx" not in sys.modules, "The report imported wx."
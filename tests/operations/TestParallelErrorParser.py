@@ -0,0 +1,96 @@
+"""
+Unit tests for ParallelErrorParser.
+
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+
+import os
+import sys
+import tempfile
+sys.path.append("../../source")
+
+from disk.MappedLog import MappedLog
+from operations.ErrorParser import ErrorParser
+from operations.ParallelErrorParser import ParallelErrorParser
+
+
+valgrindLogFileName = "../valgrind.errors"
+try:
+  with open(valgrindLogFileName, "r") as valgrindLogFile:
+    lines = valgrindLogFile.read().splitlines()
+except:
+  sys.exit("Could not read Valgrind log file '" + valgrindLogFileName + "'.")
+
+
+def writeLog(logLines):
+  handle, path = tempfile.mkstemp()
+  os.write(handle, ("\n".join(logLines) + "\n").encode("utf-8"))
+  os.close(handle)
+  return path
+
+
+def assertSameResult(path, description):
+  """Parse the log at 'path' both in parallel and sequentially and compare."""
+  log = MappedLog(path)
+  expectedErrors, expectedUnknowns, expectedId = ErrorParser().parse(log)
+
+  parallelParser = ParallelErrorParser(4, 1000)
+  assert len(parallelParser.findChunkBoundaries(log)) > 5, "The " + description + " log was not split into chunks."
+  errors, unknowns, id = parallelParser.parse(log)
+  log.close()
+
+  assert len(errors) == len(expectedErrors), "Parallel parse of the " + description + " log found " + str(len(errors)) + " errors, expected " + str(len(expectedErrors)) + "."
+  for error, expected in zip(errors, expectedErrors):
+    assert error.info() == expected.info(), "Parallel parse of the " + description + " log produced a different error: '" + str(error) + "'."
+    assert error.logSpan == expected.logSpan, "Parallel parse of the " + description + " log gave '" + str(error) + "' a different span."
+  assert unknowns == expectedUnknowns, "Parallel parse of the " + description + " log did not find the same unknowns."
+  assert id == expectedId, "Parallel parse of the " + description + " log did not find the same process id."
+  return errors
+
+
+## A long log with program output between the Valgrind lines.
+interleaved = []
+for repetition in range(40):
+  for line in lines:
+    interleaved.append(line)
+    interleaved.append("Program output " + str(repetition))
+path = writeLog(interleaved)
+try:
+  errors = assertSameResult(path, "interleaved")
+  assert len(errors) == 40 * 29, "Did not find all errors in the interleaved log."
+finally:
+  os.remove(path)
+
+
+## An error without a call stack stops the parser. Everything after it must be
+## ignored by the parallel parser as well.
+broken = lines * 40
+broken.insert(len(broken) // 2, "==7420== Invalid read of size 4")
+path = writeLog(broken)
+try:
+  errors = assertSameResult(path, "broken")
+  assert len(errors) < 20 * 29 + 29, "The parser did not stop at the broken error."
+finally:
+  os.remove(path)
+
+
+## Several processes writing to the same log, with their lines interleaved
+## within errors. Chunks start in the middle of the errors of some processes.
+processes = []
+for repetition in range(10):
+  processes.append([line.replace("==7420==", "==" + str(7420 + repetition) + "==") for line in lines * 4])
+## Process i writes i+1 lines at a time.
+mixed = []
+for index in range(0, len(processes[0]) * len(processes), len(processes)):
+  for burst, processLines in enumerate(processes):
+    start = index // len(processes) * (burst + 1)
+    mixed.extend(processLines[start:start + burst + 1])
+mixed.insert(len(mixed) // 3, "==7423== Invalid read of size 4")
+path = writeLog(mixed)
+try:
+  errors = assertSameResult(path, "multi process")
+  assert len(set([error.pid for error in errors])) == 10, "Did not find errors from all processes."
+finally:
+  os.remove(path)
@@ -0,0 +1,114 @@
+"""
+Unit tests for ParallelTreeBuilder.
+
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+
+import sys
+sys.path.append("../../source")
+
+from errors.SharedStackError import SharedStackError
+from errors.Stack import Stack
+from errors.Stack import StackFrame
+from operations.ErrorParser import ErrorParser
+from operations.ParallelTreeBuilder import ParallelTreeBuilder
+from operations.ParallelTreeBuilder import getFrameKey
+
+
+valgrindLogFileName = "../valgrind.errors"
+try:
+  with open(valgrindLogFileName, "r") as valgrindLogFile:
+    lines = valgrindLogFile.read().splitlines()
+except:
+  sys.exit("Could not read Valgrind log file '" + valgrindLogFileName + "'.")
+
+
+def assertSameTree(tree, expected, description):
+  """Compare every node of two trees, without recursion."""
+  pending = [(tree, expected)]
+  while len(pending) > 0:
+    node, expectedNode = pending.pop()
+    location = description + " tree at " + str(expectedNode.getLocation())
+    assert node.hasChildNodes(), "Node not created in the " + location + "."
+    assert node.stackFramesShared == expectedNode.stackFramesShared, "Wrong depth in the " + location + "."
+    assert node.getLocation() == expectedNode.getLocation(), "Wrong location in the " + location + "."
+    assert map(id, node.errors) == map(id, expectedNode.errors), "Wrong errors in the " + location + "."
+    assert node.numOccurrences == expectedNode.numOccurrences, "Wrong number of reports in the " + location + "."
+    assert (node.leakedBytes, node.leakedBlocks) == (expectedNode.leakedBytes, expectedNode.leakedBlocks), "Wrong leaks in the " + location + "."
+    assert node.kindCounts == expectedNode.kindCounts, "Wrong error kinds in the " + location + "."
+    assert map(id, node.endingErrors) == map(id, expectedNode.endingErrors), "Wrong ending errors in the " + location + "."
+    assert node.sourceFrame is expectedNode.sourceFrame, "Wrong source frame in the " + location + "."
+    assert len(node.children) == len(expectedNode.children), "Wrong number of children in the " + location + "."
+    pending.extend(zip(node.children, expectedNode.children))
+
+
+def assertSameTrees(errors, builder, description):
+  """Build the trees of both directions in parallel and sequentially and compare."""
+  trees = [SharedStackError(errors, 0, Stack.FROM_BOTTOM), SharedStackError(errors, 0, Stack.FROM_TOP)]
+  builder.createTrees(trees)
+  for tree in trees:
+    expected = SharedStackError(errors, 0, tree.direction)
+    expected.createTree()
+    assertSameTree(tree, expected, description)
+
+
+## Branching call stacks of different depths, some ending where others go on.
+branchingLines = ["==1== Memcheck, a memory error detector"]
+for branch in range(600):
+  branchingLines.append("==1== Invalid read of size 4")
+  branchingLines.append("==1==    at 0x50%04X: leaf%d() (leaf.cpp:%d)" % (branch, branch % 7, branch % 7))
+  for level in range(branch % 11, 0, -1):
+    branchingLines.append("==1==    by 0x40%04X: level%d_%d() (levels.cpp:%d)" % (level, level, branch % 3, level))
+  if branch % 5 != 0:
+    branchingLines.append("==1==    by 0x400200: run (main.cpp:20)")
+  branchingLines.append("==1==    by 0x400100: main (main.cpp:10)")
+  branchingLines.append("==1== ")
+branchingErrors, branchingUnknowns, branchingPid = ErrorParser().parse(branchingLines)
+assert len(branchingErrors) == 600, "Did not parse the branching errors."
+
+## The subtrees are small enough to give each worker several, and no larger.
+builder = ParallelTreeBuilder(4)
+bottomTree = SharedStackError(branchingErrors, 0, Stack.FROM_BOTTOM)
+topTree = SharedStackError(branchingErrors, 0, Stack.FROM_TOP)
+subtrees = builder.findSubtrees([bottomTree, topTree])
+assert len(subtrees) >= 4, "The trees were not split into subtrees."
+for subtree in subtrees:
+  assert not subtree.hasChildNodes(), "A subtree sent to the workers was created here."
+  assert subtree.getNumErrors() <= 2 * 600 // (4 * 4), "A subtree is larger than a worker's share."
+assertSameTrees(branchingErrors, builder, "branching")
+assertSameTrees(branchingErrors, ParallelTreeBuilder(4, 1, 0), "unsplit")
+assertSameTrees(branchingErrors, ParallelTreeBuilder(4, 100), "fully split")
+assertSameTrees(branchingErrors, ParallelTreeBuilder(1), "sequential")
+
+## A single error, whose nodes are all created without the workers.
+assertSameTrees(branchingErrors[1:2], builder, "single error")
+
+
+## Leaks and repeated reports.
+errors, unknowns, pid = ErrorParser().parse(lines * 30)
+assertSameTrees(errors, ParallelTreeBuilder(4, 10, 1), "repeated")
+assertSameTrees(errors, ParallelTreeBuilder(2), "repeated split")
+
+
+## Call stacks deeper than the recursion limit.
+deepLines = ["==1== Memcheck, a memory error detector"]
+for branch in range(40):
+  deepLines.append("==1== Invalid read of size 4")
+  deepLines.append("==1==    at 0x500000: readToken() (lexer.cpp:%d)" % (10 + branch))
+  for level in range(1500):
+    deepLines.append("==1==    by 0x40%04X: parseExpression() (parser.cpp:%d)" % (level, 100 + level % 2))
+  deepLines.append("==1==    by 0x400100: main (main.cpp:10)")
+  deepLines.append("==1== ")
+deepErrors, deepUnknowns, deepPid = ErrorParser().parse(deepLines)
+assertSameTrees(deepErrors, ParallelTreeBuilder(4), "deep")
+
+
+## Frames that weren't interned are keyed like the interned frame they equal.
+frame = branchingErrors[0].errorStack.frames[0]
+copy = StackFrame("")
+copy.address, copy.method, copy.arguments, copy.modifier, copy.fileName, copy.lineNumber, copy.library = frame.getFields()
+assert copy == frame and getFrameKey(copy) == getFrameKey(frame), "A frame that wasn't interned got another key."
+copy.lineNumber = -1
+assert getFrameKey(copy) == copy.getContent(), "A frame unlike any interned frame was not keyed on its content."
@@ -0,0 +1,80 @@
+"""
+Unit tests for Profiler.
+
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+sys.path.append("../../source")
+
+from errors.SharedStackError import SharedStackError
+from errors.Stack import Stack
+from operations.ErrorParser import ErrorParser
+from operations.Profiler import Profiler
+from operations.Profiler import countNodes
+
+
+## Phases accumulate their runs, and counters their counts, in order of first use.
+profiler = Profiler()
+with profiler.phase("parse"):
+  pass
+with profiler.phase("build trees"):
+  pass
+with profiler.phase("parse"):
+  pass
+profiler.count("errors", 3)
+profiler.count("frames", 10)
+profiler.count("errors")
+
+results = profiler.getResults()
+assert [phase["name"] for phase in results["phases"]] == ["parse", "build trees"], "Phases were not recorded in order."
+assert [phase["runs"] for phase in results["phases"]] == [2, 1], "Phase runs were not accumulated."
+assert all([phase["seconds"] >= 0.0 for phase in results["phases"]]), "Got a negative phase time."
+assert results["counters"] == [{"name": "errors", "value": 4}, {"name": "frames", "value": 10}], "Counters were not accumulated."
+assert profiler.format()[1].startswith("parse"), "Phases were not formatted."
+
+## A phase that raises is still timed, and the exception is not swallowed.
+try:
+  with profiler.phase("failing"):
+    raise ValueError("Failed.")
+  assert False, "The exception of a phase was swallowed."
+except ValueError:
+  pass
+assert "failing" in profiler.phases, "A failing phase was not timed."
+
+
+## A disabled profiler records nothing.
+disabled = Profiler(False)
+with disabled.phase("parse"):
+  pass
+disabled.count("errors", 3)
+assert disabled.getResults() == {"phases": [], "counters": []}, "A disabled profiler recorded something."
+assert not disabled.write("-"), "A disabled profiler wrote results."
+
+
+## Results are written as JSON.
+directory = tempfile.mkdtemp()
+try:
+  profilePath = os.path.join(directory, "profile.json")
+  assert profiler.write(profilePath), "Could not write the profile."
+  with open(profilePath) as profileFile:
+    assert json.load(profileFile) == json.loads(json.dumps(profiler.getResults())), "Written profile differs."
+  assert not profiler.write(os.path.join(directory, "missing", "profile.json")), "Wrote a profile to a missing directory."
+finally:
+  shutil.rmtree(directory)
+
+
+## All nodes of a tree are counted.
+with open("../valgrind.errors", "r") as valgrindLogFile:
+  errors, unknowns, id = ErrorParser().parse(valgrindLogFile.read().splitlines())
+tree = SharedStackError(errors, 0, Stack.FROM_BOTTOM)
+def countRecursively(node):
+  return 1 + sum([countRecursively(child) for child in node.children])
+assert countNodes(tree) == countRecursively(tree), "Did not count all tree nodes."
+assert countNodes(SharedStackError([], 0, Stack.FROM_TOP)) == 1, "An empty tree is a single node."
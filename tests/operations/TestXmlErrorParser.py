@@ -0,0 +1,140 @@
+"""
+Unit tests for XmlErrorParser.
+
+Part of Hvergelmir, a tree based Valgrind output viewer - https://github.com/ibbles/Hvergelmir
+See LICENSE for licensing information.
+"""
+
+
+import sys
+from StringIO import StringIO
+sys.path.append("../../source")
+
+from errors.LeakInfo import LeakInfo
+from errors.LineMatching import ErrorKind
+from errors.Stack import Stack
+from operations.ErrorParser import ErrorParser
+from operations.XmlErrorParser import XmlErrorParser
+from operations.XmlErrorParser import splitFunction
+
+
+## The XML log is from the same run as the text log.
+valgrindXmlFileName = "../valgrind.xml"
+valgrindLogFileName = "../valgrind.errors"
+try:
+  with open(valgrindLogFileName, "r") as valgrindLogFile:
+    lines = valgrindLogFile.read().splitlines()
+  with open(valgrindXmlFileName, "r") as valgrindXmlFile:
+    xml = valgrindXmlFile.read()
+except:
+  sys.exit("Could not read Valgrind log files '" + valgrindLogFileName + "' and '" + valgrindXmlFileName + "'.")
+
+textErrors, textUnknowns, textId = ErrorParser().parse(lines)
+errors, unknowns, id = XmlErrorParser().parse(valgrindXmlFileName)
+
+assert errors != None, "Get None error list from parser."
+assert len(errors) == 29, "Did not get the expected number of errors."
+assert len(unknowns) == 0, "Did not expect any errors of unknown kinds."
+assert id == "7420", "Did not get the process id of the log."
+
+
+## The errors must be the same as when the text log is parsed. The text parser
+## keeps a trailing space on some method names, so that is not compared.
+def describeStack(stack):
+  if stack is None:
+    return []
+  return [(frame.fileLocation(), frame.fullMethod().strip()) for frame in stack.frames]
+
+for error, textError in zip(errors, textErrors):
+  assert error.errorType == textError.errorType, "Got '" + error.errorType + "', expected '" + textError.errorType + "'."
+  assert error.errorKind == textError.errorKind, "Error '" + str(error) + "' was given the wrong kind."
+  assert error.pid == "7420", "Error '" + str(error) + "' was not given the process id."
+  assert describeStack(error.errorStack) == describeStack(textError.errorStack), "Error '" + str(error) + "' got the wrong call stack."
+  assert error.sourceType == textError.sourceType, "Error '" + str(error) + "' got the wrong source."
+  assert describeStack(error.sourceStack) == describeStack(textError.sourceStack), "Error '" + str(error) + "' got the wrong source stack."
+  assert error.leak == textError.leak, "Error '" + str(error) + "' got the wrong leak sizes."
+
+assert [error.leak for error in textErrors if error.leak is not None] == [LeakInfo(80, 1, LeakInfo.DEFINITELY_LOST)] * 2, "Did not read the sizes of the leaks in the text log."
+
+## Frames are interned and compare equal across errors.
+assert errors[0].getStackFrame(0, Stack.FROM_TOP) is errors[1].getStackFrame(0, Stack.FROM_TOP), "Identical frames were not interned."
+
+
+## File objects work as well, and errors are yielded before the whole log has been read.
+class CountingFile(object):
+  def __init__(self, data):
+    self.file = StringIO(data)
+  def read(self, size=-1):
+    return self.file.read(size)
+
+countingFile = CountingFile(xml)
+firstError = next(XmlErrorParser().parseStream(countingFile))
+assert firstError.errorType == errors[0].errorType, "Parsing from a file object did not give the same first error."
+assert countingFile.file.tell() < len(xml), "The first error wasn't available until the entire log had been read."
+
+
+## A log that ends abruptly, e.g. because Valgrind was killed, gives the errors read so far.
+truncated = xml[:xml.index("<error>", len(xml) // 2)]
+truncatedErrors, truncatedUnknowns, truncatedId = XmlErrorParser().parse(StringIO(truncated))
+assert 0 < len(truncatedErrors) < len(errors), "Did not get the errors before the end of a truncated log."
+assert truncatedId == "7420", "Did not get the process id of a truncated log."
+
+
+## Errors of kinds that aren't known are reported as unknown.
+unknownKindLog = """<?xml version="1.0"?>
+<valgrindoutput>
+<pid>12</pid>
+<error>
+  <kind>InvalidJump</kind>
+  <what>Jump to the invalid address stated on the next line</what>
+  <stack><frame><ip>0x0</ip></frame></stack>
+</error>
+<error>
+  <kind>Leak_PossiblyLost</kind>
+  <xwhat><text>16 bytes in 1 blocks are possibly lost in loss record 1 of 1</text><leakedbytes>16</leakedbytes><leakedblocks>1</leakedblocks></xwhat>
+  <stack><frame><ip>0x4C2B800</ip><obj>/lib/libc.so</obj><fn>operator()(int) const</fn></frame></stack>
+</error>
+</valgrindoutput>
+"""
+errors, unknowns, id = XmlErrorParser().parse(StringIO(unknownKindLog))
+assert unknowns == ["Jump to the invalid address stated on the next line"], "Error of unknown kind was not reported."
+assert len(errors) == 1 and errors[0].errorKind == ErrorKind.MEMORY_LOSS, "Leak was not read."
+assert errors[0].leak == LeakInfo(16, 1, LeakInfo.POSSIBLY_LOST), "Leak sizes were not read."
+frame = errors[0].getStackFrame(0, Stack.FROM_TOP)
+assert (frame.method, frame.arguments, frame.modifier, frame.library) == ("operator()", "(int)", "const", "/lib/libc.so"), "Function name was not split correctly."
+
+assert XmlErrorParser().parse(StringIO("==12== Not XML")) == (None, None, None), "Text log was accepted as XML."
+
+
+## Errors without a description are described by their kind.
+noDescriptionLog = """<?xml version="1.0"?>
+<valgrindoutput>
+<pid>12</pid>
+<error>
+  <kind>InvalidRead</kind>
+  <stack><frame><ip>0x400100</ip><fn>main</fn></frame></stack>
+</error>
+<error>
+  <kind>Leak_DefinitelyLost</kind>
+  <xwhat><leakedbytes>32</leakedbytes><leakedblocks>2</leakedblocks></xwhat>
+  <stack><frame><ip>0x400200</ip><fn>malloc</fn></frame></stack>
+</error>
+</valgrindoutput>
+"""
+errors, unknowns, id = XmlErrorParser().parse(StringIO(noDescriptionLog))
+assert [error.errorType for error in errors] == ["InvalidRead", "Leak_DefinitelyLost"], "Errors without a description were not described by their kind."
+assert [error.errorKind for error in errors] == [ErrorKind.INVALID_READ, ErrorKind.MEMORY_LOSS], "Errors without a description got the wrong kind."
+assert errors[1].leak is not None and (errors[1].leak.bytes, errors[1].leak.blocks) == (32, 2), "The leak without a description was not read."
+assert str(errors[0]).startswith("InvalidRead @ ") and "InvalidRead" in errors[0].info(), "An error without a description can't be shown."
+
+
+assert splitFunction("main") == ("main", None, None)
+assert splitFunction("Foo::bar(std::pair<int, int>)") == ("Foo::bar", "(std::pair<int, int>)", None)
+assert splitFunction("(anonymous namespace)::run(int (*)(int)) volatile") == ("(anonymous namespace)::run", "(int (*)(int))", "volatile")
+
+
+## Detection of XML logs by their first bytes.
+from disk.FileReader import FileReader
+assert FileReader.isXmlLog(xml[:256]), "The XML log was not detected."
+assert FileReader.isXmlLog("\xef\xbb\xbf<?xml version=\"1.0\"?>"), "The XML log with a byte order mark was not detected."
+assert not FileReader.isXmlLog(lines[0]), "The text log was detected as XML."